@@ -0,0 +1,132 @@
+"""Aggregate log records online into fixed-width time bins, so that a run
+logs a few records per bin instead of one per packet."""
+
+# How each metric is aggregated over a bin:
+# - SUM: amounts (bits sent, packets lost, ...). Logs the total per bin.
+# - LEVEL: sampled values (window size, RTT, ...). Logs the time-weighted
+#   average value over the bin.
+# - DELTA: changes of a level (buffer occupancy). Logs changes such that
+#   their running total is the time-weighted average level over each bin.
+SUM, LEVEL, DELTA = 'sum', 'level', 'delta'
+
+AGGREGATION = {
+    'BUFF': DELTA,
+    'WINDOW': LEVEL,
+    'RTT': LEVEL,
+    'SSTHRESH': LEVEL,
+}  # Everything else is a SUM
+
+
+class Aggregator(object):
+    """
+    A logger that aggregates records into bins of bin_width seconds and
+    passes one record per bin and metric to another logger (e.g. a
+    BinaryLogger). Aggregates are logged at the start time of their bin,
+    when a record for a later bin arrives or the aggregator is closed.
+    Records of one component and metric stay in time order, but records of
+    different ones are interleaved differently than in a raw log.
+    """
+
+    def __init__(self, out, bin_width):
+        self.out = out  # Logger to write aggregates to
+        self.bin_width = bin_width
+        self.series = {}  # Map of (component, metric) -> _Series
+
+    @property
+    def file_name(self):
+        return self.out.file_name
+
+    def log(self, component, metric, t, value):
+        key = (component, metric)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _Series(
+                component, metric, AGGREGATION.get(metric, SUM))
+        series.add(self, t, value)
+
+    def close(self):
+        for series in self.series.values():
+            series.flush(self)
+        self.out.close()
+
+
+class _Series(object):
+    """Aggregation state of one component's metric."""
+
+    __slots__ = ('component', 'metric', 'how', 'bin', 'start', 'total',
+                 'level', 'last_t', 'emitted')
+
+    def __init__(self, component, metric, how):
+        self.component = component
+        self.metric = metric
+        self.how = how
+        self.bin = None  # Index of the current bin
+        self.start = None  # Start of the part of the bin covered so far
+        self.total = 0  # Sum, or integral of the level over the bin
+        self.level = 0  # Current level (LEVEL and DELTA)
+        self.last_t = None  # Time of the last record
+        self.emitted = 0  # Last logged average level (DELTA)
+
+    def add(self, aggregator, t, value):
+        b = int(t / aggregator.bin_width)
+        if self.how == SUM:
+            if b != self.bin:
+                if self.bin is not None:
+                    self.emit(aggregator, self.bin * aggregator.bin_width,
+                              self.total)
+                self.bin = b
+                self.total = 0
+            self.total += value
+            return
+
+        if self.bin is None:
+            self.bin = b
+            self.start = self.last_t = t
+        elif b != self.bin:
+            self.close_bin(aggregator, b)
+        self.total += self.level * (t - self.last_t)
+        self.last_t = t
+        if self.how == LEVEL:
+            self.level = value
+        else:
+            self.level += value
+
+    def close_bin(self, aggregator, b):
+        """Log the average of the current bin and move on to bin b."""
+        width = aggregator.bin_width
+        end = (self.bin + 1) * width
+        self.total += self.level * (end - self.last_t)
+        self.emit_level(aggregator, self.bin * width,
+                        self.total / (end - self.start))
+        if b > self.bin + 1:
+            # The level was constant in the bins in between.
+            self.emit_level(aggregator, end, self.level)
+        self.bin = b
+        self.start = self.last_t = b * width
+        self.total = 0
+
+    def flush(self, aggregator):
+        """Log the partial last bin, and the final level at the time of the
+        last record."""
+        if self.bin is None:
+            return
+        t = self.bin * aggregator.bin_width
+        if self.how == SUM:
+            self.emit(aggregator, t, self.total)
+        elif self.last_t > self.start:
+            average = self.total / (self.last_t - self.start)
+            self.emit_level(aggregator, t, average)
+            if self.level != average:
+                self.emit_level(aggregator, self.last_t, self.level)
+        else:
+            self.emit_level(aggregator, t, self.level)
+
+    def emit_level(self, aggregator, t, average):
+        if self.how == LEVEL:
+            self.emit(aggregator, t, average)
+        else:
+            self.emit(aggregator, t, average - self.emitted)
+            self.emitted = average
+
+    def emit(self, aggregator, t, value):
+        aggregator.out.log(self.component, self.metric, t, value)
@@ -0,0 +1,48 @@
+from aggregate import Aggregator
+
+
+class ListLogger(object):
+    def __init__(self):
+        self.records = []
+        self.closed = False
+
+    def log(self, component, metric, t, value):
+        self.records.append((component, metric, t, value))
+
+    def close(self):
+        self.closed = True
+
+
+def series(out, metric):
+    return [(t, value) for _, m, t, value in out.records if m == metric]
+
+
+out = ListLogger()
+agg = Aggregator(out, 1.0)
+
+# Sums: bins [0, 1) and [2, 3)
+for t, amount in [(0.1, 10), (0.9, 20), (2.5, 5)]:
+    agg.log('LINK|L1', 'SEND', t, amount)
+
+# Level: 4 on [0.5, 1), 2 on [1, 1.5), 6 from 1.5, last sample at 3.5
+for t, level in [(0.5, 4), (1.0, 2), (1.5, 6), (3.5, 6)]:
+    agg.log('FLOW|F1', 'WINDOW', t, level)
+
+# Buffer changes: 8 on [0, 0.5), empty until 2.5, then 4
+for t, delta in [(0.0, 8), (0.5, -8), (2.5, 4)]:
+    agg.log('LINK|L1', 'BUFF', t, delta)
+
+agg.close()
+assert out.closed
+
+assert series(out, 'SEND') == [(0.0, 30), (2.0, 5)]
+
+# Bins 0 and 1 are averaged, bin 2 is constant, bin 3 was only covered at 3.5
+assert series(out, 'WINDOW') == [(0.0, 4), (1.0, 4), (2.0, 6), (3.0, 6)]
+
+# Running totals are the average levels: 4 in bin 0, 0 in bin 1 (and 2
+# until the last change), then the final level 4 at the last change.
+buff = series(out, 'BUFF')
+assert [t for t, _ in buff] == [0.0, 1.0, 2.0, 2.5]
+totals = [sum(d for _, d in buff[:i + 1]) for i in range(len(buff))]
+assert totals == [4, 0, 0, 4]
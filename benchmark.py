@@ -0,0 +1,482 @@
+import argparse
+from contextlib import redirect_stdout
+from io import StringIO
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from congestion_control import StopAndWait
+from events import Event, EventManager
+from file_input import read_network
+from flow import Flow
+from host import Host
+from link import LINK_ENGINES
+from packet import Packet, PacketPool, DATA_PACKET_SIZE
+from routing import install_oracle_routes, ROUTING_MODES, RoutingProtocol
+from scheduler import SCHEDULERS
+
+
+def dumbbell(n_flows, rate=10e6, delay=10e-3, buffer_size=512e3,
+             amount=100e6):
+    """Network description (as read_network expects) with n_flows
+    sender/receiver host pairs on either side of a two-router bottleneck.
+    Access link delays are spread between delay and 2 * delay, so flows have
+    different RTTs."""
+    hosts, links, flows = [], [], []
+    for k in range(n_flows):
+        src, dst = 'S{}'.format(k), 'D{}'.format(k)
+        access_delay = delay * (1 + k / n_flows)
+        hosts += [{'id': src}, {'id': dst}]
+        links += [
+            {'id': 'LS{}'.format(k), 'end_a': src, 'end_b': 'R1',
+             'rate': rate, 'delay': access_delay,
+             'buffer_size': buffer_size},
+            {'id': 'LD{}'.format(k), 'end_a': 'R2', 'end_b': dst,
+             'rate': rate, 'delay': access_delay,
+             'buffer_size': buffer_size},
+        ]
+        flows.append({'id': 'F{}'.format(k), 'source': src,
+                      'destination': dst, 'amount': amount,
+                      'start_delay': 1.0 + k * 1e-3,
+                      'congestion_control': 'Reno'})
+    links.append({'id': 'LB', 'end_a': 'R1', 'end_b': 'R2',
+                  'rate': n_flows * rate, 'delay': delay,
+                  'buffer_size': n_flows * buffer_size})
+    return {'hosts': hosts, 'routers': [{'id': 'R1'}, {'id': 'R2'}],
+            'links': links, 'flows': flows}
+
+
+def fat_tree(k, rate=10e6, delay=1e-3, buffer_size=64e3):
+    """Network description of a k-ary fat tree: (k/2)^2 core routers, and k
+    pods of k/2 aggregation and k/2 edge routers, with a host on each edge
+    router."""
+    half = k // 2
+    routers, hosts, links = [], [], []
+
+    def link(a, b):
+        links.append({'id': 'L{}'.format(len(links)), 'end_a': a, 'end_b': b,
+                      'rate': rate, 'delay': delay,
+                      'buffer_size': buffer_size})
+
+    cores = ['C{}'.format(c) for c in range(half * half)]
+    routers += cores
+    for pod in range(k):
+        aggs = ['A{}_{}'.format(pod, a) for a in range(half)]
+        edges = ['E{}_{}'.format(pod, e) for e in range(half)]
+        routers += aggs + edges
+        for a, agg in enumerate(aggs):
+            for c in range(half):
+                link(agg, cores[a * half + c])
+            for edge in edges:
+                link(agg, edge)
+        for edge in edges:
+            hosts.append('H' + edge)
+            link(edge, 'H' + edge)
+    return {'hosts': [{'id': h} for h in hosts],
+            'routers': [{'id': r} for r in routers],
+            'links': links, 'flows': []}
+
+
+def ring(n, rate=10e6, delay=1e-3, buffer_size=64e3):
+    """Network description of n routers in a ring, with a host on each."""
+    links = []
+    for k in range(n):
+        links.append({'id': 'L{}'.format(k), 'end_a': 'R{}'.format(k),
+                      'end_b': 'R{}'.format((k + 1) % n), 'rate': rate,
+                      'delay': delay, 'buffer_size': buffer_size})
+        links.append({'id': 'LH{}'.format(k), 'end_a': 'R{}'.format(k),
+                      'end_b': 'H{}'.format(k), 'rate': rate,
+                      'delay': delay, 'buffer_size': buffer_size})
+    return {'hosts': [{'id': 'H{}'.format(k)} for k in range(n)],
+            'routers': [{'id': 'R{}'.format(k)} for k in range(n)],
+            'links': links, 'flows': []}
+
+
+def run_routing(network, n_updates, incremental, check=False, ecmp=False):
+    """Advertise every router's link state to all routers, then n_updates
+    times change the cost of a random link and advertise its router's new
+    link state. Routes (and with ecmp, multipaths) are updated incrementally
+    or recomputed from scratch. Return (number of route updates, wall-clock seconds of the changes)."""
+    with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                     delete=False) as f:
+        json.dump(network, f)
+    try:
+        em = EventManager(logging=False)
+        _, routers, _, _ = read_network(f.name, em)
+    finally:
+        os.remove(f.name)
+    routers = list(routers.values())
+    for router in routers:
+        router.ecmp = ecmp
+    rng = random.Random(0)
+    costs = {r: {link: link.delay * rng.uniform(1, 2) for link in r.links}
+             for r in routers}
+    updates = []
+    for _ in range(n_updates):
+        r = rng.choice(routers)
+        updates.append((r, rng.choice(r.links), rng.uniform(1, 2)))
+
+    def advertise(sender, incremental):
+        data = [(l.dest, cost, l) for l, cost in costs[sender].items()]
+        for router in routers:
+            if incremental:
+                router.update_network(sender, data)
+            else:
+                router.network[sender] = data
+                router.rebuild_routes()
+
+    for router in routers:  # Converge first
+        advertise(router, True)
+    start = time.perf_counter()
+    for sender, link, factor in updates:
+        costs[sender][link] = link.delay * factor
+        advertise(sender, incremental)
+    elapsed = time.perf_counter() - start
+    if check and incremental:
+        for router in routers:
+            router.check_routes()
+    return len(updates) * len(routers), elapsed
+
+
+def run_routing_mode(network, routing, n_intervals):
+    """Simulate n_intervals routing intervals of one second on an idle
+    network with the given EventManager routing mode.
+    Return (number of events, wall-clock seconds)."""
+    with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                     delete=False) as f:
+        json.dump(network, f)
+    try:
+        em = EventManager(logging=False,
+                          routing=RoutingProtocol(routing, interval=1))
+        read_network(f.name, em)
+    finally:
+        os.remove(f.name)
+    start = time.perf_counter()
+    em.run(stop_when_flows_done=False, max_time=n_intervals - 0.5)
+    return em.n_events, time.perf_counter() - start
+
+
+def run_events(input_file, scheduler, max_time, packet_pool=None,
+               link_engine='events'):
+    """Simulate input_file for max_time seconds of simulated time.
+    Return (number of events, wall-clock seconds, scheduler stats)."""
+    em = EventManager(logging=False, scheduler=scheduler,
+                      packet_pool=packet_pool)
+    with redirect_stdout(StringIO()):
+        read_network(input_file, em, link_engine=link_engine)
+        start = time.perf_counter()
+        em.run(max_time=max_time)
+        elapsed = time.perf_counter() - start
+    return em.n_events, elapsed, em.scheduler.stats()
+
+
+def report(name, n_events, elapsed, stats=None):
+    print('{:>10}: {} events in {:.3f}s, {:.0f} events/s'
+          .format(name, n_events, elapsed, n_events / elapsed))
+    if stats is not None:
+        print(' ' * 12 + ', '.join('{} {}'.format(k, v)
+                                   for k, v in stats.items()))
+
+
+def bench_events(args):
+    for scheduler in args.schedulers:
+        pool = PacketPool() if args.packet_pool else None
+        report(scheduler, *run_events(
+            args.input_file,
+            SCHEDULERS[scheduler](compact_fraction=args.compact_fraction),
+            args.max_time, pool, args.link_engine))
+        if pool is not None:
+            print(' ' * 12 + 'packets ' + ', '.join(
+                '{} {}'.format(k, v) for k, v in pool.stats().items()))
+
+
+def bench_scheduler(args):
+    for n_flows in args.flows:
+        with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                         delete=False) as f:
+            json.dump(dumbbell(n_flows), f)
+        try:
+            print('Dumbbell with {} flows, {}s simulated:'
+                  .format(n_flows, args.max_time))
+            for scheduler in args.schedulers:
+                report(scheduler, *run_events(f.name, scheduler,
+                                              args.max_time))
+        finally:
+            os.remove(f.name)
+
+    for size in args.hold:
+        print('Hold model with {} pending events:'.format(size))
+        for scheduler in args.schedulers:
+            report(scheduler, *hold(SCHEDULERS[scheduler](), size))
+
+
+class HoldEvent(Event):
+    def run(self):
+        pass
+
+
+def hold(scheduler, size, n_ops=200000):
+    """Classic hold-model benchmark: keep size events pending, and replace
+    each popped event by one a random (exponential) time later."""
+    rng = random.Random(0)
+    for _ in range(size):
+        scheduler.push(HoldEvent(rng.expovariate(1)))
+    start = time.perf_counter()
+    for _ in range(n_ops):
+        ev = scheduler.pop()
+        scheduler.push(HoldEvent(ev.t + rng.expovariate(1)))
+    return n_ops, time.perf_counter() - start
+
+
+def packet_bytes(n_packets):
+    """Average bytes allocated per data packet, including its id, sequence
+    numbers and the 8-byte slot of the list holding it."""
+    em = EventManager(logging=False)
+    src, dst = Host(em, 'H1'), Host(em, 'H2')
+    flow = Flow(em, 'F1', src, dst, DATA_PACKET_SIZE, 0, StopAndWait())
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    packets = [Packet(flow.get_packet_id(), flow, src, dst, False, True,
+                      False, 1000 + k, 1000 + k, DATA_PACKET_SIZE)
+               for k in range(n_packets)]
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(packets) == n_packets
+    return (used - before) / n_packets
+
+
+def bench_memory(args):
+    print('{:.1f} bytes/packet'.format(packet_bytes(args.packets)))
+    if args.input_file is not None:
+        em = EventManager(logging=False)
+        with redirect_stdout(StringIO()):
+            read_network(args.input_file, em)
+            tracemalloc.start()
+            em.run(max_time=args.max_time)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        print('{}: peak {:.2f} MB traced over {} events'
+              .format(args.input_file, peak / 1e6, em.n_events))
+
+
+def run_forwarding(network, n_packets, ecmp):
+    """Route n_packets packets between random routers and hosts of network
+    hop by hop, once looking up next hops in the routers' table dicts and
+    once with Router.next_hop, with hop counts as costs.
+    Return (number of hops, seconds with table, seconds with next_hop)."""
+    with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                     delete=False) as f:
+        json.dump(network, f)
+    try:
+        em = EventManager(logging=False)
+        hosts, routers, _, _ = read_network(f.name, em)
+    finally:
+        os.remove(f.name)
+    routers = list(routers.values())
+    install_oracle_routes(routers, {link: 1 for router in routers
+                                    for link in router.links}, ecmp=ecmp)
+    rng = random.Random(0)
+    hosts = list(hosts.values())
+    flows = [Flow(em, 'F{}'.format(k), hosts[0], hosts[1], 0, 0,
+                  StopAndWait()) for k in range(100)]
+    packets = [(rng.choice(routers),
+                Packet(k, rng.choice(flows), None, rng.choice(hosts), False,
+                       False, False, k, 0, DATA_PACKET_SIZE))
+               for k in range(n_packets)]
+
+    start = time.perf_counter()
+    n_hops = 0
+    for node, p in packets:
+        receiver = p.receiver
+        while node is not receiver:
+            node = node.table[receiver].dest
+            n_hops += 1
+    table_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for node, p in packets:
+        receiver = p.receiver
+        while node is not receiver:
+            node = node.next_hop(p).dest
+    return n_hops, table_elapsed, time.perf_counter() - start
+
+
+def bench_forwarding(args):
+    for k in args.fat_tree:
+        n_hops, table_elapsed, fib_elapsed = run_forwarding(
+            fat_tree(k), args.packets, args.ecmp)
+        print('fat tree k={}, {} hops: table {:.0f} ns/hop, next_hop {:.0f} '
+              'ns/hop'.format(k, n_hops, table_elapsed / n_hops * 1e9,
+                              fib_elapsed / n_hops * 1e9))
+
+
+def run_congestion_control(input_file, cc, max_time, **options):
+    """Simulate input_file with every flow using the congestion control cc
+    and the flow options (pacing, sack, ...), until the flows are done or
+    max_time. Return (simulated seconds, bits delivered, packets lost,
+    number of events)."""
+    with open(input_file) as f:
+        network = json.load(f)
+    for flow in network['flows']:
+        flow.update(options, congestion_control=cc)
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(network, f)
+    try:
+        em = EventManager(logging=False)
+        with redirect_stdout(StringIO()):
+            _, _, links, flows = read_network(f.name, em)
+            em.run(max_time=max_time)
+    finally:
+        os.remove(f.name)
+    delivered = sum(min(flow.src.send_first_unacked - 1,
+                        flow.src.last_seq_number) * DATA_PACKET_SIZE
+                    for flow in flows.values())
+    return (em.current_time, delivered,
+            sum(link.n_lost for link in links.values()), em.n_events)
+
+
+def bench_congestion_control(args):
+    for input_file in args.input_files:
+        print('{}:'.format(input_file))
+        for cc in args.ccs:
+            for pacing, sack, ack_every in itertools.product(
+                    [False, True] if args.pacing else [False],
+                    [False, True] if args.sack else [False],
+                    args.ack_every):
+                t, delivered, n_lost, n_events = run_congestion_control(
+                    input_file, cc, args.max_time, pacing=pacing, sack=sack,
+                    ack_every=ack_every)
+                name = cc + (' paced' if pacing else '') \
+                    + (' SACK' if sack else '') \
+                    + (' ack/{}'.format(ack_every) if ack_every > 1 else '')
+                print('{:>22}: {:.1f}s, {:.1f} Mbit/s, {} losses, {} '
+                      'events'.format(name, t, delivered / t / 1e6,
+                                      n_lost, n_events))
+
+
+def bench_routing(args):
+    topologies = [('fat tree k={}'.format(k), fat_tree(k)) for k in args.fat_tree]
+    topologies += [('ring n={}'.format(n), ring(n)) for n in args.ring]
+    for name, network in topologies:
+        print('{}, {} routers, {} link state changes:'
+              .format(name, len(network['routers']), args.updates))
+        for incremental in (True, False):
+            n, elapsed = run_routing(network, args.updates, incremental,
+                                     args.check, args.ecmp)
+            print('{:>12}: {} route updates in {:.3f}s, {:.1f} us/update'
+                  .format('incremental' if incremental else 'full', n,
+                          elapsed, elapsed / n * 1e6))
+        for routing in ROUTING_MODES:
+            n_events, elapsed = run_routing_mode(network, routing,
+                                                 args.intervals)
+            print('{:>12}: {} intervals in {:.3f}s, {} events'
+                  .format(routing, args.intervals, elapsed, n_events))
+
+
+parser = argparse.ArgumentParser(description='Simulator benchmarks.')
+subparsers = parser.add_subparsers(dest='benchmark')
+subparsers.required = True
+
+events_parser = subparsers.add_parser(
+    'events', help='Event throughput of the scheduler on an input file')
+events_parser.add_argument('input_file', type=str,
+                           help='JSON input file for network')
+events_parser.add_argument('--max-time', type=float, default=20,
+                           help='Simulated seconds to run')
+events_parser.add_argument('--schedulers', nargs='+', default=list(SCHEDULERS),
+                           choices=list(SCHEDULERS))
+events_parser.add_argument('--compact-fraction', type=float, default=0.5,
+                           help='Compact the scheduler when this fraction of '
+                                'its entries are cancelled events')
+events_parser.add_argument('--no-compact', dest='compact_fraction',
+                           action='store_const', const=None,
+                           help='Never compact the scheduler')
+events_parser.add_argument('--packet-pool', action='store_true',
+                           help='Recycle packets')
+events_parser.add_argument('--link-engine', choices=list(LINK_ENGINES),
+                           default='events', help='Link implementation')
+events_parser.set_defaults(func=bench_events)
+
+scheduler_parser = subparsers.add_parser(
+    'scheduler', help='Compare schedulers on generated topologies')
+scheduler_parser.add_argument('--flows', type=int, nargs='*',
+                              default=[10, 100],
+                              help='Numbers of flows in the dumbbell')
+scheduler_parser.add_argument('--max-time', type=float, default=20,
+                              help='Simulated seconds to run (the flows '
+                                   'start at 1s)')
+scheduler_parser.add_argument('--hold', type=int, nargs='*',
+                              default=[1000, 100000, 1000000],
+                              help='Queue sizes for the hold model')
+scheduler_parser.add_argument('--schedulers', nargs='+',
+                              default=list(SCHEDULERS),
+                              choices=list(SCHEDULERS))
+scheduler_parser.set_defaults(func=bench_scheduler)
+
+routing_parser = subparsers.add_parser(
+    'routing', help='Incremental vs full route computation, and link state '
+                    'vs oracle routing')
+routing_parser.add_argument('--fat-tree', type=int, nargs='*', default=[8, 12],
+                            help='k of the fat trees')
+routing_parser.add_argument('--ring', type=int, nargs='*', default=[300],
+                            help='Numbers of routers in the rings')
+routing_parser.add_argument('--updates', type=int, default=50,
+                            help='Number of link cost changes')
+routing_parser.add_argument('--intervals', type=int, default=1,
+                            help='Number of routing intervals simulated to '
+                                 'compare the routing modes')
+routing_parser.add_argument('--check', action='store_true',
+                            help='Check the incremental routes against a '
+                                 'full recomputation at the end')
+routing_parser.add_argument('--ecmp', action='store_true',
+                            help='Also keep the routers\' equal-cost '
+                                 'multipaths up to date')
+routing_parser.set_defaults(func=bench_routing)
+
+forwarding_parser = subparsers.add_parser(
+    'forwarding', help='Per-hop cost of next hop lookups')
+forwarding_parser.add_argument('--fat-tree', type=int, nargs='*',
+                               default=[4, 8, 16], help='k of the fat trees')
+forwarding_parser.add_argument('--packets', type=int, default=100000,
+                               help='Number of packets to route')
+forwarding_parser.add_argument('--ecmp', action='store_true',
+                               help='Spread flows over equal-cost paths '
+                                    '(next_hop only)')
+forwarding_parser.set_defaults(func=bench_forwarding)
+
+cc_parser = subparsers.add_parser(
+    'cc', help='Compare congestion controls on input files')
+cc_parser.add_argument('input_files', type=str, nargs='+',
+                       help='JSON input files, whose flows all get each '
+                            'congestion control in turn')
+cc_parser.add_argument('--ccs', nargs='+',
+                       default=['Reno', 'CUBIC', 'BBR', 'FAST'],
+                       help='Congestion controls to compare')
+cc_parser.add_argument('--max-time', type=float, default=60,
+                       help='Simulated seconds to run at most')
+cc_parser.add_argument('--pacing', action='store_true',
+                       help='Also run every congestion control with pacing')
+cc_parser.add_argument('--sack', action='store_true',
+                       help='Also run every congestion control with SACK')
+cc_parser.add_argument('--ack-every', type=int, nargs='+', default=[1],
+                       help='Run every congestion control with the '
+                            'destinations acknowledging every N packets, for '
+                            'each N')
+cc_parser.set_defaults(func=bench_congestion_control)
+
+memory_parser = subparsers.add_parser(
+    'memory', help='Memory used per packet, and peak memory of a run')
+memory_parser.add_argument('input_file', type=str, nargs='?',
+                           help='JSON input file for network')
+memory_parser.add_argument('--packets', type=int, default=100000,
+                           help='Number of packets to allocate')
+memory_parser.add_argument('--max-time', type=float, default=20,
+                           help='Simulated seconds to run')
+memory_parser.set_defaults(func=bench_memory)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    args.func(args)
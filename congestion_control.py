@@ -1,9 +1,26 @@
 from abc import ABC, abstractmethod
+from collections import deque
+from events import Event
+from tracing import INFO
 
 class CongestionControl(ABC):
     """Congestion control determines the window size (cwnd) during a TCP
     connection."""
 
+    def attach(self, flow_end):
+        """Called by the FlowEnd whose window this controls, when created."""
+        pass
+
+    def on_rtt_sample(self, t, rtt):
+        """Called with every RTT sample of the flow end (see
+        FlowEnd.on_rtt_sample)."""
+        pass
+
+    def pacing_rate(self):
+        """Packets per second to spread sending over, or None to leave it to
+        the flow end."""
+        return None
+
     @abstractmethod
     def initial_cwnd(self):
         """Return the initial cwnd"""
@@ -15,8 +32,9 @@ class CongestionControl(ABC):
         pass
     
     @abstractmethod
-    def posack(self, t):
-        """Called on a posACK. Return new value of cwnd."""
+    def posack(self, t, n_acked=1):
+        """Called on a posACK that newly acknowledges n_acked packets.
+        Return new value of cwnd."""
         pass
     
     @abstractmethod
@@ -36,8 +54,11 @@ class StopAndWait(CongestionControl):
     """The simplest congestion control. Basically a window size of 1."""
     def initial_cwnd(self):
         return 1
+
+    def get_int_cwnd(self):
+        return 1
     
-    def posack(self, t):
+    def posack(self, t, n_acked=1):
         return 1
     
     def dupack(self, t):
@@ -52,7 +73,7 @@ class StopAndWait(CongestionControl):
 class Reno(CongestionControl):
     # https://www.ietf.org/rfc/rfc2581.txt
     
-    def __init__(self, em, flow_i, debug=True):
+    def __init__(self, em, flow_i, debug=False):
         self.cwnd = 1
         self.ssthresh = float('inf')
         self.n_dupacks = 0          # Number of dupacks in a row
@@ -61,23 +82,27 @@ class Reno(CongestionControl):
         # These are just for logging
         self.em = em
         self.flow_i = flow_i  # id of owner flowend
+        self.log_name = 'FLOW|{}'.format(flow_i)
     
     def initial_cwnd(self):
         return 1
 
-    def posack(self, t):
+    def get_int_cwnd(self):
+        return int(self.cwnd)
+
+    def posack(self, t, n_acked=1):
         self.n_dupacks = 0
 
         if self.cwnd < self.ssthresh: # Slow start
             assert not self.fast_recovery
-            self.cwnd += 1
+            self.cwnd += n_acked
         else:
             if self.fast_recovery: # Exit FR/FR and deflate window
                 self.fast_recovery = False
                 self.cwnd = self.ssthresh
             
             # Congestion avoidance
-            self.cwnd += 1/self.cwnd
+            self.cwnd += n_acked/self.cwnd
         return int(self.cwnd)
     
     def dupack(self, t):
@@ -90,7 +115,7 @@ class Reno(CongestionControl):
                 self.n_dupacks = 0
                 self.fast_recovery = True
                 self.ssthresh = max(self.cwnd // 2, 2)
-                self.em.log_it('FLOW|{}'.format(self.flow_i), 'T|{}|SSTHRESH|{}'.format(t, self.ssthresh))
+                self.em.log_it(self.log_name, 'SSTHRESH', t, self.ssthresh)
                 self.cwnd = self.ssthresh + 3
                 return True, self.cwnd        
         return False, self.cwnd
@@ -101,31 +126,410 @@ class Reno(CongestionControl):
         self.n_dupacks = 0
         self.fast_recovery = False
         self.ssthresh = max(self.cwnd // 2, 2)
-        self.em.log_it('FLOW|{}'.format(self.flow_i), 'T|{}|SSTHRESH|{}'.format(t, self.ssthresh))
+        self.em.log_it(self.log_name, 'SSTHRESH', t, self.ssthresh)
+        self.cwnd = 1
+        return self.get_int_cwnd()
+
+
+class CUBIC(CongestionControl):
+    """
+    CUBIC (RFC 8312). After a loss, cwnd grows as a cubic function of the
+    time since the loss, C * (t - K)^3 + W_max: quickly back towards the
+    window W_max at which the loss happened, slowly around it, and then
+    faster and faster beyond it. Growth depends on time rather than on the
+    RTT, so long fat links fill up much faster than with Reno, but never
+    slower than with Reno (the TCP-friendly window). Fast recovery and
+    timeouts are as in Reno, with losses multiplying cwnd by beta instead
+    of halving it. Slow start ends early when RTT samples grow by an
+    eighth of the min RTT (HyStart's delay increase), before the queue
+    overflows.
+    """
+
+    HYSTART_MIN_CWND = 16
+    HYSTART_MIN_DELAY = 0.004  # s
+    HYSTART_MAX_DELAY = 0.016  # s
+
+    def __init__(self, em, flow_i, c=0.4, beta=0.7, debug=False):
+        self.cwnd = 1
+        self.ssthresh = float('inf')
+        self.n_dupacks = 0          # Number of dupacks in a row
+        self.fast_recovery = False  # Whether we're in fast recovery mode
+        self.c = c  # packets / s^3
+        self.beta = beta
+        self.w_max = 0  # cwnd at the last loss
+        self.epoch_start = None  # When the current cubic growth started
+        self.k = 0  # Time from epoch_start to get back to w_max
+        self.origin = 0  # The plateau of the cubic function
+        self.w_tcp = 0  # What Reno's cwnd would be
+        self.min_rtt = 0
+
+        # These are just for logging
+        self.em = em
+        self.flow_i = flow_i  # id of owner flowend
+        self.log_name = 'FLOW|{}'.format(flow_i)
+
+    def initial_cwnd(self):
+        return 1
+
+    def get_int_cwnd(self):
+        return int(self.cwnd)
+
+    def on_rtt_sample(self, t, rtt):
+        self.min_rtt = min(self.min_rtt, rtt) if self.min_rtt else rtt
+        if self.cwnd < self.ssthresh and self.cwnd >= self.HYSTART_MIN_CWND:
+            threshold = min(max(self.min_rtt / 8, self.HYSTART_MIN_DELAY),
+                            self.HYSTART_MAX_DELAY)
+            if rtt >= self.min_rtt + threshold:
+                self.ssthresh = self.cwnd
+                self.em.log_it(self.log_name, 'SSTHRESH', t, self.ssthresh)
+
+    def posack(self, t, n_acked=1):
+        self.n_dupacks = 0
+
+        if self.fast_recovery:  # Exit FR/FR and deflate window
+            self.fast_recovery = False
+            self.cwnd = self.ssthresh
+        elif self.cwnd < self.ssthresh:  # Slow start
+            self.cwnd += n_acked
+        else:
+            self.congestion_avoidance(t, n_acked)
+        return self.get_int_cwnd()
+
+    def congestion_avoidance(self, t, n_acked=1):
+        if self.epoch_start is None:
+            self.epoch_start = t
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.c) ** (1 / 3)
+                self.origin = self.w_max
+            else:
+                self.k = 0
+                self.origin = self.cwnd
+            self.w_tcp = self.cwnd
+        # Where the cubic function will be in an RTT
+        elapsed = t - self.epoch_start + self.min_rtt
+        target = self.origin + self.c * (elapsed - self.k) ** 3
+        # Reno with the same average window grows by 3(1-beta)/(1+beta)
+        # per RTT.
+        self.w_tcp += n_acked * 3 * (1 - self.beta) / (1 + self.beta) \
+            / self.cwnd
+        target = max(target, self.w_tcp)
+        if target > self.cwnd:
+            self.cwnd += min(n_acked * (target - self.cwnd) / self.cwnd,
+                             target - self.cwnd)
+        else:
+            self.cwnd += n_acked * 0.01 / self.cwnd
+
+    def on_loss(self, t):
+        self.epoch_start = None
+        if self.cwnd < self.w_max:
+            # Fast convergence: release bandwidth to newer flows
+            self.w_max = self.cwnd * (1 + self.beta) / 2
+        else:
+            self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * self.beta, 2)
+        self.em.log_it(self.log_name, 'SSTHRESH', t, self.ssthresh)
+
+    def dupack(self, t):
+        if self.fast_recovery:  # FR/FR
+            # For each additional dupack, inflate window
+            self.cwnd += 1
+        else:  # SS or CA
+            self.n_dupacks += 1
+            if self.n_dupacks == 3:  # Enter FR/FR
+                self.n_dupacks = 0
+                self.fast_recovery = True
+                self.on_loss(t)
+                self.cwnd = self.ssthresh + 3
+                return True, self.get_int_cwnd()
+        return False, self.get_int_cwnd()
+
+    def ack_timeout(self, t):
+        self.n_dupacks = 0
+        self.fast_recovery = False
+        self.on_loss(t)
+        self.cwnd = 1
+        return self.get_int_cwnd()
+
+
+class BBR(CongestionControl):
+    """
+    A model-based controller after BBR (Cardwell et al., 2016). It estimates
+    the bottleneck bandwidth, as the highest delivery rate over the last
+    bw_rounds round trips, and the round-trip propagation time, as the
+    smallest RTT over the last min_rtt_window seconds. cwnd aims at
+    cwnd_gain times their product (the bandwidth-delay product, BDP), and
+    the pacing rate is pacing_gain times the bandwidth.
+
+    Startup uses gains of 2/ln 2 until the bandwidth grew by less than 25%
+    for 3 rounds. Drain then limits cwnd to one BDP until the queue startup
+    built is gone, and probe_bw cycles the pacing gain through 1.25, 0.75
+    and six rounds of 1 to look for more bandwidth. When the min RTT wasn't
+    measured again for min_rtt_window, probe_rtt keeps 4 packets in flight
+    for at least 0.2 s so that the queue empties and it can be. Losses
+    don't change the model, but bound cwnd to 0.7 times its value at the
+    loss (and at least a BDP), a bound that probing rounds raise by their
+    gain (after BBRv2's inflight_hi). After timeouts cwnd grows back from 1
+    as in slow start.
+
+    Rounds are delimited by the flow end's RTT samples, one per round trip.
+    """
+
+    STARTUP_GAIN = 2 / 0.6931471805599453  # 2 / ln 2
+    PROBE_BW_GAINS = (1.25, 0.75, 1, 1, 1, 1, 1, 1)
+    MIN_CWND = 4
+    PROBE_RTT_TIME = 0.2
+    LOSS_BETA = 0.7
+
+    def __init__(self, em, flow_i, bw_rounds=10, min_rtt_window=10,
+                 debug=False):
         self.cwnd = 1
+        self.n_dupacks = 0  # Number of dupacks in a row
+        self.recovering = False  # Whether the first unacked was resent
+        self.state = 'startup'
+        self.pacing_gain = self.cwnd_gain = self.STARTUP_GAIN
+        self.bw_samples = deque(maxlen=bw_rounds)  # packets / s
+        self.btl_bw = None
+        self.min_rtt = None
+        self.min_rtt_t = None  # When min_rtt was measured
+        self.min_rtt_window = min_rtt_window
+        self.round_start_t = None
+        self.round_delivered = 0  # Packets acked when the round started
+        self.full_bw = 0  # Bandwidth when startup last grew by 25%
+        self.full_bw_rounds = 0  # Rounds since
+        self.pipe_filled = False
+        self.inflight_hi = float('inf')  # Bound on cwnd learned from losses
+        self.cycle_index = 0
+        self.probe_rtt_done = None  # When probe_rtt can end
+        self.prior_cwnd = None  # cwnd to go back to after probe_rtt
+        self.flow_end = None
+
+        # These are just for logging
+        self.em = em
+        self.flow_i = flow_i  # id of owner flowend
+        self.log_name = 'FLOW|{}'.format(flow_i)
+        self.trace_info = em.tracer.bind('FLOW', flow_i, INFO, force=debug)
+
+    def attach(self, flow_end):
+        self.flow_end = flow_end
+
+    def initial_cwnd(self):
+        return 1
+
+    def get_int_cwnd(self):
+        return max(int(self.cwnd), 1)
+
+    def bdp(self):
+        """The estimated bandwidth-delay product in packets."""
+        return self.btl_bw * self.min_rtt
+
+    def target_cwnd(self):
+        """The cwnd the model asks for, or None before the first estimate."""
+        if self.state == 'probe_rtt':
+            return self.MIN_CWND
+        if self.btl_bw is None:
+            return None
+        return max(min(self.cwnd_gain * self.bdp(), self.inflight_hi),
+                   self.MIN_CWND)
+
+    def pacing_rate(self):
+        if self.btl_bw is None:
+            return None
+        return self.pacing_gain * self.btl_bw
+
+    def in_flight(self):
+        return self.flow_end.send_next - self.flow_end.send_first_unacked
+
+    def on_rtt_sample(self, t, rtt):
+        expired = self.min_rtt is not None \
+            and t - self.min_rtt_t > self.min_rtt_window
+        if self.min_rtt is None or rtt <= self.min_rtt or expired:
+            self.min_rtt = rtt
+            self.min_rtt_t = t
+        delivered = self.flow_end.send_first_unacked
+        if self.round_start_t is not None and t > self.round_start_t:
+            self.bw_samples.append((delivered - self.round_delivered)
+                                   / (t - self.round_start_t))
+            self.btl_bw = max(self.bw_samples)
+            self.on_round(t)
+        self.round_start_t = t
+        self.round_delivered = delivered
+        if expired and self.state != 'probe_rtt':
+            self.enter('probe_rtt', t)
+        elif self.state == 'probe_rtt':
+            if self.probe_rtt_done is None:
+                if self.in_flight() <= self.MIN_CWND:
+                    self.probe_rtt_done = t + max(self.PROBE_RTT_TIME,
+                                                  self.min_rtt)
+            elif t >= self.probe_rtt_done:
+                self.min_rtt_t = t
+                self.cwnd = max(self.cwnd, self.prior_cwnd)
+                self.enter('probe_bw' if self.pipe_filled else 'startup', t)
+
+    def enter(self, state, t):
+        self.state = state
+        if state == 'startup':
+            self.pacing_gain = self.cwnd_gain = self.STARTUP_GAIN
+        elif state == 'drain':
+            self.pacing_gain = 1 / self.STARTUP_GAIN
+            self.cwnd_gain = 1
+        elif state == 'probe_bw':
+            self.cycle_index = 0
+            self.pacing_gain = self.PROBE_BW_GAINS[0]
+            self.cwnd_gain = 2
+        elif state == 'probe_rtt':
+            self.pacing_gain = 1
+            self.prior_cwnd = self.cwnd
+            self.probe_rtt_done = None
+        self.cwnd = min(self.cwnd, self.target_cwnd() or self.cwnd)
+        if self.trace_info:
+            self.trace_info(t, 'BBR enters {}', state)
+
+    def on_round(self, t):
+        if self.state == 'startup':
+            if self.btl_bw >= 1.25 * self.full_bw:
+                self.full_bw = self.btl_bw
+                self.full_bw_rounds = 0
+            else:
+                self.full_bw_rounds += 1
+                if self.full_bw_rounds >= 3:
+                    self.pipe_filled = True
+                    self.enter('drain', t)
+        if self.state == 'drain':
+            if self.in_flight() <= self.bdp():
+                self.enter('probe_bw', t)
+        elif self.state == 'probe_bw':
+            self.cycle_index = (self.cycle_index + 1) \
+                % len(self.PROBE_BW_GAINS)
+            self.pacing_gain = self.PROBE_BW_GAINS[self.cycle_index]
+            if self.pacing_gain > 1:
+                self.inflight_hi *= self.pacing_gain
+        self.em.log_it(self.log_name, 'BTLBW', t, self.btl_bw)
+
+    def posack(self, t, n_acked=1):
+        self.n_dupacks = 0
+        self.recovering = False
+        target = self.target_cwnd()
+        if target is None:  # No model yet: grow as in slow start
+            self.cwnd += n_acked
+        else:
+            self.cwnd = min(self.cwnd + n_acked, target)
         return self.get_int_cwnd()
 
+    def on_loss(self):
+        # Keep at least a BDP in flight: the loss may have been a burst.
+        if not self.recovering and self.btl_bw is not None:
+            self.inflight_hi = max(self.LOSS_BETA * self.cwnd, self.bdp(),
+                                   self.MIN_CWND)
+            self.cwnd = min(self.cwnd, self.inflight_hi)
+
+    def dupack(self, t):
+        if not self.recovering:
+            self.n_dupacks += 1
+            if self.n_dupacks == 3:  # Fast retransmit, once per hole
+                self.n_dupacks = 0
+                self.on_loss()
+                self.recovering = True
+                return True, self.get_int_cwnd()
+        return False, self.get_int_cwnd()
+
+    def ack_timeout(self, t):
+        # The flow end resends everything from the first unacked packet:
+        # start again from one packet, growing back towards the target.
+        self.n_dupacks = 0
+        self.on_loss()
+        self.recovering = False
+        self.cwnd = 1
+        return 1
+
 
 class FAST(CongestionControl):
+    """
+    FAST TCP (Jin, Wei and Low, 2004), a delay-based algorithm that aims at
+    keeping alpha packets of the flow queued in the network, so queues stay
+    short. Every update_interval seconds with new RTT samples, cwnd moves
+    the fraction gamma of the way towards baseRTT / avgRTT * cwnd + alpha,
+    and at most doubles.
+    baseRTT is the smallest RTT seen and avgRTT a moving average of the RTT
+    samples. Losses are handled as in Reno: cwnd halves on 3 dupACKs, and
+    goes back to 1 on timeouts.
+    """
 
-    def __init__(self):
-        pass
+    def __init__(self, em, flow_i, alpha=10, gamma=0.5, update_interval=0.02,
+                 debug=False):
+        self.cwnd = 1
+        self.alpha = alpha  # packets
+        self.gamma = gamma
+        self.update_interval = update_interval  # seconds
+        self.base_rtt = None
+        self.avg_rtt = None
+        self.n_dupacks = 0  # Number of dupacks in a row
+        self.n_samples = 0  # RTT samples since the last update
+        self.flow_end = None
+        self.update_pending = False  # Whether a FASTUpdate is scheduled
+
+        self.em = em
+        self.flow_i = flow_i  # id of owner flowend
+        self.log_name = 'FLOW|{}'.format(flow_i)
+
+    def attach(self, flow_end):
+        self.flow_end = flow_end
 
     def initial_cwnd(self):
-        pass
+        return 1
 
     def get_int_cwnd(self):
-        pass
+        return max(int(self.cwnd), 1)
 
-    def posack(self):
-        pass
+    def on_rtt_sample(self, t, rtt):
+        if self.base_rtt is None:
+            self.base_rtt = self.avg_rtt = rtt
+        else:
+            self.base_rtt = min(self.base_rtt, rtt)
+            # Averages over about a third of a window of samples
+            weight = min(3 / self.cwnd, 1 / 4)
+            self.avg_rtt = (1 - weight) * self.avg_rtt + weight * rtt
+        self.n_samples += 1
+        if not self.update_pending:  # The first sample starts the updates.
+            self.update_pending = True
+            self.em.enqueue(FASTUpdate(t + self.update_interval, self))
 
-    def dupack(self):
-        pass
+    def on_update(self, t):
+        if self.flow_end.is_done():
+            self.update_pending = False
+            return
+        # Without new samples (e.g. everything in flight was lost), there is
+        # nothing to update from.
+        if self.n_samples:
+            self.n_samples = 0
+            target = self.base_rtt / self.avg_rtt * self.cwnd + self.alpha
+            self.cwnd = min(2 * self.cwnd,
+                            (1 - self.gamma) * self.cwnd + self.gamma * target)
+            self.flow_end.set_window(t, self.get_int_cwnd())
+        self.em.enqueue(FASTUpdate(t + self.update_interval, self))
 
-    def ack_timeout(self):
-        pass
+    def posack(self, t, n_acked=1):
+        self.n_dupacks = 0
+        return self.get_int_cwnd()
+
+    def dupack(self, t):
+        self.n_dupacks += 1
+        if self.n_dupacks == 3:
+            self.n_dupacks = 0
+            self.cwnd = max(self.cwnd / 2, 1)
+            return True, self.get_int_cwnd()
+        return False, self.get_int_cwnd()
+
+    def ack_timeout(self, t):
+        self.n_dupacks = 0
+        self.cwnd = 1
+        return self.get_int_cwnd()
 
-        
 
+class FASTUpdate(Event):
+    # The periodic window update of FAST
+    def __init__(self, t, fast):
+        super().__init__(t)
+        self.fast = fast
 
+    def run(self):
+        self.fast.on_update(self.t)
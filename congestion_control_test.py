@@ -1,4 +1,4 @@
-from congestion_control import StopAndWait, Reno
+from congestion_control import StopAndWait, Reno, FAST, CUBIC, BBR
 from events import EventManager
 from host import Host
 from link import Link, LinkSetUsable
@@ -16,11 +16,13 @@ class SeqNumberRecorder:
         self.next_component.on_reception(t, p)
 
 
-def do_test(n_data_packets, cc, add_events):
+def do_test(n_data_packets, make_cc, add_events, **flow_options):
     """
-    The test has 2 hosts connected by a link, and one flow.
+    The test has 2 hosts connected by a link, and one flow, whose congestion
+    control is make_cc(em). flow_options are passed on to Flow.
     """
     em = EventManager(logging=False)
+    cc = make_cc(em)
     host_1 = Host(em, 'H1', debug=False)
     host_2 = Host(em, 'H2', debug=False)
     sr = SeqNumberRecorder('S', host_2)
@@ -31,7 +33,7 @@ def do_test(n_data_packets, cc, add_events):
     host_1.link = l1_a
     host_2.link = l1_b
     flow = Flow(em, 'F1', host_1, host_2, n_data_packets * DATA_PACKET_SIZE, 1,
-                cc, debug=False)
+                cc, debug=False, **flow_options)
 
     add_events(em, host_1, host_2, sr, l1_a, l1_b, flow)
     em.run()
@@ -43,53 +45,203 @@ def do_test(n_data_packets, cc, add_events):
     assert flow.src.send_next == n_data_packets + 1
     assert flow.dst.receive_next == n_data_packets + 1
 
-def consistency_test(cc):
+def consistency_test(make_cc, **flow_options):
     def add_events(em, host_1, host_2, sr, l1_a, l1_b, flow):
         pass
-    do_test(10000, cc, add_events)
+    do_test(10000, make_cc, add_events, **flow_options)
 
 
-def dropped_syn_test(cc):
+def dropped_syn_test(make_cc, **flow_options):
     def add_events(em, host_1, host_2, sr, l1_a, l1_b, flow):
         em.enqueue(LinkSetUsable(0, l1_a, False))
         em.enqueue(LinkSetUsable(2, l1_a, True))
-    do_test(5, cc, add_events)
+    do_test(5, make_cc, add_events, **flow_options)
 
 
-def dropped_synack_test(cc):
+def dropped_synack_test(make_cc, **flow_options):
     def add_events(em, host_1, host_2, sr, l1_a, l1_b, flow):
         # If we make the reverse link unusable, host_2 can never send syn+ack...
         em.enqueue(LinkSetUsable(0, l1_b, False))
         em.enqueue(LinkSetUsable(2, l1_b, True))
-    do_test(5, cc, add_events)
+    do_test(5, make_cc, add_events, **flow_options)
 
 
-def dropped_ack_of_synack_test(cc):
+def dropped_ack_of_synack_test(make_cc, **flow_options):
     def add_events(em, host_1, host_2, sr, l1_a, l1_b, flow):
         # Break link right after host 1 sends SYN
         em.enqueue(LinkSetUsable(1 + 0.001 + 0.01 + 0.000001, l1_a, False))    
         em.enqueue(LinkSetUsable(2, l1_a, True))
-    do_test(5, cc, add_events)
+    do_test(5, make_cc, add_events, **flow_options)
 
 
-def dropped_data_test(cc):
+def dropped_data_test(make_cc, **flow_options):
     def add_events(em, host_1, host_2, sr, l1_a, l1_b, flow):
         # RTT for this connection
         rtt = (0.001 + 0.01) * 2
         em.enqueue(LinkSetUsable(1 + 5 * rtt, l1_a, False))    
         em.enqueue(LinkSetUsable(1 + 10 * rtt, l1_a, True))    
-    do_test(100, cc, add_events)
-
-
-for cc in [StopAndWait(), Reno()]:
-    print('Consistency test for {}'.format(cc))
-    consistency_test(cc)
-    print('Dropped syn test for {}'.format(cc))
-    dropped_syn_test(cc)
-    print('Dropped synack test for {}'.format(cc))
-    dropped_synack_test(cc)
-    print('Dropped ack of synack test for {}'.format(cc))
-    dropped_ack_of_synack_test(cc)
-    print('Dropped data test for {}'.format(cc))
-    dropped_data_test(cc)
-
+    do_test(100, make_cc, add_events, **flow_options)
+
+
+# Each test gets a new congestion control: all but StopAndWait have state.
+CCS = [('StopAndWait', lambda em: StopAndWait()),
+       ('Reno', lambda em: Reno(em, 'F1SRC')),
+       ('FAST', lambda em: FAST(em, 'F1SRC')),
+       ('CUBIC', lambda em: CUBIC(em, 'F1SRC')),
+       ('BBR', lambda em: BBR(em, 'F1SRC'))]
+
+for timer_mode in ['per_packet', 'single']:
+    for cc, make_cc in CCS:
+        print('Consistency test for {} ({} timer)'.format(cc, timer_mode))
+        consistency_test(make_cc, timer_mode=timer_mode)
+        print('Dropped syn test for {} ({} timer)'.format(cc, timer_mode))
+        dropped_syn_test(make_cc, timer_mode=timer_mode)
+        print('Dropped synack test for {} ({} timer)'.format(cc, timer_mode))
+        dropped_synack_test(make_cc, timer_mode=timer_mode)
+        print('Dropped ack of synack test for {} ({} timer)'
+              .format(cc, timer_mode))
+        dropped_ack_of_synack_test(make_cc, timer_mode=timer_mode)
+        print('Dropped data test for {} ({} timer)'.format(cc, timer_mode))
+        dropped_data_test(make_cc, timer_mode=timer_mode)
+
+class StubFlowEnd(object):
+    """The parts of a FlowEnd that congestion controls use."""
+    def __init__(self):
+        self.send_first_unacked = 0
+        self.send_next = 0
+        self.done = False
+        self.windows = []  # (t, window) of every set_window call
+
+    def is_done(self):
+        return self.done
+
+    def set_window(self, t, window):
+        self.windows.append((t, window))
+
+
+# FAST: every update moves cwnd half of the way (gamma) to
+# baseRTT / avgRTT * cwnd + alpha, at most doubling it.
+print('Window update test for FAST')
+em = EventManager(logging=False)
+fast = FAST(em, 'F1SRC', alpha=10, gamma=0.5, update_interval=0.02)
+flow_end = StubFlowEnd()
+fast.attach(flow_end)
+fast.cwnd = 20
+fast.on_rtt_sample(0, 0.1)
+fast.on_rtt_sample(0.01, 0.2)  # Weighs min(3 / cwnd, 1 / 4) = 0.15
+assert fast.base_rtt == 0.1 and abs(fast.avg_rtt - 0.115) < 1e-12
+fast.on_update(0.02)
+cwnd = 0.5 * 20 + 0.5 * (0.1 / 0.115 * 20 + 10)
+assert abs(fast.cwnd - cwnd) < 1e-9
+assert flow_end.windows == [(0.02, 23)]
+# No samples during the last interval: nothing changes.
+fast.on_update(0.04)
+assert abs(fast.cwnd - cwnd) < 1e-9 and len(flow_end.windows) == 1
+# Without queueing, the target is cwnd + alpha, beyond twice a small cwnd.
+fast.cwnd = 4
+fast.on_rtt_sample(0.05, 0.1)
+fast.on_update(0.06)
+assert fast.cwnd == 8 and flow_end.windows[-1] == (0.06, 8)
+# Updates stop with the flow.
+flow_end.done = True
+fast.on_update(0.08)
+assert not fast.update_pending and len(flow_end.windows) == 2
+
+# CUBIC: after a loss at cwnd 100, cwnd is cut to 70 and gets back to 100
+# K = cbrt(100 * 0.3 / 0.4) s later, whatever the number of ACKs.
+print('Window growth test for CUBIC')
+cubic = CUBIC(EventManager(logging=False), 'F1SRC')
+cubic.cwnd = 100
+cubic.ssthresh = 50
+cubic.dupack(0)
+cubic.dupack(0)
+assert cubic.dupack(0) == (True, 73)
+cubic.posack(0)  # Exit fast recovery
+assert cubic.cwnd == 70
+k = (100 * 0.3 / 0.4) ** (1 / 3)
+for n_acks in range(1000):
+    cubic.posack(k * n_acks / 1000)
+assert 98 < cubic.cwnd <= 100
+
+# Reno grows by the number of packets an ACK covers: delayed ACKs do not
+# slow it down (RFC 3465).
+print('Window growth test for Reno')
+em = EventManager(logging=False)
+reno, delayed_reno = Reno(em, 'F1SRC'), Reno(em, 'F1SRC')
+for n_acks in range(100):
+    reno.posack(0)
+    if n_acks % 2:
+        delayed_reno.posack(0, 2)
+assert reno.cwnd == delayed_reno.cwnd == 101
+reno.ssthresh = delayed_reno.ssthresh = 0  # Congestion avoidance
+for n_acks in range(1000):
+    reno.posack(0)
+    if n_acks % 2:
+        delayed_reno.posack(0, 2)
+assert abs(reno.cwnd - delayed_reno.cwnd) < 0.1
+
+# BBR: the model comes from the RTT samples, one per round trip, and the
+# packets acknowledged in between. Times are exact in binary.
+print('Model test for BBR')
+em = EventManager(logging=False)
+bbr = BBR(em, 'F1SRC', bw_rounds=3, min_rtt_window=1)
+flow_end = StubFlowEnd()
+bbr.attach(flow_end)
+t = 0
+
+
+def bbr_round(rtt, delivered, in_flight):
+    """One round trip of rtt, in which delivered packets were acked."""
+    global t
+    t += rtt
+    flow_end.send_first_unacked += delivered
+    flow_end.send_next = flow_end.send_first_unacked + in_flight
+    bbr.on_rtt_sample(t, rtt)
+
+
+assert bbr.pacing_rate() is None
+assert bbr.posack(0) == 2  # Slow start without a model
+bbr_round(0.125, 0, 30)
+bbr_round(0.125, 10, 30)
+assert bbr.min_rtt == 0.125 and bbr.btl_bw == 80 and bbr.bdp() == 10
+assert bbr.state == 'startup' and bbr.pacing_rate() == BBR.STARTUP_GAIN * 80
+for _ in range(50):
+    bbr.posack(t)
+assert bbr.cwnd == BBR.STARTUP_GAIN * 10
+# The bandwidth stops growing for 3 rounds: drain until the queue is gone.
+for _ in range(3):
+    assert bbr.state == 'startup'
+    bbr_round(0.125, 10, 30)
+assert bbr.state == 'drain' and bbr.cwnd == 10
+assert bbr.pacing_rate() == 80 / BBR.STARTUP_GAIN
+bbr_round(0.125, 10, 10)
+assert bbr.state == 'probe_bw' and bbr.pacing_rate() == 100
+bbr_round(0.125, 10, 10)
+assert bbr.pacing_rate() == 60
+for _ in range(7):
+    bbr_round(0.125, 10, 10)
+assert bbr.pacing_rate() == 100  # The gain cycle went around
+# The bandwidth is the highest of the last bw_rounds rounds, the RTT the
+# smallest of the last min_rtt_window seconds.
+bbr_round(0.0625, 10, 10)
+assert bbr.btl_bw == 160 and bbr.min_rtt == 0.0625
+for _ in range(3):
+    assert bbr.btl_bw == 160
+    bbr_round(0.125, 10, 10)
+assert bbr.btl_bw == 80 and bbr.min_rtt == 0.0625
+for _ in range(5):
+    bbr_round(0.125, 10, 10)
+assert bbr.state == 'probe_bw' and bbr.min_rtt == 0.0625
+# min_rtt was not measured again for min_rtt_window: probe_rtt keeps
+# MIN_CWND packets in flight, for 0.2 s once in flight is that low.
+bbr.cwnd = 20
+bbr_round(0.125, 10, 10)
+assert bbr.state == 'probe_rtt' and bbr.min_rtt == 0.125
+assert bbr.cwnd == BBR.MIN_CWND and bbr.posack(t) == BBR.MIN_CWND
+assert bbr.pacing_rate() == 80
+bbr_round(0.125, 10, 4)
+end = t + 0.2
+while t < end:
+    assert bbr.state == 'probe_rtt'
+    bbr_round(0.125, 4, 4)
+assert bbr.state == 'probe_bw' and bbr.cwnd == 20
@@ -1,8 +1,9 @@
 from abc import ABC, abstractmethod
-import queue
-import datetime
 import time
-from packet import LinkStatePacket
+from aggregate import Aggregator
+from logger import LOGGERS
+from scheduler import HeapScheduler, SCHEDULERS
+from tracing import Tracer
 
 class Event(ABC):
     def __init__(self, t):
@@ -39,35 +40,64 @@ class Event(ABC):
         return self.t <= other_event.t
 
 
-class SendLinkState(Event):
-    def __init__(self, t):
-        super().__init__(t)
-    
-    def run(self):
-        pass
-
-
 class EventManager(object):
-    def __init__(self, logging=True):
-        self.event_queue = queue.PriorityQueue()
+    def __init__(self, logging=True, scheduler=None, log_format='text',
+                 aggregate=None, tracer=None, packet_pool=None,
+                 routing=None):
+        # Future event list. Either a scheduler.Scheduler or the name of one
+        # in scheduler.SCHEDULERS; the default is a binary heap.
+        if scheduler is None:
+            scheduler = HeapScheduler()
+        elif isinstance(scheduler, str):
+            scheduler = SCHEDULERS[scheduler]()
+        self.scheduler = scheduler
         self.current_time = 0
+        self.n_events = 0  # Number of events popped so far
         self.logging = logging
+        self.log_format = log_format
+        # If not None, log aggregates over bins of this many seconds instead
+        # of every record (see aggregate.py).
+        self.aggregate = aggregate
         self.initialize_log()
+        # Decides which components print debug traces (see tracing.py)
+        self.tracer = tracer if tracer is not None else Tracer()
+        # packet.PacketPool that recycles packets, or None to allocate every
+        # packet anew. Components must be created after it is set.
+        self.packet_pool = packet_pool
+        # routing.RoutingProtocol that keeps the routers' tables up to date;
+        # file_input.read_network sets one if None.
+        self.routing = routing
         self.router_list = {}
+        # Functions called with the time when run() stops, e.g. to bring
+        # lazily updated state up to date
+        self.on_stop = []
         self.flowends = set()  # Set of flowends left
+        # Map of kind ('HOST', 'ROUTER', 'LINK') -> number of components of
+        # that kind, which get dense indices in order of creation
+        self.n_components = {}
 
     def enqueue(self, event):
-        self.event_queue.put(event)
+        """Schedule event. Return a handle that can be passed to cancel."""
+        return self.scheduler.push(event)
+
+    def cancel(self, handle):
+        """Invalidate a scheduled event and drop it from the scheduler."""
+        self.scheduler.cancel(handle)
+
+    def new_index(self, kind):
+        """Index of a new component of kind, e.g. 'HOST' (see
+        n_components)."""
+        index = self.n_components.get(kind, 0)
+        self.n_components[kind] = index + 1
+        return index
 
     def register_flowend(self, flowend):
         self.flowends.add(flowend)
-        print('Flowend registered:', flowend, 'Set:', list(str(x) for x in self.flowends))
     
     def flowend_done(self, flowend):
         self.flowends.remove(flowend)
-        print('Flowend removed:', flowend, 'Set:', list(str(x) for x in self.flowends))
 
-    def run(self, stop_when_flows_done=True, max_time=None, interval=5):
+    def run(self, stop_when_flows_done=True, max_time=None):
         """
         Run network simulation.
 
@@ -76,50 +106,36 @@ class EventManager(object):
         stop_when_flows_done: if True, we also stop when all flows are done.
         max_time: if not None, stop after that many seconds.
         """
-        print(self.router_list)
-        for router in self.router_list:
-            print([x.i for x in self.router_list[router].links])
-
-        if self.router_list:  # Only send link state if there are routers
-            self.enqueue(SendLinkState(0.0))
+        # Only update routes if there are routers
+        if self.router_list and self.routing is not None:
+            self.routing.start(self)
 
-        while not self.event_queue.empty() \
+        while self.scheduler \
                 and (not(stop_when_flows_done) or self.flowends) \
                 and (max_time is None or self.current_time <= max_time):
-            ev = self.event_queue.get()
+            ev = self.scheduler.pop()
             self.current_time = ev.t
-            if type(ev) is SendLinkState:
-                self.enqueue(SendLinkState(ev.t + interval))
-                for router in self.router_list:
-                    payload = []
-                    for link in self.router_list[router].links:
-                        cong = link.delay + (link.interval_usage / interval) \
-                               / link.rate
-                        payload.append((link.dest, cong, link))
-                        link.interval_usage = 0
-                    p = LinkStatePacket("ptmp",
-                                        self.router_list[router],
-                                        payload)
-                    for link in self.router_list[router].links:
-                        link.on_packet_entry(self.current_time, p)
-            elif ev.is_valid():
+            self.n_events += 1
+            if ev.is_valid():
                 ev.run()
+        for on_stop in self.on_stop:
+            on_stop(self.current_time)
 
     def initialize_log(self):
         if self.logging:
-            log_file = 'log_{}.txt'.format(int(time.time()))
-            self.log = open(log_file, 'w')
+            logger, extension = LOGGERS[self.log_format]
+            log_file = 'log_{}{}'.format(int(time.time()), extension)
+            self.log = logger(log_file)
+            if self.aggregate is not None:
+                self.log = Aggregator(self.log, self.aggregate)
             print("Logging to {}".format(log_file))
-            curr = str(datetime.datetime.now())
-            print('-' * 8, curr, '-' * 8, file=self.log)
-            print('-' * 8, 'BEGIN RUN', '-' * 8, file=self.log)
 
-    def log_it(self, component, info):
+    def log_it(self, component, metric, t, value):
+        """Record that metric of component (e.g. 'LINK|L1_a') had value at
+        time t."""
         if self.logging:
-            line = '|'.join((component, info))
-            print(line, file=self.log)
+            self.log.log(component, metric, t, value)
 
     def __del__(self):
         if self.logging:
-            print('-' * 8, 'END RUN', '-' * 8, file=self.log)
             self.log.close()
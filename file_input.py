@@ -1,16 +1,35 @@
-from congestion_control import StopAndWait, Reno
-from link import Link
+from congestion_control import StopAndWait, Reno, FAST, CUBIC, BBR
+from link import LINK_ENGINES
 from router import Router
 from host import Host
 from flow import Flow
 from packet import LinkStatePacket
+from routing import RoutingProtocol
 import json
 
+# Optional flow keys that are passed on to Flow (and from there to FlowEnd)
+FLOW_OPTIONS = ('timer_mode', 'rto_initial', 'rto_min', 'rto_max', 'pacing',
+                'sack', 'ack_every', 'ack_delay')
 
-def read_network(filename, event_manager, debug=False):
+# Optional flow keys that are passed on to FAST
+FAST_OPTIONS = ('alpha', 'gamma', 'update_interval')
+
+# Optional flow keys that are passed on to CUBIC and BBR
+CUBIC_OPTIONS = ('c', 'beta')
+BBR_OPTIONS = ('bw_rounds', 'min_rtt_window')
+
+
+def read_network(filename, event_manager, debug=False, link_engine='events',
+                 routing='link_state'):
     """
     Create a network from input file.
     Add initial events to the event manager.
+    link_engine is the default implementation of links (see
+    link.LINK_ENGINES); a link's "engine" key overrides it.
+    Unless the event manager already has one, set its routing protocol from
+    the file's "routing" object, with the keys of routing.RoutingProtocol
+    (e.g. {"interval": 1, "cost": "queue", "hysteresis": 0.2}); routing is
+    the default mode.
     """
 
     with open(filename) as f:
@@ -41,12 +60,13 @@ def read_network(filename, event_manager, debug=False):
         assert end_a != end_b, 'Loop link'
         i_a = i + '_a'
         i_b = i + '_b'
-        link_a = Link(event_manager, i_a, end_a, end_b, l['rate'], l['delay'],
-                      l['buffer_size'], debug)
+        link_class = LINK_ENGINES[l.get('engine', link_engine)]
+        link_a = link_class(event_manager, i_a, end_a, end_b, l['rate'],
+                            l['delay'], l['buffer_size'], debug)
         end_a.add_link(link_a)
         links[i_a] = link_a
-        link_b = Link(event_manager, i_b, end_b, end_a, l['rate'], l['delay'],
-                      l['buffer_size'], debug)
+        link_b = link_class(event_manager, i_b, end_b, end_a, l['rate'],
+                            l['delay'], l['buffer_size'], debug)
         end_b.add_link(link_b)
         links[i_b] = link_b
 
@@ -63,6 +83,18 @@ def read_network(filename, event_manager, debug=False):
         elif json_flow['congestion_control'] == 'Reno':
             # Note: We only use Reno on the source
             cc = Reno(event_manager, json_flow['id'] + 'SRC')
+        elif json_flow['congestion_control'] == 'FAST':
+            cc = FAST(event_manager, json_flow['id'] + 'SRC',
+                      **{option: json_flow[option] for option in FAST_OPTIONS
+                         if option in json_flow})
+        elif json_flow['congestion_control'] == 'CUBIC':
+            cc = CUBIC(event_manager, json_flow['id'] + 'SRC',
+                       **{option: json_flow[option] for option in CUBIC_OPTIONS
+                          if option in json_flow})
+        elif json_flow['congestion_control'] == 'BBR':
+            cc = BBR(event_manager, json_flow['id'] + 'SRC',
+                     **{option: json_flow[option] for option in BBR_OPTIONS
+                        if option in json_flow})
         else:
             raise ValueError('Unknown congestion control algorithm '
                              + json_flow['congestion_control'])
@@ -74,10 +106,15 @@ def read_network(filename, event_manager, debug=False):
                     json_flow['amount'],
                     json_flow['start_delay'],
                     cc,
-                    debug)
+                    debug,
+                    **{option: json_flow[option] for option in FLOW_OPTIONS
+                       if option in json_flow})
         flows[flow.i] = flow
         
     event_manager.router_list = routers
+    if event_manager.routing is None:
+        event_manager.routing = RoutingProtocol(
+            **dict({'mode': routing}, **j.get('routing', {})))
     return hosts, routers, links, flows
 
 
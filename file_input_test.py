@@ -1,9 +1,24 @@
+import json
+import os
+import tempfile
+from congestion_control import FAST, CUBIC, BBR
 from events import EventManager
 from file_input import read_network
 from host import Host
 from link import Link
 from flow import Flow
 
+
+def read_network_json(network, em, **kwargs):
+    """read_network on a network description, as json.load returns it."""
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(network, f)
+    try:
+        return read_network(f.name, em, **kwargs)
+    finally:
+        os.remove(f.name)
+
+
 em = EventManager(logging=False)
 hosts, routers, links, flows = read_network('test_case_0_stopandwait.json', em)
 h1 = Host(em, 'H1', debug=False)
@@ -21,3 +36,40 @@ assert links == {
     'L1_b': Link(em, 'L1_b', hosts['H2'], hosts['H1'], 1.049e7, 10e-3, 5.24e5, debug=False)
 }
 # TODO check flows; it is a bit difficult
+assert em.routing.mode == 'link_state' and em.routing.interval == 5
+
+# Routing settings from the file
+with open('test_case_1_reno.json') as f:
+    network = json.load(f)
+network['routing'] = {'interval': 1, 'cost': 'queue', 'hysteresis': 0.2}
+em = EventManager(logging=False)
+read_network_json(network, em, routing='oracle')
+assert em.routing.mode == 'oracle'
+assert em.routing.interval == 1 and em.routing.cost == 'queue'
+assert em.routing.hysteresis == 0.2 and em.routing.damping == 0
+
+# Dense indices per kind of component
+hosts, routers, links, _ = read_network('test_case_1_reno.json',
+                                         EventManager(logging=False))
+for components in [hosts, routers, links]:
+    assert sorted(c.index for c in components.values()) \
+        == list(range(len(components)))
+
+# FAST flows, with their options
+with open('test_case_5_fast.json') as f:
+    network = json.load(f)
+network['flows'][0].update(alpha=5, gamma=0.25)
+_, _, _, flows = read_network_json(network, EventManager(logging=False))
+assert isinstance(flows['F1'].src.cc, FAST)
+assert flows['F1'].src.cc.alpha == 5 and flows['F1'].src.cc.gamma == 0.25
+assert flows['F2'].src.cc.alpha == 10 and flows['F2'].src.cc.gamma == 0.5
+
+# CUBIC and BBR flows, with pacing and delayed ACKs
+network['flows'][0].update(congestion_control='CUBIC', beta=0.8, ack_every=2)
+network['flows'][1].update(congestion_control='BBR', bw_rounds=5, pacing=True)
+_, _, _, flows = read_network_json(network, EventManager(logging=False))
+assert isinstance(flows['F1'].src.cc, CUBIC) and flows['F1'].src.cc.beta == 0.8
+assert isinstance(flows['F2'].src.cc, BBR)
+assert flows['F2'].src.cc.bw_samples.maxlen == 5
+assert flows['F2'].src.pacing and not flows['F1'].src.pacing
+assert flows['F1'].dst.ack_every == 2 and flows['F2'].dst.ack_every == 1
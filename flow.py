@@ -1,17 +1,58 @@
 from congestion_control import StopAndWait
 from events import Event
 from packet import Packet, DATA_PACKET_SIZE, CONTROL_PACKET_SIZE
+from tracing import INFO
+from bisect import bisect_left
 from math import ceil
+import zlib
 
 # https://tools.ietf.org/html/rfc793#section-3.4
 
+# Most SACK blocks an ACK carries (RFC 2018 fits 3 with timestamps)
+MAX_SACK_BLOCKS = 3
+
+
+# Sets of seq#s as sorted lists of disjoint [first, last + 1) intervals, e.g.
+# the packets received above receive_next: memory O(holes), not O(packets).
+def add_interval(intervals, start, end):
+    """Add [start, end) to intervals, merging it with the intervals it
+    overlaps or touches. Return the index of the merged interval."""
+    k = bisect_left(intervals, [start])
+    if k > 0 and intervals[k - 1][1] >= start:
+        k -= 1
+    last = k
+    while last < len(intervals) and intervals[last][0] <= end:
+        last += 1
+    if last > k:
+        start = min(start, intervals[k][0])
+        end = max(end, intervals[last - 1][1])
+    intervals[k:last] = [[start, end]]
+    return k
+
+
+def trim_intervals(intervals, first):
+    """Remove everything below first from intervals."""
+    k = 0
+    while k < len(intervals) and intervals[k][1] <= first:
+        k += 1
+    del intervals[:k]
+    if intervals and intervals[0][0] < first:
+        intervals[0][0] = first
+
 
 class FlowEnd(object):
     def __init__(self, event_manager, i, flow, host, other_host, amount, cc,
-                 debug=True):
-        self.debug = debug
+                 timer_mode='per_packet', rto_initial=1.0, rto_min=0.2,
+                 rto_max=60.0, pacing=False, sack=False, ack_every=1,
+                 ack_delay=0.04, debug=False):
         self.em = event_manager
         self.i = i
+        self.log_name = 'FLOW|{}'.format(i)  # Component name in the log
+        self.trace = self.em.tracer.bind('FLOW', i, force=debug)
+        self.trace_info = self.em.tracer.bind('FLOW', i, INFO, force=debug)
+        # Creates packets; takes the same arguments as Packet()
+        pool = self.em.packet_pool
+        self.new_packet = Packet if pool is None else pool.get
         self.flow = flow
         self.host = host
         self.other_host = other_host
@@ -37,18 +78,75 @@ class FlowEnd(object):
         # seq# of next packet to send, # if all outstanding packets are acked
         self.send_next = self.send_iss
 
+        # One past the highest seq# ever sent. Packets below it that are sent
+        # again are retransmissions.
+        self.send_max = self.send_iss
+
         self.receive_iss = None  # seq# of Syn packet that counterparty sends
 
         # seq# of the first packet I haven't received
         self.receive_next = None
-        self.received_seqs = set()  # Set of received sequence numbers
+        # Intervals (see add_interval) of the packets received above
+        # receive_next
+        self.received_above = []
+
+        # Selective acknowledgements (RFC 2018). With sack, my ACKs carry
+        # SACK blocks, and as a sender I keep the intervals of packets SACKed
+        # above send_first_unacked. After a fast retransmit, I resend the
+        # holes below the highest SACKed packet, counting them out of the
+        # packets in flight until resent (as in RFC 6675), until
+        # recovery_point is acknowledged.
+        self.sack = sack
+        self.sacked = []
+        self.recovery_point = None  # send_max when the recovery started
+        self.resend_next = None  # Holes below it were resent in the recovery
+
+        # ACK policy (RFC 5681 4.2). In-order data is acknowledged every
+        # ack_every packets, or ack_delay seconds after the first packet not
+        # acknowledged yet, whichever comes first. Anything else (out of
+        # order, filling a hole, duplicate) is acknowledged right away, so
+        # that the sender gets its dupacks.
+        if ack_every < 1:
+            raise ValueError('ack_every must be at least 1')
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay  # seconds
+        # Most packets one ACK counts for in the window growth (RFC 3465's
+        # limit L): the other end's ack_every, which Flow sets.
+        self.abc_limit = 1
+        self.n_not_acked = 0  # In-order packets received since my last ACK
+        self.delayed_ack_event = None  # Scheduler handle of the DelayedAck
+
+        # Retransmission timers. In 'per_packet' mode, every outstanding
+        # packet has its own AckTimeout. In 'single' mode there is one
+        # RetransmitTimer per flow end, guarding the first unacknowledged
+        # packet (RFC 6298).
+        if timer_mode not in ('per_packet', 'single'):
+            raise ValueError('Unknown timer mode ' + timer_mode)
+        self.timer_mode = timer_mode
 
         # Timeouts that are relevant to me. Also remembers outstanding packets.
-        # Map of (Seq # -> AckTimeout event for that Seq#)
+        # Map of (Seq # -> scheduler handle of the AckTimeout for that Seq#)
         self.ack_timeout_events = {}
 
+        # Single timer state. The timer expires at rto_deadline (None if it's
+        # stopped) and guards seq# timer_seq. Restarting it only moves the
+        # deadline; the pending RetransmitTimer event notices when it fires
+        # and schedules itself again for the new deadline.
+        self.rto_deadline = None
+        self.timer_seq = None
+        self.rto_event = None    # Scheduler handle of the pending event
+        self.rto_event_t = None  # and the time it fires
+
         # Congestion control algorithm.
         self.cc = cc
+        cc.attach(self)
+
+        # Pacing: rather than sending the whole window at once, space data
+        # packets at the congestion control's pacing rate, or at window_size
+        # per srtt. A PacingTimer sends the next one at pacing_next_t.
+        self.pacing = pacing
+        self.pacing_next_t = 0
+        self.pacing_event = None  # Scheduler handle of the pending timer
 
         # RTT sampling parameters
         # Sequence number of packet currently being sampled
@@ -61,22 +159,31 @@ class FlowEnd(object):
         #
         # OPERATION PARAMETERS
         #
-        # Minimum ACK timeout permitted by RFCs is 1.0s.
-        # "Whenever RTO is computed, if it is less than 1 second, then the
-        # RTO SHOULD be rounded up to 1 second"
-        # TODO: Compute timeouts using algorithm from book.
-        self.ack_wait = 1
+        # ack_wait is the retransmission timeout (RTO), computed from srtt and
+        # rttvar as in RFC 6298 and clamped to [rto_min, rto_max]. RFC 6298
+        # says the minimum SHOULD be 1s, but like Linux we default to 200ms
+        # so that losses on low-latency links don't stall a flow for dozens
+        # of RTTs.
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self.ack_wait = rto_initial
         self.window_size = cc.initial_cwnd()
 
     def is_established(self):
         return self.send_first_unacked > self.send_iss
 
     def attempt_rtt_sample(self, t, packet):
-        if self.rtt_sample_seq == None:
+        # Karn's algorithm: never sample retransmitted packets, since we
+        # can't tell which transmission an ACK is for.
+        if self.rtt_sample_seq == None and packet.seq_number >= self.send_max:
             # Sample this packet
             self.rtt_sample_seq = packet.seq_number
             self.rtt_sample_send_time = t
 
+    def cancel_rtt_sample(self):
+        self.rtt_sample_seq = None
+        self.rtt_sample_send_time = None
+
     def on_rtt_sample(self, packet, rtt, t):
         # Update srtt and rttvar (RFC 6298)
         if self.srtt == None:
@@ -85,80 +192,163 @@ class FlowEnd(object):
         else:
             self.rttvar = (1-1/4) * self.rttvar + 1/4 * abs(self.srtt - rtt)
             self.srtt = (1-1/8) * self.srtt + 1/8 * rtt
-        if self.debug:
-            print('RTT sample: {} on pkt = {}'.format(rtt, packet))
-            print('New SRTT = {}, RTTVAR = {}'.format(self.srtt, self.rttvar))
+        # A new sample also undoes any backoff.
+        self.ack_wait = min(max(self.srtt + 4 * self.rttvar, self.rto_min),
+                            self.rto_max)
+        if self.trace:
+            self.trace(t, 'RTT sample {} on {}: SRTT = {}, RTTVAR = {}, '
+                       'RTO = {}', rtt, packet, self.srtt, self.rttvar,
+                       self.ack_wait)
 
         ### Per-flow packet round-trip delay ###
-        self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|RTT|{}'.format(t, self.srtt))
+        self.em.log_it(self.log_name, 'RTT', t, self.srtt)
+
+        self.cc.on_rtt_sample(t, rtt)
+
+    def is_done(self):
+        """Whether all the data was acknowledged."""
+        return self.send_first_unacked > self.last_seq_number
+
+    def set_window(self, t, window_size):
+        """Change the window outside of ACK processing, e.g. on a timer of
+        the congestion control, and send what it allows."""
+        self.window_size = window_size
+        self.em.log_it(self.log_name, 'WINDOW', t, window_size)
+        if self.is_established():
+            self.act(t)
 
     def act(self, t):
         if not self.is_established():
             # Resend the initial Syn packet.
             syn_packet = \
-                Packet(i=self.flow.get_packet_id(),
-                       flow=self.flow,
-                       sender=self.host,
-                       receiver=self.other_host,
-                       syn_flag=True,
-                       ack_flag=False,
-                       fin_flag=False,
-                       seq_number=self.send_iss,
-                       ack_number=None,
-                       size=CONTROL_PACKET_SIZE)
+                self.new_packet(i=self.flow.get_packet_id(),
+                                flow=self.flow,
+                                sender=self.host,
+                                receiver=self.other_host,
+                                syn_flag=True,
+                                ack_flag=False,
+                                fin_flag=False,
+                                seq_number=self.send_iss,
+                                ack_number=None,
+                                size=CONTROL_PACKET_SIZE)
 
             self.send_acknowledgeable_packet(t, syn_packet)
 
-        else:  # I'm established. Send a data packet if I need to.
-            if self.send_next > self.last_seq_number:
-                return  # All the data is sent.
-            if self.send_next - self.send_first_unacked >= self.window_size:
-                return  # Window size prevents a send.
-
-            assert self.receive_next is not None  # since ESTABLISHED
+        else:  # I'm established. Send data packets if I need to.
+            # Utilize the entire window.
+            while True:
+                hole = self.next_hole()
+                if hole is None and self.send_next > self.last_seq_number:
+                    return  # All the data is sent.
+                if self.in_flight() >= self.window_size:
+                    return  # Window size prevents a send.
+                if self.pacing:
+                    if t < self.pacing_next_t:
+                        if self.pacing_event is None:
+                            self.pacing_event = self.em.enqueue(
+                                PacingTimer(self.pacing_next_t, self))
+                        return  # Not yet
+                    rate = self.pacing_rate()
+                    if rate is not None:
+                        self.pacing_next_t = t + 1 / rate
+                if hole is None:
+                    self.send_data_packet(t)
+                else:
+                    self.resend_hole(t, hole)
+
+    def in_flight(self):
+        """Number of packets sent and in the network, as far as I know."""
+        outstanding = self.send_next - self.send_first_unacked
+        if self.recovery_point is None or not self.sacked:
+            return outstanding
+        # Holes not resent yet below the highest SACKed packet are lost. The
+        # SACKed packets left the network too, but congestion controls
+        # already make room for them: Reno inflates its window by dupacks.
+        # Holes below resend_next were resent, and below send_first_unacked
+        # acknowledged, as in next_hole.
+        seq = max(self.resend_next, self.send_first_unacked)
+        highest = self.sacked[-1][1]
+        n_lost = highest - seq - sum(
+            end - max(start, seq) for start, end in self.sacked if end > seq)
+        return outstanding - max(n_lost, 0)
+
+    def next_hole(self):
+        """The next packet to resend in a SACK recovery, or None."""
+        if self.recovery_point is None or not self.sacked:
+            return None
+        seq = max(self.resend_next, self.send_first_unacked)
+        for start, end in self.sacked:
+            if seq < start:
+                return seq
+            seq = max(seq, end)
+        return None
+
+    def resend_hole(self, t, seq_number):
+        """Resend packet #seq_number, which the SACKs show is missing."""
+        send_next = self.send_next
+        self.send_next = seq_number
+        self.stop_timer(seq_number)  # Subtle: invalidate its old ack timeout
+        self.send_data_packet(t)
+        self.send_next = send_next
+        self.resend_next = seq_number + 1
+
+    def pacing_rate(self):
+        """Data packets per second to send at in pacing mode, or None if
+        there is nothing to go by yet."""
+        rate = self.cc.pacing_rate()
+        if rate is None and self.srtt:
+            rate = self.window_size / self.srtt
+        return rate or None
+
+    def on_pacing_timer(self, t):
+        self.pacing_event = None
+        self.act(t)
 
-            data_packet = \
-                Packet(i=self.flow.get_packet_id(),
-                       flow=self.flow,
-                       sender=self.host,
-                       receiver=self.other_host,
-                       syn_flag=False,
-                       ack_flag=True,
-                       fin_flag=False,
-                       seq_number=self.send_next,
-                       ack_number=self.receive_next,
-                       size=DATA_PACKET_SIZE)
+    def send_data_packet(self, t):
+        """Send data packet #send_next."""
+        assert self.receive_next is not None  # since ESTABLISHED
 
-            self.send_acknowledgeable_packet(t, data_packet)
+        data_packet = \
+            self.new_packet(i=self.flow.get_packet_id(),
+                            flow=self.flow,
+                            sender=self.host,
+                            receiver=self.other_host,
+                            syn_flag=False,
+                            ack_flag=True,
+                            fin_flag=False,
+                            seq_number=self.send_next,
+                            ack_number=self.receive_next,
+                            size=DATA_PACKET_SIZE)
 
-            self.act(t)  # Utilize the entire window.
+        self.send_acknowledgeable_packet(t, data_packet)
 
     def on_ack_timeout(self, t, seq_number):
-        if self.debug:
-            print("t={}: {} ack timeout on seq# {}"
-                  .format(round(t, 6), self, seq_number))
+        if self.trace_info:
+            self.trace_info(t, 'ack timeout on seq# {}', seq_number)
 
         # We want to retransmit the first unacknowledged packet. Usually, this
         # should be the packet with #seq_number.
         assert self.send_first_unacked <= seq_number
 
         # Ack timeout
-        self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|ACKTIMEOUT|1'.format(t))
+        self.em.log_it(self.log_name, 'ACKTIMEOUT', t, 1)
+
+        # Exponential backoff (RFC 6298 5.5)
+        self.ack_wait = min(2 * self.ack_wait, self.rto_max)
 
         # ADJUST SETTINGS
         self.window_size = self.cc.ack_timeout(t)
-        self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|WINDOW|{}'.format(t, self.window_size))
+        self.em.log_it(self.log_name, 'WINDOW', t, self.window_size)
 
         self.retransmit(t)
 
     def on_reception(self, t, received_packet):
         assert received_packet.receiver == self.host
-        if self.debug:
-            print("t={}: {} received packet {}"
-                  .format(round(t, 6), self, received_packet))
+        if self.trace:
+            self.trace(t, 'received packet {}', received_packet)
 
         ### Per-flow receive rate ###
-        self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|RCVE|{}'.format(t, received_packet.size))
+        self.em.log_it(self.log_name, 'RCVE', t, received_packet.size)
 
         #
         # OPERATIONS AGNOSTIC TO WHETHER WE'RE ESTABLISHED
@@ -168,43 +358,70 @@ class FlowEnd(object):
             # Got an ACK
             # Update window size and send_first_unacked.
             # Retransmit if needed
+            if self.sack and received_packet.sack:
+                # Only what's outstanding: after a timeout, packets from
+                # send_next on will be sent again anyway.
+                for start, end in received_packet.sack:
+                    start = max(start, self.send_first_unacked)
+                    end = min(end, self.send_next)
+                    if end > start:
+                        add_interval(self.sacked, start, end)
             if received_packet.ack_number < self.send_first_unacked:
-                # TODO is this possible?
-                assert False
+                # An old ACK overtaken by newer ones, e.g. after a route
+                # change: it acknowledges nothing new.
+                pass
 
             elif received_packet.ack_number == self.send_first_unacked:
-                if received_packet.size == CONTROL_PACKET_SIZE:
-                    # Only non-data packets can be dupacks
+                if received_packet.size == CONTROL_PACKET_SIZE \
+                        and not self.is_done():
+                    # Only non-data packets can be dupacks. Once all the data
+                    # is acked, late ones have nothing left to retransmit.
                     retransmit, self.window_size = self.cc.dupack(t)
-                    self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|WINDOW|{}'.format(t, self.window_size))
-                    self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|DUPACK|1'.format(t))
-                    if retransmit:
+                    self.em.log_it(self.log_name, 'WINDOW', t, self.window_size)
+                    self.em.log_it(self.log_name, 'DUPACK', t, 1)
+                    if retransmit and self.sack:
+                        # Unless already resending the holes
+                        if self.recovery_point is None:
+                            self.start_sack_recovery(t)
+                    elif retransmit:
                         old_next = self.send_next
-                        old_window_size = self.window_size
-                        # Retransmit the lost packet (which is the first unacked packet)
+                        # Retransmit the lost packet (which is the first
+                        # unacked packet) right away, even when pacing.
                         # Subtle: invalidate its old ack timeout
+                        # It is sent as with a window of 1, which the log
+                        # shows as before.
                         self.send_next = self.send_first_unacked
-                        self.window_size = 1
-                        self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|WINDOW|{}'.format(t, self.window_size))
-                        self.ack_timeout_events[self.send_first_unacked].invalidate()
-                        self.act(t)
+                        self.em.log_it(self.log_name, 'WINDOW', t, 1)
+                        self.stop_timer(self.send_first_unacked)
+                        self.cancel_rtt_sample()
+                        self.send_data_packet(t)
                         # Restore previous state
-                        self.send_next = old_next
-                        self.window_size = old_window_size
-                        self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|WINDOW|{}'.format(t, self.window_size))
+                        self.send_next = max(old_next, self.send_next)
+                        self.em.log_it(self.log_name, 'WINDOW', t,
+                                       self.window_size)
                         self.act(t)
             else:
-                self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|THROUGHPUT|{}'.format(
-                    t, (received_packet.ack_number - self.send_first_unacked) * DATA_PACKET_SIZE))
+                n_acked = received_packet.ack_number - self.send_first_unacked
+                self.em.log_it(self.log_name, 'THROUGHPUT', t,
+                    n_acked * DATA_PACKET_SIZE)
                 self.send_first_unacked = received_packet.ack_number
-                self.window_size = self.cc.posack(t)
-                self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|WINDOW|{}'.format(t, self.window_size))
-                self.em.log_it('FLOW|{}'.format(self.i), 'T|{}|POSACK|1'.format(t))
-                if self.send_first_unacked > self.last_seq_number:
+                if self.sacked:
+                    trim_intervals(self.sacked, self.send_first_unacked)
+                if self.recovery_point is not None \
+                        and self.send_first_unacked >= self.recovery_point:
+                    self.recovery_point = None  # Recovered
+                # Count the packets this ACK covers, but no more than the
+                # receiver acknowledges at once, so that a cumulative ACK
+                # after a loss does not cause a burst (RFC 3465)
+                self.window_size = self.cc.posack(
+                    t, min(n_acked, self.abc_limit))
+                self.em.log_it(self.log_name, 'WINDOW', t, self.window_size)
+                self.em.log_it(self.log_name, 'POSACK', t, 1)
+                if self.is_done():
                     # All packets are acked, so this flow is done
                     self.em.flowend_done(self)
 
-            self.clear_redundant_timeouts(received_packet.ack_number)  # clean
+            self.clear_redundant_timeouts(t, received_packet.ack_number)  # clean
 
             if self.rtt_sample_seq is not None and \
                     received_packet.ack_number > self.rtt_sample_seq:
@@ -212,8 +429,7 @@ class FlowEnd(object):
                 # when we get an ACK without ever having sent our own packet.
                 # That's when we're the destination getting a SYN+ACK.
                 self.on_rtt_sample(received_packet, t - self.rtt_sample_send_time, t)
-                self.rtt_sample_seq = None
-                self.rtt_sample_send_time = None
+                self.cancel_rtt_sample()
 
 
         #
@@ -222,16 +438,16 @@ class FlowEnd(object):
 
         if not self.is_established():
             # We're always sending a Syn received_packet.
-            response_packet = Packet(i=self.flow.get_packet_id(),
-                                     flow=self.flow,
-                                     sender=self.host,
-                                     receiver=self.other_host,
-                                     syn_flag=True,
-                                     ack_flag=False,
-                                     fin_flag=False,
-                                     seq_number=self.send_iss,
-                                     ack_number=None,
-                                     size=CONTROL_PACKET_SIZE)
+            response_packet = self.new_packet(i=self.flow.get_packet_id(),
+                                              flow=self.flow,
+                                              sender=self.host,
+                                              receiver=self.other_host,
+                                              syn_flag=True,
+                                              ack_flag=False,
+                                              fin_flag=False,
+                                              seq_number=self.send_iss,
+                                              ack_number=None,
+                                              size=CONTROL_PACKET_SIZE)
             # But we also acknowledge the packet we've received if it's Syn.
             # We don't acknowledge data packets.
             if received_packet.syn_flag:
@@ -254,41 +470,89 @@ class FlowEnd(object):
                     self.receive_iss = received_packet.seq_number
                     self.receive_next = self.receive_iss
                 # Update receive_next
-                self.received_seqs.add(received_packet.seq_number)
-                while self.receive_next in self.received_seqs:
+                seq_number = received_packet.seq_number
+                received = self.received_above
+                in_order = seq_number == self.receive_next and not received
+                k = None  # Index of the interval seq_number went into
+                if seq_number == self.receive_next:
                     self.receive_next += 1
-
-                response_packet = \
-                    Packet(i=self.flow.get_packet_id(),
-                           flow=self.flow,
-                           sender=self.host,
-                           receiver=self.other_host,
-                           syn_flag=False,
-                           ack_flag=True,
-                           fin_flag=False,
-                           seq_number=self.send_next,
-                           ack_number=self.receive_next,
-                           size=CONTROL_PACKET_SIZE)
-
-                # Do NOT schedule a timeout, just send the packet.
-                self.send(t, response_packet)
-
-                if self.debug:
-                    print("t={}: {} sends packet: {}"
-                          .format(round(t, 6), self, response_packet))
+                    if received and received[0][0] == self.receive_next:
+                        self.receive_next = received.pop(0)[1]
+                elif seq_number > self.receive_next:
+                    k = add_interval(received, seq_number, seq_number + 1)
+                sack = None
+                if self.sack and received:
+                    # The interval that just changed first (RFC 2018)
+                    order = list(range(len(received)))
+                    if k is not None:
+                        order.remove(k)
+                        order.insert(0, k)
+                    sack = tuple(tuple(received[j])
+                                 for j in order[:MAX_SACK_BLOCKS])
+
+                self.n_not_acked += 1
+                if in_order and not received_packet.syn_flag \
+                        and self.n_not_acked < self.ack_every:
+                    if self.delayed_ack_event is None:
+                        self.delayed_ack_event = self.em.enqueue(
+                            DelayedAck(t + self.ack_delay, self))
+                else:
+                    self.send_ack(t, sack)
 
             self.act(t)  # May want to send data here.
 
+    def send_ack(self, t, sack=None):
+        """Acknowledge everything received so far."""
+        if self.delayed_ack_event is not None:
+            self.em.cancel(self.delayed_ack_event)
+            self.delayed_ack_event = None
+        self.n_not_acked = 0
+
+        response_packet = \
+            self.new_packet(i=self.flow.get_packet_id(),
+                            flow=self.flow,
+                            sender=self.host,
+                            receiver=self.other_host,
+                            syn_flag=False,
+                            ack_flag=True,
+                            fin_flag=False,
+                            seq_number=self.send_next,
+                            ack_number=self.receive_next,
+                            size=CONTROL_PACKET_SIZE,
+                            sack=sack)
+
+        if self.trace:
+            self.trace(t, 'sends packet: {}', response_packet)
+
+        # Do NOT schedule a timeout, just send the packet.
+        self.send(t, response_packet)
+
+    def on_delayed_ack(self, t):
+        self.delayed_ack_event = None
+        self.send_ack(t)
+
+    def start_sack_recovery(self, t):
+        """Resend the holes the SACKs show, from the first unacknowledged
+        packet, which goes right away even when pacing."""
+        self.recovery_point = self.send_max
+        self.resend_next = self.send_first_unacked
+        self.cancel_rtt_sample()
+        self.resend_hole(t, self.send_first_unacked)
+        self.act(t)
+
     def retransmit(self, t):
         """Assuming the window size has been set correctly, retransmit from the
         first unacknowledged packet."""
         self.send_next = self.send_first_unacked
+        # The receiver may have dropped what it SACKed (RFC 2018).
+        self.sacked.clear()
+        self.recovery_point = None
         
         # Clear all ack timeout events, because we're starting from the first
         # unacknowledged packet anyway.
-        for _, event in self.ack_timeout_events.items():
-            event.invalidate()
-        self.ack_timeout_events.clear()
+        self.stop_all_timers()
+        # The ACKs we get next may be for the retransmissions.
+        self.cancel_rtt_sample()
 
         self.act(t)
 
@@ -300,35 +564,97 @@ class FlowEnd(object):
             assert False
 
         # Schedule an AckTimeout
-        ack_timeout_event = AckTimeout(t + self.ack_wait, self, self.send_next)
-        self.ack_timeout_events[self.send_next] = ack_timeout_event
-        self.em.enqueue(ack_timeout_event)
+        self.start_timer(t, self.send_next)
 
         # RTT sampling
         self.attempt_rtt_sample(t, p)
 
         # Update internal state.
         self.send_next += 1
+        self.send_max = max(self.send_max, self.send_next)
 
-        if self.debug:
-            print("t={}: {} sends packet: {}".format(round(t, 6), self, p))
+        if self.trace:
+            self.trace(t, 'sends packet: {}', p)
 
         # Send the packet.
         self.send(t, p)
 
     def send(self, t, p):
         # Send without acknowledgement processing.
-        self.host.send_packet(t, p)
         # update event manager count b/c no packet enqueue
         ### Per-flow send rate ###
-        self.em.log_it('FLOW|{}'.format(self.i),
-                       'T|{}|SEND|{}'.format(t, p.size))
+        # (Logged first: p may be dropped and released to the packet pool.)
+        self.em.log_it(self.log_name, 'SEND', t, p.size)
+        self.host.send_packet(t, p)
+
+    def start_timer(self, t, seq_number):
+        """Time out if seq_number isn't acknowledged in time."""
+        if self.timer_mode == 'per_packet':
+            self.ack_timeout_events[seq_number] = self.em.enqueue(
+                AckTimeout(t + self.ack_wait, self, seq_number))
+        elif self.rto_deadline is None:
+            self.restart_timer(t, seq_number)
+
+    def restart_timer(self, t, seq_number):
+        # Single timer mode only.
+        self.rto_deadline = t + self.ack_wait
+        self.timer_seq = seq_number
+        if self.rto_event is not None and self.rto_event_t <= self.rto_deadline:
+            return  # The pending event will push itself back.
+        if self.rto_event is not None:
+            self.em.cancel(self.rto_event)
+        self.rto_event_t = self.rto_deadline
+        self.rto_event = self.em.enqueue(
+            RetransmitTimer(self.rto_deadline, self))
+
+    def stop_timer(self, seq_number):
+        """Stop timing seq_number, e.g. because it will be retransmitted."""
+        if self.timer_mode == 'per_packet':
+            # Not timed if a cumulative ACK skipped past send_next after a
+            # go-back-N retransmission, so that seq_number was never resent.
+            handle = self.ack_timeout_events.pop(seq_number, None)
+            if handle is not None:
+                self.em.cancel(handle)
+        else:
+            self.rto_deadline = None
+
+    def stop_all_timers(self):
+        if self.timer_mode == 'per_packet':
+            for _, handle in self.ack_timeout_events.items():
+                self.em.cancel(handle)
+            self.ack_timeout_events.clear()
+        else:
+            self.rto_deadline = None
+
+    def on_retransmit_timer(self, t):
+        """The single timer's event fired."""
+        self.rto_event = None
+        if self.rto_deadline is None:
+            return  # Stopped
+        if self.rto_deadline > t:
+            # Restarted since this event was scheduled.
+            self.rto_event_t = self.rto_deadline
+            self.rto_event = self.em.enqueue(
+                RetransmitTimer(self.rto_deadline, self))
+            return
+        self.rto_deadline = None
+        self.on_ack_timeout(t, self.timer_seq)
+
+    def clear_redundant_timeouts(self, t, first_unacked_number):
+        if self.timer_mode == 'single':
+            # Restart the timer when the packet it guards is acknowledged.
+            if self.rto_deadline is not None \
+                    and first_unacked_number > self.timer_seq:
+                if first_unacked_number < self.send_next:
+                    self.restart_timer(t, first_unacked_number)
+                else:
+                    self.rto_deadline = None  # Nothing outstanding
+            return
 
-    def clear_redundant_timeouts(self, first_unacked_number):
         invalidated_seq_numbers = []
-        for seq_number, event in self.ack_timeout_events.items():
+        for seq_number, handle in self.ack_timeout_events.items():
             if seq_number < first_unacked_number:
-                event.invalidate()
+                self.em.cancel(handle)
                 invalidated_seq_numbers.append(seq_number)
 
         for seq_number in invalidated_seq_numbers:
@@ -353,6 +679,26 @@ class FlowEndAct(Event):
         self.flow_end.act(self.t)
 
 
+class PacingTimer(Event):
+    # When a pacing FlowEnd can send its next data packet.
+    def __init__(self, t, flow_end):
+        super().__init__(t)
+        self.flow_end = flow_end
+
+    def run(self):
+        self.flow_end.on_pacing_timer(self.t)
+
+
+class DelayedAck(Event):
+    # When a FlowEnd acknowledges the in-order packets it held an ACK for.
+    def __init__(self, t, flow_end):
+        super().__init__(t)
+        self.flow_end = flow_end
+
+    def run(self):
+        self.flow_end.on_delayed_ack(self.t)
+
+
 class AckTimeout(Event):
     def __init__(self, t, flow_end, seq_number):
         super().__init__(t)
@@ -363,12 +709,24 @@ class AckTimeout(Event):
         self.flow_end.on_ack_timeout(self.t, self.seq_number)
 
 
+class RetransmitTimer(Event):
+    # The single retransmission timer of a FlowEnd in 'single' timer mode.
+    def __init__(self, t, flow_end):
+        super().__init__(t)
+        self.flow_end = flow_end
+
+    def run(self):
+        self.flow_end.on_retransmit_timer(self.t)
+
+
 class Flow(object):
     def __init__(self, event_manager, i, src_host, dst_host, amount,
-                 start_delay, src_cc, debug=True):
+                 start_delay, src_cc, debug=False, **options):
+        # options (timer_mode, rto_initial, ...) are passed to both FlowEnds.
         self.debug = debug
         self.em = event_manager
         self.i = i
+        self.hash = zlib.crc32(i.encode())  # Picks among equal-cost paths
         self.src_host = src_host  # a Host
         self.dst_host = dst_host  # a Host
         self.amount = amount
@@ -381,7 +739,8 @@ class Flow(object):
                            other_host=self.dst_host,
                            amount=self.amount,
                            cc=src_cc,
-                           debug=self.debug)
+                           debug=self.debug,
+                           **options)
 
         self.dst = FlowEnd(event_manager=self.em,
                            i=i + 'DST',
@@ -390,7 +749,13 @@ class Flow(object):
                            other_host=self.src_host,
                            amount=0,
                            cc=StopAndWait(),
-                           debug=self.debug)
+                           debug=self.debug,
+                           **options)
+
+        # Window growth counts ACKs for as many packets as the other end
+        # acknowledges at once.
+        self.src.abc_limit = self.dst.ack_every
+        self.dst.abc_limit = self.src.ack_every
 
         self.em.register_flowend(self.src)
         self.em.register_flowend(self.dst)
@@ -404,8 +769,10 @@ class Flow(object):
         return self.counter
 
     def get_packet_id(self):
-        # Generates unique packet ids. Debugging purposes only.
-        return self.i + str(self.get_counter())
+        # Generates packet ids, unique within the flow. Debugging purposes
+        # only. Ints rather than strings like 'F17', which would be built for
+        # every packet.
+        return self.get_counter()
 
     def __eq__(self, other):
         return self.i == other.i if isinstance(other, Flow) else False
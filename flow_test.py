@@ -1,8 +1,8 @@
-from congestion_control import StopAndWait
+from congestion_control import StopAndWait, Reno
 from events import EventManager
 from host import Host
 from link import Link
-from flow import Flow
+from flow import Flow, add_interval, trim_intervals
 from packet import Packet, DATA_PACKET_SIZE, CONTROL_PACKET_SIZE
 
 class PacketRecorder:
@@ -29,13 +29,13 @@ em.run()
 # Packets sent by host 1
 p2_expect = [
     # SYN
-    Packet('F11', flow, host_1, host_2, syn_flag = True, ack_flag = False,
+    Packet(1, flow, host_1, host_2, syn_flag = True, ack_flag = False,
            fin_flag = False, seq_number = 0, ack_number = None, size = CONTROL_PACKET_SIZE),
     # ACK of SYN
-    Packet('F13', flow, host_1, host_2, syn_flag = False, ack_flag = True,
+    Packet(3, flow, host_1, host_2, syn_flag = False, ack_flag = True,
            fin_flag = False, seq_number = 1, ack_number = 1, size = CONTROL_PACKET_SIZE),
     # Data
-    Packet('F14', flow, host_1, host_2, syn_flag = False, ack_flag = True,
+    Packet(4, flow, host_1, host_2, syn_flag = False, ack_flag = True,
            fin_flag = False, seq_number = 1, ack_number = 1, size = DATA_PACKET_SIZE),
 ]
 print([str(p) for p in p2.packets])
@@ -46,12 +46,202 @@ assert p2.packets == p2_expect
 # Packets sent by host 2
 p1_expect = [
     # SYN+ACK
-    Packet('F12', flow, host_2, host_1, syn_flag = True, ack_flag = True,
+    Packet(2, flow, host_2, host_1, syn_flag = True, ack_flag = True,
            fin_flag = False, seq_number = 0, ack_number = 1, size = CONTROL_PACKET_SIZE),
     # Data ACK
-    Packet('F15', flow, host_2, host_1, syn_flag = False, ack_flag = True,
+    Packet(5, flow, host_2, host_1, syn_flag = False, ack_flag = True,
            fin_flag = False, seq_number = 1, ack_number = 2, size = CONTROL_PACKET_SIZE)
 ]
 print([str(p) for p in p1.packets])
 print([str(p) for p in p1_expect])
 assert p1.packets == p1_expect
+
+
+class DropOnce(PacketRecorder):
+    def __init__(self, next_component, seqs):
+        super().__init__(next_component)
+        self.seqs = set(seqs)  # Data packets to drop the first time
+
+    def on_reception(self, t, p):
+        if p.size == DATA_PACKET_SIZE and p.seq_number in self.seqs:
+            self.seqs.remove(p.seq_number)
+            return
+        super().on_reception(t, p)
+
+
+def spy(obj, name, record):
+    """Call record with the arguments of every call to obj.name, before the
+    call."""
+    method = getattr(obj, name)
+
+    def spied(*args):
+        record(*args)
+        return method(*args)
+    setattr(obj, name, spied)
+
+
+def reno(em):
+    return Reno(em, 'F1SRC')
+
+
+def make_flow(make_cc, n_data_packets, drop=(), rate=1e8, buffer_size=1e7,
+              **flow_options):
+    """
+    A flow of n_data_packets from H1 to H2, over 10 ms links of the given
+    rate and buffer size, whose congestion control is make_cc(em). The data
+    packets with seq numbers in drop are lost the first time. flow_options
+    are passed on to Flow. Return (em, flow, p1, p2, timeouts), where p1 and
+    p2 record the packets arriving at H1 and H2, and timeouts the seq numbers
+    the source timed out on.
+    """
+    em = EventManager(logging=False)
+    host_1 = Host(em, 'H1')
+    host_2 = Host(em, 'H2')
+    p1 = PacketRecorder(host_1)
+    p2 = DropOnce(host_2, drop)
+    host_1.link = Link(em, 'L1_a', host_1, p2, rate, 0.01, buffer_size)
+    host_2.link = Link(em, 'L1_b', host_2, p1, rate, 0.01, buffer_size)
+    flow = Flow(em, 'F1', host_1, host_2, n_data_packets * DATA_PACKET_SIZE,
+                1, make_cc(em), **flow_options)
+    timeouts = []
+    spy(flow.src, 'on_ack_timeout', lambda t, seq: timeouts.append(seq))
+    return em, flow, p1, p2, timeouts
+
+
+# A window of thousands of packets is sent in one go (act is iterative), or,
+# with pacing, spread over an RTT.
+class FixedWindow(StopAndWait):
+    def __init__(self, window_size):
+        self.window_size = window_size
+
+    def initial_cwnd(self):
+        return self.window_size
+
+    def posack(self, t, n_acked=1):
+        return self.window_size
+
+
+for pacing in [False, True]:
+    em, flow, _, _, _ = make_flow(lambda em: FixedWindow(3000), 5000,
+                                  rate=1e9, buffer_size=1e9, pacing=pacing)
+    sent = []
+    spy(flow.src, 'send', lambda t, p: sent.append((t, p.size)))
+    em.run()
+    assert flow.src.send_first_unacked == 5001
+    data = [t for t, size in sent if size == DATA_PACKET_SIZE]
+    if not pacing:
+        assert data[:3000] == [data[0]] * 3000
+    else:
+        # Paced at 3000 packets per srtt, which is the SYN's RTT until the
+        # first data packets are acknowledged.
+        syn_rtt = 2 * (0.01 + CONTROL_PACKET_SIZE / 1e9)
+        gaps = [b - a for a, b in zip(data[:3000], data[1:3000])]
+        assert all(abs(gap - syn_rtt / 3000) < 1e-12 for gap in gaps)
+
+
+# Intervals of seq#s
+intervals = []
+for seq in [5, 7, 6, 10, 3]:
+    add_interval(intervals, seq, seq + 1)
+assert intervals == [[3, 4], [5, 8], [10, 11]]
+assert add_interval(intervals, 4, 10) == 0 and intervals == [[3, 11]]
+trim_intervals(intervals, 6)
+assert intervals == [[6, 11]]
+trim_intervals(intervals, 11)
+assert intervals == []
+
+
+# Several losses in one window. With SACK the source resends just the lost
+# packets, within one RTT and without a timeout, and the destination only
+# remembers intervals of packets received out of order.
+for sack in [False, True]:
+    em, flow, _, p2, timeouts = make_flow(reno, 200, drop=[40, 42, 44, 50],
+                                          sack=sack)
+    max_above = [0]
+    spy(flow.dst, 'on_reception',
+        lambda t, p: max_above.append(len(flow.dst.received_above)))
+    em.run()
+    assert flow.dst.receive_next == 201 and not flow.dst.received_above
+    data = [p.seq_number for p in p2.packets if p.size == DATA_PACKET_SIZE]
+    resent = sorted(seq for seq in set(data) if data.count(seq) > 1)
+    if sack:
+        assert sorted(data) == list(range(1, 201)) and not timeouts
+        assert max(max_above) == 4
+    else:  # Go-back-N after a timeout
+        assert timeouts and len(resent) > 4
+
+
+# ACK policies. Acknowledging every 2nd packet halves the ACKs, and a lone
+# last packet is acknowledged after ack_delay. Packets out of order are still
+# acknowledged one by one, so losses are recovered by fast retransmit.
+for ack_every, drop in [(1, []), (2, []), (2, [40]), (2, [40, 42])]:
+    em, flow, p1, p2, timeouts = make_flow(reno, 101, drop=drop,
+                                           ack_every=ack_every,
+                                           ack_delay=0.05)
+    assert flow.src.abc_limit == ack_every
+    em.run()
+    assert flow.src.send_first_unacked == 102 and not timeouts
+    acks = [p for p in p1.packets if p.ack_flag and not p.syn_flag]
+    if ack_every == 1:
+        assert len(acks) == 101
+    elif not drop:
+        assert len(acks) == 51
+        # Packet 101 waited for the delayed ACK
+        assert [p.ack_number for p in acks][-2:] == [101, 102]
+    else:
+        ack_numbers = [p.ack_number for p in acks]
+        assert ack_numbers.count(40) >= 3
+        data = [p.seq_number for p in p2.packets if p.size == DATA_PACKET_SIZE]
+        assert sorted(data) == list(range(1, 102))
+
+
+# Late dupacks, after all the data was acked, do not resend anything.
+em, flow, _, _, _ = make_flow(reno, 10)
+em.run()
+assert flow.src.is_done() and flow.src.send_next == 11
+for i in range(3):
+    flow.src.on_reception(em.current_time, Packet(
+        1000 + i, flow, flow.dst_host, flow.src_host, syn_flag=False,
+        ack_flag=True, fin_flag=False, seq_number=flow.dst.send_next,
+        ack_number=11, size=CONTROL_PACKET_SIZE))
+assert flow.src.send_next == 11
+
+
+# A partial ACK in the middle of a SACK recovery, past the holes resent so
+# far. in_flight does not count the packets it acknowledged as lost, and
+# the source never sends more than its window.
+def sacked_in_flight(flow_end):
+    """in_flight, from the sets of packets SACKed and known lost."""
+    outstanding = set(range(flow_end.send_first_unacked, flow_end.send_next))
+    if flow_end.recovery_point is None or not flow_end.sacked:
+        return len(outstanding)
+    sacked = {seq for start, end in flow_end.sacked
+              for seq in range(start, end)}
+    resent = set(range(flow_end.resend_next))
+    lost = {seq for seq in outstanding if seq < flow_end.sacked[-1][1]} \
+        - sacked - resent
+    return len(outstanding - lost)
+
+
+em, flow, _, _, _ = make_flow(reno, 200, drop=[60, 90, 120], sack=True)
+src = flow.src
+partial_acks = []
+
+
+def check_act(t):
+    if src.recovery_point is not None and src.sacked:
+        if src.resend_next < src.send_first_unacked:
+            partial_acks.append(t)
+        assert src.in_flight() == sacked_in_flight(src)
+
+
+def check_send_data_packet(t):
+    # Except the first resend of a recovery, which goes right away
+    if not src.send_next == src.resend_next == src.send_first_unacked:
+        assert sacked_in_flight(src) < src.window_size
+
+
+spy(src, 'act', check_act)
+spy(src, 'send_data_packet', check_send_data_packet)
+em.run()
+assert partial_acks and flow.dst.receive_next == 201
@@ -2,11 +2,14 @@ from packet import Packet, LinkStatePacket
 
 
 class Host(object):
-    def __init__(self, event_manager, i, debug=True):
+    def __init__(self, event_manager, i, debug=False):
         self.em = event_manager
         self.i = i  # string ID; unique for all components
+        self.index = self.em.new_index('HOST')  # Dense int ID, for tables
         self.link = None  # link that this host can access
         self.debug = debug
+        self.log_name = 'HOST|{}'.format(i)  # Component name in the log
+        self.pool = self.em.packet_pool
 
     def add_link(self, link):
         if self.link is not None:
@@ -26,14 +29,16 @@ class Host(object):
             p.flow.dst.on_reception(t, p)
 
         # Per-host receive rate #
-        self.em.log_it('HOST|{}'.format(self.i), 'T|{}|RCVE|{}'.
-                       format(t, p.size))
+        self.em.log_it(self.log_name, 'RCVE', t, p.size)
+
+        if self.pool is not None:
+            self.pool.release(p)  # Delivered
 
     def send_packet(self, t, response_packet):
-        self.link.on_packet_entry(t, response_packet)
         # Per-host send rate #
-        self.em.log_it('HOST|{}'.format(self.i), 'T|{}|SEND|{}'.
-                       format(t, response_packet.size))
+        # (Logged first: the link may drop the packet and release it.)
+        self.em.log_it(self.log_name, 'SEND', t, response_packet.size)
+        self.link.on_packet_entry(t, response_packet)
 
     def __hash__(self):
         return hash(self.i)
@@ -1,14 +1,15 @@
 from events import Event
 from collections import deque
-from packet import LinkStatePacket
+from packet import Packet, LinkStatePacket
+from tracing import INFO
 
 class Link(object):
     def __init__(self, event_manager, i, source, dest, rate, delay,
-                 buffer_capacity, debug=True):
-        self.debug = debug
+                 buffer_capacity, debug=False):
 
         self.em = event_manager
         self.i = i
+        self.index = self.em.new_index('LINK')  # Dense int ID
         self.source = source  # Each end is either a router or a host
         self.dest = dest
         self.rate = rate  # bits per second
@@ -20,6 +21,13 @@ class Link(object):
         self.buffer_capacity = buffer_capacity  # bits
 
         self.interval_usage = 0 #total buffer usage since last linkstate req
+        self.bits_out = 0  # Bits that went through, for the utilization
+        self.n_lost = 0  # Packets dropped because the buffer was full
+
+        self.log_name = 'LINK|{}'.format(i)  # Component name in the log
+        self.trace = self.em.tracer.bind('LINK', i, force=debug)
+        self.trace_info = self.em.tracer.bind('LINK', i, INFO, force=debug)
+        self.pool = self.em.packet_pool
         
     def set_usable(self, usable_status):
         #  can simulate a physical link cut
@@ -27,27 +35,38 @@ class Link(object):
 
     def on_packet_entry(self, t, p):
         if not self.usable:
-            if self.debug:
-                print("t={}: Link {} disabled.".format(round(t, 6), self))
+            if self.trace_info:
+                self.trace_info(t, 'disabled, dropped {}', p)
+            self.release(p)
             return  # Packet loss.
         if self.buffer_usage + p.size > self.buffer_capacity:
-            if self.debug:
-                print("t={}: Link {} lost a packet.".format(round(t, 6), self))
+            if self.trace_info:
+                self.trace_info(t, 'buffer full, lost {}', p)
             ### Per-link packet loss ###
-            self.em.log_it('LINK|{}'.format(self.i), 'T|{}|LOSS|1'.format(t))
+            self.em.log_it(self.log_name, 'LOSS', t, 1)
+            self.n_lost += 1
+            self.release(p)
             return  # Packet loss.
 
-        self.buffer.append(p)
         self.update_buffer_usage(t, p.size)
         self.interval_usage += p.size
         
-        if self.debug and type(p) is not LinkStatePacket:
-            print('t={}, Link {} enqueueing packet into buffer: {}'.
-                  format(round(t, 6), self, p.i))
+        if self.trace and type(p) is not LinkStatePacket:
+            self.trace(t, 'enqueued packet {} into buffer', p.i)
+
+        self.enqueue_packet(t, p)
 
+    def enqueue_packet(self, t, p):
+        # Put an accepted packet into the buffer.
+        self.buffer.append(p)
         if len(self.buffer) == 1: # First packet
             self.transmit_next_packet(t)
 
+    def release(self, p):
+        # Return a dropped packet to the pool.
+        if self.pool is not None and type(p) is Packet:
+            self.pool.release(p)
+
     def transmit_next_packet(self, t):
         # Only pay the transmission delay here.
         p = self.buffer[0]
@@ -61,19 +80,29 @@ class Link(object):
         if len(self.buffer) > 0:
             self.transmit_next_packet(t)
 
+    def buffer_usage_at(self, t):
+        """Bits in the buffer at time t, the current time. Use it rather
+        than buffer_usage from outside the link."""
+        return self.buffer_usage
+
     def update_buffer_usage(self, t, amount):
         self.buffer_usage += amount
         ### Per-link buffer occupancy ###
-        self.em.log_it('LINK|{}'.format(self.i), 'T|{}|BUFF|{}'.format(t, amount))
+        self.em.log_it(self.log_name, 'BUFF', t, amount)
 
     def on_packet_exit(self, t, exiting_packet):
-        if self.debug and type(exiting_packet) is not LinkStatePacket:
-            print("t={}: Link {} packet exit, details: {}".
-                    format(round(t, 6), self, exiting_packet))
+        if self.trace and type(exiting_packet) is not LinkStatePacket:
+            self.trace(t, 'packet exit: {}', exiting_packet)
 
-        self.dest.on_reception(t, exiting_packet)
         ### Per-link flow rate ###
-        self.em.log_it('LINK|{}'.format(self.i), 'T|{}|FLOW|{}'.format(t, exiting_packet.size))
+        # (Logged first: a host may release the packet to the pool.)
+        self.em.log_it(self.log_name, 'FLOW', t, exiting_packet.size)
+        self.bits_out += exiting_packet.size
+        self.dest.on_reception(t, exiting_packet)
+
+    def utilization(self, t):
+        """Fraction of the link's capacity used from time 0 to t."""
+        return self.bits_out / (self.rate * t) if t > 0 else 0
 
     def __str__(self):
         return "{} ({} -> {})".format(self.i, self.source.i, self.dest.i)
@@ -85,6 +114,147 @@ class Link(object):
         return hash(self.i)
 
 
+class PipelineLink(Link):
+    """
+    A link with the same behavior as Link, but that keeps at most one pending
+    event, a LinkStep, instead of one event per packet in transmission or in
+    flight. Packets in flight are kept in a deque in order of exit time,
+    which is their release order since the delay is the same for all of
+    them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release_t = None  # When the head of the buffer is released
+        self.in_flight = deque()  # (exit time, packet), in exit order
+        self.step = None  # The pending LinkStep
+        self.step_handle = None
+        self.spare_step = None  # A LinkStep that ran and can be reused
+        self.stepping = False  # Whether on_step is running
+
+    def transmit_next_packet(self, t):
+        # Only pay the transmission delay here.
+        self.release_t = t + self.buffer[0].size / self.rate
+        if not self.stepping:  # Otherwise on_step schedules the next step.
+            self.schedule_step()
+
+    def schedule_step(self):
+        """Make sure a LinkStep is pending for the next release or exit."""
+        next_t = self.release_t
+        if self.in_flight:
+            exit_t = self.in_flight[0][0]
+            if next_t is None or exit_t < next_t:
+                next_t = exit_t
+        elif next_t is None:
+            return
+        if self.step is not None:
+            if self.step.t <= next_t:
+                return
+            self.em.cancel(self.step_handle)
+        step = self.spare_step
+        if step is None:
+            step = LinkStep(next_t, self)
+        else:
+            self.spare_step = None
+            step.t = next_t
+        self.step = step
+        self.step_handle = self.em.enqueue(step)
+
+    def on_step(self, t):
+        self.spare_step = self.step
+        self.step = None
+        self.stepping = True
+        in_flight = self.in_flight
+        while True:
+            if in_flight and in_flight[0][0] <= t:
+                self.on_packet_exit(t, in_flight.popleft()[1])
+            elif self.release_t is not None and self.release_t <= t:
+                self.release_t = None
+                self.on_buffer_release(t)
+            else:
+                break
+        self.stepping = False
+        self.schedule_step()
+
+    def on_buffer_release(self, t):
+        p = self.buffer.popleft()
+        self.update_buffer_usage(t, -p.size)
+
+        self.in_flight.append((t + self.delay, p))
+        if len(self.buffer) > 0:
+            self.transmit_next_packet(t)
+
+
+class FastForwardLink(Link):
+    """
+    A link with the same behavior as Link, without release events. Since the
+    buffer is FIFO and the rate is fixed, a packet's release and exit times
+    are known when it enters the link. Releases are applied (and logged, at
+    their own times) lazily, whenever the buffer occupancy matters: when a
+    packet enters or exits. The only event is a single pending LinkStep for
+    the next exit. buffer_usage lags behind in between, so readers from
+    outside the link use buffer_usage_at, and the pending releases are
+    applied when the simulation stops.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        del self.buffer  # The buffered packets are in in_flight.
+        self.releases = deque()  # (release time, size) of buffered packets
+        self.free_t = 0  # When the last buffered packet is released
+        self.in_flight = deque()  # (exit time, packet), in exit order
+        self.step = None  # The LinkStep for the next exit, if pending
+        self.em.on_stop.append(self.retire)
+
+    def retire(self, t):
+        """Release the packets whose release time is before t. A release at
+        exactly t comes after what else happens at t, as with Link, whose
+        release events are usually scheduled later than the others."""
+        releases = self.releases
+        while releases and releases[0][0] < t:
+            release_t, size = releases.popleft()
+            self.update_buffer_usage(release_t, -size)
+
+    def buffer_usage_at(self, t):
+        self.retire(t)
+        return self.buffer_usage
+
+    def on_packet_entry(self, t, p):
+        self.retire(t)
+        super().on_packet_entry(t, p)
+
+    def enqueue_packet(self, t, p):
+        # Transmission starts when the previous packet is released.
+        release_t = max(t, self.free_t) + p.size / self.rate
+        self.free_t = release_t
+        self.releases.append((release_t, p.size))
+        self.in_flight.append((release_t + self.delay, p))
+        if self.step is None:
+            self.step = LinkStep(release_t + self.delay, self)
+            self.em.enqueue(self.step)
+
+    def on_step(self, t):
+        self.retire(t)
+        in_flight = self.in_flight
+        while in_flight and in_flight[0][0] <= t:
+            self.on_packet_exit(t, in_flight.popleft()[1])
+        if in_flight:
+            # Exits only get later, so the pending step never moves earlier.
+            self.step.t = in_flight[0][0]
+            self.em.enqueue(self.step)
+        else:
+            self.step = None
+
+
+# Link implementations selectable by name, e.g. a link's "engine" in the
+# network JSON
+LINK_ENGINES = {
+    'events': Link,
+    'pipeline': PipelineLink,
+    'fastforward': FastForwardLink,
+}
+
+
 class LinkBufferRelease(Event):
     # When a packet is released from the link's buffer.
     def __init__(self, t, link):
@@ -114,3 +284,13 @@ class LinkSetUsable(Event):
     
     def run(self):
         self.link.set_usable(self.usable)
+
+
+class LinkStep(Event):
+    # The next packet release and/or exit of a PipelineLink.
+    def __init__(self, t, link):
+        super().__init__(t)
+        self.link = link
+
+    def run(self):
+        self.link.on_step(self.t)
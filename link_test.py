@@ -1,6 +1,6 @@
-from events import EventManager
+from events import Event, EventManager
 from host import Host
-from link import Link
+from link import Link, LINK_ENGINES
 from flow import Flow
 from packet import Packet, DATA_PACKET_SIZE, CONTROL_PACKET_SIZE
 
@@ -33,3 +33,53 @@ l.on_packet_entry(0, Packet('P5', f, h1, h2, False, False, False, 5, 0, DATA_PAC
 # print(h2.packets, h2.times)
 em.run(stop_when_flows_done=False)
 assert h2.times == [11, 12, 13, 14, 15]
+
+
+class PacketEntry(Event):
+    def __init__(self, t, link, packet):
+        super().__init__(t)
+        self.link = link
+        self.packet = packet
+
+    def run(self):
+        self.link.on_packet_entry(self.t, self.packet)
+
+
+class BufferProbe(Event):
+    def __init__(self, t, link, usages):
+        super().__init__(t)
+        self.link = link
+        self.usages = usages
+
+    def run(self):
+        self.usages.append(self.link.buffer_usage_at(self.t))
+
+# The other engines deliver at the same times with one pending event
+# instead of one per packet in transmission or in flight
+peak_size = {}
+for engine in LINK_ENGINES:
+    em = EventManager(logging=False)
+    h2 = MockHost('H2')
+    l = LINK_ENGINES[engine](em, 'L', h1, h2, DATA_PACKET_SIZE, 10,
+                             DATA_PACKET_SIZE * 10, debug=False)
+    # A burst, another packet after the link was idle, and one arriving
+    # while the previous one is in flight
+    for k in range(1, 6):
+        l.on_packet_entry(0, Packet(k, f, h1, h2, False, False, False, k, 0,
+                                    DATA_PACKET_SIZE))
+    for k, t in [(6, 20), (7, 21.5)]:
+        em.enqueue(PacketEntry(t, l, Packet(k, f, h1, h2, False, False,
+                                            False, k, 0, DATA_PACKET_SIZE)))
+    # The buffer as seen from outside the link, between its own events
+    usages = []
+    for t in [2.5, 20.5, 21.7, 25]:
+        em.enqueue(BufferProbe(t, l, usages))
+    em.run(stop_when_flows_done=False)
+    assert h2.times == [11, 12, 13, 14, 15, 31, 32.5], (engine, h2.times)
+    assert usages == [3 * DATA_PACKET_SIZE, DATA_PACKET_SIZE,
+                      DATA_PACKET_SIZE, 0], (engine, usages)
+    assert [p.i for p in h2.packets] == list(range(1, 8))
+    assert l.buffer_usage == 0
+    peak_size[engine] = em.scheduler.stats()['peak_size']
+assert peak_size['pipeline'] < peak_size['events']
+assert peak_size['fastforward'] < peak_size['events']
@@ -0,0 +1,151 @@
+import itertools
+import os
+import numpy as np
+from logger import HEADER, MAGIC, read_binary_header
+
+# Binary log records (see logger.py)
+RECORD_DTYPE = np.dtype([('t', '<f8'), ('component', '<u4'),
+                         ('metric', '<u4'), ('value', '<f8')])
+
+# Fields of a text log line, e.g. LINK|L1_a|T|1.25|BUFF|8192. The widths of
+# the names are multiples of 8 bytes (see _intern); longer names are read
+# again with wider fields (see _load_text_lines).
+TEXT_DTYPE = np.dtype([('kind', 'S8'), ('component', 'S64'), ('T', 'S1'),
+                       ('t', 'f8'), ('metric', 'S32'), ('value', 'f8')])
+TEXT_NAMES = ('kind', 'component', 'metric')
+
+# Lines of a text log parsed at a time
+TEXT_CHUNK_LINES = 1 << 16
+
+
+def latest_log(directory='.'):
+    """Name of the most recent log_<timestamp>.txt or .bin file."""
+    file_names = [f for f in os.listdir(directory)
+                  if os.path.isfile(os.path.join(directory, f))
+                  and f.startswith('log_')
+                  and (f.endswith('.txt') or f.endswith('.bin'))]
+    if not file_names:
+        raise ValueError('No log files')
+    return os.path.join(directory, max(file_names))
+
+
+def load_log(file_name):
+    """
+    Load a text or binary log.
+    Return data, where data[kind][component][metric] is an (n, 2) array
+    whose rows are (time, value), in the order they were logged.
+    e.g. data['LINK']['L1_a']['BUFF'].
+    """
+    with open(file_name, 'rb') as f:
+        is_binary = f.read(len(MAGIC)) == MAGIC
+    if is_binary:
+        return load_binary_log(file_name)
+    return load_text_log(file_name)
+
+
+def load_binary_log(file_name):
+    with open(file_name, 'rb') as f:
+        components, metrics, n_records = read_binary_header(f)
+    data = {}
+    if not n_records:
+        return data
+    records = np.memmap(file_name, dtype=RECORD_DTYPE, mode='r',
+                        offset=HEADER.size, shape=(n_records,))
+    keys = records['component'].astype(np.int64) * len(metrics) \
+        + records['metric']
+    for key, index in _group(keys):
+        c, m = divmod(int(key), len(metrics))
+        kind, component = components[c].split('|', 1)
+        _add(data, kind, component, metrics[m],
+             records['t'][index], records['value'][index])
+    return data
+
+
+def load_text_log(file_name):
+    chunks = {}  # Map of (kind, component, metric) -> list of arrays
+    with open(file_name) as f:
+        while True:
+            lines = list(itertools.islice(f, TEXT_CHUNK_LINES))
+            if not lines:
+                break
+            # Skip header and footer lines
+            lines = [line for line in lines if line[0] != '-']
+            if not lines:
+                continue
+            records = _load_text_lines(lines)
+            kind_ids, kinds = _intern(records['kind'])
+            component_ids, components = _intern(records['component'])
+            metric_ids, metrics = _intern(records['metric'])
+            keys = (kind_ids * len(components) + component_ids) \
+                * len(metrics) + metric_ids
+            for key, index in _group(keys):
+                k, m = divmod(int(key), len(metrics))
+                k, c = divmod(k, len(components))
+                rows = np.empty((len(index), 2))
+                rows[:, 0] = records['t'][index]
+                rows[:, 1] = records['value'][index]
+                name = (kinds[k].decode(), components[c].decode(),
+                        metrics[m].decode())
+                chunks.setdefault(name, []).append(rows)
+
+    data = {}
+    for (kind, component, metric), rows in chunks.items():
+        data.setdefault(kind, {}).setdefault(component, {})[metric] = \
+            np.concatenate(rows)
+    return data
+
+
+def _load_text_lines(lines):
+    """Parse text log lines into a TEXT_DTYPE-like array. numpy cuts off
+    strings longer than their field, so if a name fills its field, the lines
+    are parsed again with fields as wide as the longest line."""
+    records = np.loadtxt(lines, dtype=TEXT_DTYPE, delimiter='|',
+                         comments=None, ndmin=1)
+    for name in TEXT_NAMES:
+        column = np.ascontiguousarray(records[name])
+        if column.view(np.uint8).reshape(len(column), -1)[:, -1].any():
+            width = -(-max(map(len, lines)) // 8) * 8
+            dtype = np.dtype([
+                (field, 'S{}'.format(width) if field in TEXT_NAMES
+                 else TEXT_DTYPE[field]) for field in TEXT_DTYPE.names])
+            return np.loadtxt(lines, dtype=dtype, delimiter='|',
+                              comments=None, ndmin=1)
+    return records
+
+
+def _hash_multipliers(n_words):
+    """Odd multipliers for hashing n_words 8-byte words of fixed-width
+    strings."""
+    return np.random.RandomState(143).randint(
+        0, 1 << 62, size=n_words, dtype=np.uint64) * 2 + 1
+
+
+def _intern(column):
+    """Number the distinct strings in a fixed-width bytes array, whose
+    width is a multiple of 8. Return (ids, names) with column == names[ids].
+    Hashing the strings to integers first is much faster than sorting them."""
+    words = np.ascontiguousarray(column).view(np.uint64) \
+        .reshape(len(column), -1)
+    hashes = (words * _hash_multipliers(words.shape[1])).sum(axis=1)
+    _, first, ids = np.unique(hashes, return_index=True, return_inverse=True)
+    names = column[first]
+    if not np.array_equal(names[ids], column):  # Hash collision
+        names, ids = np.unique(column, return_inverse=True)
+    return ids.ravel(), names
+
+
+def _group(keys):
+    """Yield (key, indices of key in keys) for each distinct key. Indices are
+    in increasing order."""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    for index in np.split(order, starts):
+        yield keys[index[0]], index
+
+
+def _add(data, kind, component, metric, t, value):
+    rows = np.empty((len(t), 2))
+    rows[:, 0] = t
+    rows[:, 1] = value
+    data.setdefault(kind, {}).setdefault(component, {})[metric] = rows
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import numpy as np
+import log_loader
+from log_loader import load_log
+from logger import TextLogger, BinaryLogger
+
+# Names longer than the text fields, the last two only differ at the end
+COMPONENTS = ['LINK|L1_a', 'FLOW|F1SRC', 'HOST|H1',
+              'LINK|' + 'x' * 70 + 'a', 'LINK|' + 'x' * 70 + 'b']
+METRICS = ['BUFF', 'SEND', 'M' * 40 + '1', 'M' * 40 + '2']
+
+rng = np.random.RandomState(0)
+records = []
+for i in range(200):
+    value = int(rng.randint(-10000, 10000)) if i % 3 else float(rng.rand())
+    records.append((COMPONENTS[rng.randint(len(COMPONENTS))],
+                    METRICS[rng.randint(len(METRICS))], i * 0.01, value))
+
+# Expected arrays, in logging order
+expected = {}
+for component, metric, t, value in records:
+    kind, name = component.split('|', 1)
+    expected.setdefault(kind, {}).setdefault(name, {}) \
+        .setdefault(metric, []).append((t, value))
+
+
+def assert_equal(data, expected):
+    assert sorted(data) == sorted(expected)
+    for kind in expected:
+        assert sorted(data[kind]) == sorted(expected[kind])
+        for name in expected[kind]:
+            assert sorted(data[kind][name]) == sorted(expected[kind][name])
+            for metric, rows in expected[kind][name].items():
+                assert np.array_equal(data[kind][name][metric],
+                                      np.array(rows))
+
+
+with tempfile.TemporaryDirectory() as d:
+    text_file = os.path.join(d, 'log.txt')
+    bin_file = os.path.join(d, 'log.bin')
+    text_logger = TextLogger(text_file)
+    bin_logger = BinaryLogger(bin_file, chunk_records=16)
+    for record in records:
+        text_logger.log(*record)
+        bin_logger.log(*record)
+    text_logger.close()
+    bin_logger.close()
+
+    assert_equal(load_log(bin_file), expected)
+    assert_equal(load_log(text_file), expected)
+
+    # Text logs are parsed in chunks, which split the series. Some chunks
+    # only have names that fit in the fields, and the header and footer
+    # lines make others shorter.
+    for chunk_lines in [1, 2, 7, 64]:
+        log_loader.TEXT_CHUNK_LINES = chunk_lines
+        assert_equal(load_log(text_file), expected)
+
+    # Empty logs
+    TextLogger(text_file).close()
+    BinaryLogger(bin_file).close()
+    assert load_log(text_file) == {} and load_log(bin_file) == {}
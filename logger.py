@@ -0,0 +1,145 @@
+import argparse
+import datetime
+import json
+import struct
+
+# A log record is (component, metric, t, value), e.g.
+# ('LINK|L1_a', 'BUFF', 1.25, 8192). The text format has one line per record,
+#     LINK|L1_a|T|1.25|BUFF|8192
+# between header and footer lines that start with '-'.
+
+# Binary format: a 16-byte header (MAGIC, record size as uint32, 4 bytes
+# padding), then fixed-width little-endian records
+#     t (float64), component id (uint32), metric id (uint32), value (float64)
+# then a JSON footer {"components": [...], "metrics": [...]} mapping ids to
+# names, then the number of records as a uint64. The records can be read
+# directly with numpy, see RECORD_DTYPE in log_loader.py.
+MAGIC = b'NSIMLOG1'
+HEADER = struct.Struct('<8sI4x')
+RECORD = struct.Struct('<dIId')
+TRAILER = struct.Struct('<Q')
+
+
+class TextLogger(object):
+    """Writes the pipe-delimited text log."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.file = open(file_name, 'w')
+        print('-' * 8, str(datetime.datetime.now()), '-' * 8, file=self.file)
+        print('-' * 8, 'BEGIN RUN', '-' * 8, file=self.file)
+
+    def log(self, component, metric, t, value):
+        self.file.write('{}|T|{}|{}|{}\n'.format(component, t, metric, value))
+
+    def close(self):
+        print('-' * 8, 'END RUN', '-' * 8, file=self.file)
+        self.file.close()
+
+
+class BinaryLogger(object):
+    """Writes the binary log. Component and metric names are interned to
+    small integers, and records are buffered and written chunk_records at a
+    time."""
+
+    def __init__(self, file_name, chunk_records=1 << 16):
+        self.file_name = file_name
+        self.file = open(file_name, 'wb')
+        self.file.write(HEADER.pack(MAGIC, RECORD.size))
+        self.components = {}  # Map of name -> id
+        self.metrics = {}
+        self.buffer = bytearray()
+        self.chunk_bytes = chunk_records * RECORD.size
+        self.n_records = 0
+
+    def log(self, component, metric, t, value):
+        c = self.components.get(component)
+        if c is None:
+            c = self.components[component] = len(self.components)
+        m = self.metrics.get(metric)
+        if m is None:
+            m = self.metrics[metric] = len(self.metrics)
+        self.buffer += RECORD.pack(t, c, m, value)
+        self.n_records += 1
+        if len(self.buffer) >= self.chunk_bytes:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        names = {
+            'components': sorted(self.components, key=self.components.get),
+            'metrics': sorted(self.metrics, key=self.metrics.get),
+        }
+        self.file.write(json.dumps(names).encode())
+        self.file.write(TRAILER.pack(self.n_records))
+        self.file.close()
+
+
+# Log formats selectable by name, e.g. EventManager(log_format='binary')
+LOGGERS = {
+    'text': (TextLogger, '.txt'),
+    'binary': (BinaryLogger, '.bin'),
+}
+
+
+def read_binary_header(f):
+    """Read the layout of an open binary log. Return (components, metrics,
+    n_records); the records start at offset HEADER.size."""
+    magic, record_size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError('Not a binary simulator log')
+    f.seek(-TRAILER.size, 2)
+    end = f.tell()
+    n_records, = TRAILER.unpack(f.read(TRAILER.size))
+    footer_start = HEADER.size + n_records * RECORD.size
+    f.seek(footer_start)
+    names = json.loads(f.read(end - footer_start).decode())
+    return names['components'], names['metrics'], n_records
+
+
+def iter_binary(file_name, chunk_records=1 << 16):
+    """Yield the (component, metric, t, value) records of a binary log."""
+    with open(file_name, 'rb') as f:
+        components, metrics, n_records = read_binary_header(f)
+        f.seek(HEADER.size)
+        while n_records:
+            n = min(n_records, chunk_records)
+            for t, c, m, value in RECORD.iter_unpack(f.read(n * RECORD.size)):
+                yield components[c], metrics[m], t, value
+            n_records -= n
+
+
+def format_value(value):
+    # Values are stored as floats; counts and sizes were logged as ints.
+    return int(value) if value.is_integer() else value
+
+
+def binary_to_text(bin_file, text_file):
+    """Convert a binary log to the text format. The only difference from a
+    text log of the same run is the header's timestamp, and that integral
+    values are always written as ints."""
+    with open(text_file, 'w') as out:
+        print('-' * 8, 'CONVERTED FROM', bin_file, '-' * 8, file=out)
+        print('-' * 8, 'BEGIN RUN', '-' * 8, file=out)
+        for component, metric, t, value in iter_binary(bin_file):
+            out.write('{}|T|{}|{}|{}\n'
+                      .format(component, t, metric, format_value(value)))
+        print('-' * 8, 'END RUN', '-' * 8, file=out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert a binary log to the text log format.')
+    parser.add_argument('bin_file', type=str, help='Binary log file')
+    parser.add_argument('text_file', type=str, nargs='?',
+                        help='Output file (default: bin_file with .txt)')
+    args = parser.parse_args()
+    text_file = args.text_file
+    if text_file is None:
+        text_file = args.bin_file.rsplit('.', 1)[0] + '.txt'
+    binary_to_text(args.bin_file, text_file)
+    print('Wrote', text_file)
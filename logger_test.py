@@ -0,0 +1,76 @@
+import os
+import tempfile
+from logger import (TextLogger, BinaryLogger, MAGIC, HEADER, RECORD,
+                    read_binary_header, iter_binary, binary_to_text)
+
+RECORDS = [
+    ('LINK|L1_a', 'BUFF', 0.0, 8192),
+    ('FLOW|F1SRC', 'WINDOW', 0.25, 1),
+    ('LINK|L1_a', 'SEND', 0.5, 8192),
+    ('FLOW|F1SRC', 'RTT', 0.75, 0.0215),
+    ('LINK|L1_a', 'BUFF', 1.0, -8192),
+    ('HOST|H1', 'SEND', 1.25, 512),
+]
+
+
+def body(text_file):
+    """Lines of a text log between its BEGIN RUN and END RUN lines."""
+    with open(text_file) as f:
+        lines = f.read().splitlines()
+    assert lines[1] == '-' * 8 + ' BEGIN RUN ' + '-' * 8
+    assert lines[-1] == '-' * 8 + ' END RUN ' + '-' * 8
+    return lines[2:-1]
+
+
+with tempfile.TemporaryDirectory() as d:
+    text_file = os.path.join(d, 'log.txt')
+    bin_file = os.path.join(d, 'log.bin')
+    converted_file = os.path.join(d, 'converted.txt')
+
+    # Both formats log the same run. Flushing every 4 records splits the
+    # binary records into chunks.
+    text_logger = TextLogger(text_file)
+    bin_logger = BinaryLogger(bin_file, chunk_records=4)
+    for record in RECORDS:
+        text_logger.log(*record)
+        bin_logger.log(*record)
+    text_logger.close()
+    bin_logger.close()
+
+    # Header, then fixed-width records with names interned in order of
+    # first use
+    with open(bin_file, 'rb') as f:
+        assert HEADER.unpack(f.read(HEADER.size)) == (MAGIC, RECORD.size)
+        assert RECORD.unpack(f.read(RECORD.size)) == (0.0, 0, 0, 8192)
+        assert RECORD.unpack(f.read(RECORD.size)) == (0.25, 1, 1, 1)
+        f.seek(0)
+        components, metrics, n_records = read_binary_header(f)
+    assert components == ['LINK|L1_a', 'FLOW|F1SRC', 'HOST|H1']
+    assert metrics == ['BUFF', 'WINDOW', 'SEND', 'RTT']
+    assert n_records == len(RECORDS)
+    assert os.path.getsize(bin_file) > HEADER.size + n_records * RECORD.size
+
+    # Reading back, in chunks that do not line up with the writer's
+    for chunk_records in [1, 4, 1 << 16]:
+        assert list(iter_binary(bin_file, chunk_records)) == RECORDS
+
+    # The converted log has the same records as the text log
+    binary_to_text(bin_file, converted_file)
+    assert body(converted_file) == body(text_file)
+    assert body(text_file)[0] == 'LINK|L1_a|T|0.0|BUFF|8192'
+
+    # An empty log
+    BinaryLogger(bin_file).close()
+    with open(bin_file, 'rb') as f:
+        assert read_binary_header(f) == ([], [], 0)
+    assert list(iter_binary(bin_file)) == []
+    binary_to_text(bin_file, converted_file)
+    assert body(converted_file) == []
+
+    # Anything else is rejected
+    try:
+        with open(text_file, 'rb') as f:
+            read_binary_header(f)
+        assert False, 'A text log read as a binary log'
+    except ValueError:
+        pass
@@ -2,19 +2,56 @@ DATA_PACKET_SIZE = 8192
 CONTROL_PACKET_SIZE = 512
 
 
+# Bits of Packet.flags
+SYN = 1
+ACK = 2
+FIN = 4
+
+
 class Packet(object):
+    # Slots instead of a per-packet __dict__, and the three flags packed into
+    # one int: there are a lot of packets.
+    __slots__ = ('i', 'flow', 'sender', 'receiver', 'flags', 'seq_number',
+                 'ack_number', 'size', 'sack')
+
     def __init__(self, i, flow, sender, receiver, syn_flag, ack_flag, fin_flag,
-                 seq_number, ack_number, size):
-        self.i = i
+                 seq_number, ack_number, size, sack=None):
+        self.i = i  # int, unique within the flow (see Flow.get_packet_id)
         self.flow = flow
         self.sender = sender
         self.receiver = receiver
-        self.syn_flag = syn_flag
-        self.ack_flag = ack_flag
-        self.fin_flag = fin_flag
+        self.flags = (SYN if syn_flag else 0) | (ACK if ack_flag else 0) \
+            | (FIN if fin_flag else 0)
         self.seq_number = seq_number
         self.ack_number = ack_number
         self.size = size
+        # SACK blocks of an ACK: tuple of (first seq#, last seq# + 1) of
+        # received packets above ack_number, or None
+        self.sack = sack
+
+    @property
+    def syn_flag(self):
+        return bool(self.flags & SYN)
+
+    @syn_flag.setter
+    def syn_flag(self, value):
+        self.flags = self.flags | SYN if value else self.flags & ~SYN
+
+    @property
+    def ack_flag(self):
+        return bool(self.flags & ACK)
+
+    @ack_flag.setter
+    def ack_flag(self, value):
+        self.flags = self.flags | ACK if value else self.flags & ~ACK
+
+    @property
+    def fin_flag(self):
+        return bool(self.flags & FIN)
+
+    @fin_flag.setter
+    def fin_flag(self, value):
+        self.flags = self.flags | FIN if value else self.flags & ~FIN
 
     def __str__(self):
         return "(id: {}, flow: {}, sender: {}, receiver: {}, syn: {}, " \
@@ -39,15 +76,76 @@ class Packet(object):
             return False
 
 
+class PacketPool(object):
+    """
+    Recycles Packets. FlowEnds get new packets from the pool, and components
+    release them where they end their life: on delivery to a host, when a
+    link drops them, and when a router cannot route them. After that nothing
+    may use the packet, since the pool hands it out again.
+
+    With debug=True the pool catches misuse: released packets are cleared,
+    so that any later use fails, and releasing a packet twice raises a
+    ValueError.
+    """
+
+    def __init__(self, debug=False):
+        self.free = []  # Released packets
+        self.debug = debug
+        self.free_ids = set()  # ids of the packets in free (debug only)
+        self.n_allocated = 0  # Number of Packets created
+        self.n_reused = 0  # Number of packets handed out again
+
+    def get(self, i, flow, sender, receiver, syn_flag, ack_flag, fin_flag,
+            seq_number, ack_number, size, sack=None):
+        """Same arguments as Packet()."""
+        if not self.free:
+            self.n_allocated += 1
+            return Packet(i, flow, sender, receiver, syn_flag, ack_flag,
+                          fin_flag, seq_number, ack_number, size, sack)
+        p = self.free.pop()
+        if self.debug:
+            self.free_ids.remove(id(p))
+        self.n_reused += 1
+        Packet.__init__(p, i, flow, sender, receiver, syn_flag, ack_flag,
+                        fin_flag, seq_number, ack_number, size, sack)
+        return p
+
+    def release(self, p):
+        if self.debug:
+            if id(p) in self.free_ids:
+                raise ValueError('Packet released twice')
+            self.free_ids.add(id(p))
+            p.i = p.flow = p.sender = p.receiver = None
+            p.seq_number = p.ack_number = p.size = p.sack = None
+        self.free.append(p)
+
+    def stats(self):
+        return {'allocated': self.n_allocated, 'reused': self.n_reused,
+                'free': len(self.free)}
+
+
 class LinkStatePacket(object):
-    def __init__(self, i, sender, data):
+    def __init__(self, i, sender, data, seq=0, origin_t=0, prev_hop=None):
         # sender is the node that is sending the neighbor information
         # data is the neighbor information
         self.i = i
         self.sender = sender
         self.data = data
+        # The sender numbers its link states in increasing order, so a
+        # router keeps only the first copy of each, and nothing older.
+        self.seq = seq
+        self.origin_t = origin_t  # When the sender sent it, for its age
+        self.prev_hop = prev_hop  # The router this copy was flooded from
         self.size = 512 #hardcoded
+
+    def age(self, t):
+        return t - self.origin_t
+
+    def forward_copy(self, router):
+        """The copy of this link state that router floods further."""
+        return LinkStatePacket(self.i, self.sender, self.data, self.seq,
+                               self.origin_t, router)
         
     def __str__(self):
-        return "(id: {}, sender: {}, data: {})" \
-            .format(self.i, self.sender.i, self.data)
+        return "(id: {}, sender: {}, seq: {}, data: {})" \
+            .format(self.i, self.sender.i, self.seq, self.data)
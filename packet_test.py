@@ -0,0 +1,32 @@
+from packet import Packet, PacketPool, SYN, ACK, DATA_PACKET_SIZE
+
+p = Packet(1, None, None, None, True, False, False, 0, None, 512)
+assert p.syn_flag and not p.ack_flag and not p.fin_flag
+assert p.flags == SYN
+p.ack_flag = True
+assert p.flags == SYN | ACK
+p.syn_flag = False
+assert p.flags == ACK and p.ack_flag
+
+pool = PacketPool()
+p = pool.get(1, None, None, None, False, True, False, 5, 6, 512, ((8, 9),))
+assert p.sack == ((8, 9),)
+pool.release(p)
+q = pool.get(2, None, None, None, True, False, False, 7, None, 512)
+assert q is p
+assert q.i == 2 and q.flags == SYN and q.seq_number == 7 and q.size == 512
+assert q.sack is None
+assert pool.stats() == {'allocated': 1, 'reused': 1, 'free': 0}
+
+# Debug mode catches use after release and double release
+pool = PacketPool(debug=True)
+p = pool.get(1, None, None, None, False, True, False, 5, 6, DATA_PACKET_SIZE)
+pool.release(p)
+assert p.i is None and p.size is None and p.seq_number is None
+try:
+    pool.release(p)
+    assert False, 'Released twice'
+except ValueError:
+    pass
+assert pool.get(2, None, None, None, False, True, False, 8, 9, 512) is p
+pool.release(p)  # Not a double release any more
@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt
+from log_loader import latest_log, load_log
 import os
 from pathlib import Path
-from plot_util import calc_rate
+from plot_util import calc_rate, calc_totals
 import sys
 
 # TODO: Verify correctness by matching to time traces for Test Case 1
@@ -16,13 +17,7 @@ SUBPLOT_WIDTH = 8
 
 if __name__ == '__main__':
     if(len(sys.argv) == 1):
-        file_names = [f for f in os.listdir('.') if os.path.isfile(f) and f.startswith('log_') and f.endswith('.txt')]
-
-        # Get most recent file name
-        file_name = ''
-        for fn in file_names:
-            if file_name == '' or fn > file_name:
-                file_name = fn
+        file_name = latest_log()
     else:
         file_name = Path(sys.argv[1])
 
@@ -32,19 +27,7 @@ if __name__ == '__main__':
     os.makedirs(plotdir, exist_ok=True)
 
 
-    data = {}
-    with open(file_name) as f:
-        for line in f:
-            if '|' in line:
-                part = line.split('|')
-                if part[0] not in data:
-                    data[part[0]] = {}
-                if part[1] not in data[part[0]]:
-                    data[part[0]][part[1]] = {}
-                if part[4] not in data[part[0]][part[1]]:
-                    data[part[0]][part[1]][part[4]] = []
-                # Record time step for appropriate and specific component
-                data[part[0]][part[1]][part[4]].append((float(part[3]), float(part[5])))
+    data = load_log(file_name)
 
     # Handle host plotting
     host_data = data['HOST']
@@ -99,12 +82,7 @@ if __name__ == '__main__':
         link_flow_data = link_data[link]['FLOW']
 
         ### Per-link buffer occupancy ###
-        x, y = [], []
-        total = 0
-        for time, size in link_buff_data:
-            x.append(float(time))
-            total += float(size)
-            y.append(float(total))
+        x, y = calc_totals(link_buff_data)
         plt.close()
         plt.figure(figsize=(10, 4))
         # plt.subplot(rows, cols, index)
@@ -185,12 +163,7 @@ if __name__ == '__main__':
 
         ### Per-flow window size ###
         if 'WINDOW' in flow_data[flow]:
-            flow_window_data = flow_data[flow]['WINDOW']
-            x, y = [], []
-            total = 0
-            for time, size in flow_window_data:
-                x.append(float(time))
-                y.append(float(size))
+            x, y = flow_data[flow]['WINDOW'].T
 
             plt.subplot(rows, cols, index)
             index += 1
@@ -203,12 +176,7 @@ if __name__ == '__main__':
 
         ### Per-flow round trip delay ###
         if 'RTT' in flow_data[flow]:
-            flow_rtt_data = flow_data[flow]['RTT']
-            x, y = [], []
-            total = 0
-            for time, delay in flow_rtt_data:
-                x.append(float(time))
-                y.append(float(delay))
+            x, y = flow_data[flow]['RTT'].T
 
             plt.subplot(rows, cols, index)
             index += 1
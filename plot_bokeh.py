@@ -1,42 +1,23 @@
 from bokeh.layouts import column
 from bokeh.plotting import figure, gridplot, output_file, save
 from bokeh.models import Span
+from log_loader import latest_log, load_log
 import os
 from pathlib import Path
 from plot_util import calc_rate, calc_totals
 import sys
 
-def load_data(file_name):
-    data = {}
-    with open(file_name) as f:
-        for line in f:
-            if '|' in line:
-                part = line.split('|')
-                if part[0] not in data:
-                    data[part[0]] = {}
-                if part[1] not in data[part[0]]:
-                    data[part[0]][part[1]] = {}
-                if part[4] not in data[part[0]][part[1]]:
-                    data[part[0]][part[1]][part[4]] = []
-                # Record time step for appropriate and specific component
-                data[part[0]][part[1]][part[4]].append((float(part[3]), float(part[5])))
-    return data
-
 
 def main():
     if(len(sys.argv) == 1):
-        file_names = [f for f in os.listdir('.') if os.path.isfile(f) and f.startswith('log_') and f.endswith('.txt')]
-        if not file_names:
-            raise ValueError('No log files')
-        # Get most recent file name
-        file_name = max(file_names)
+        file_name = latest_log()
     else:
         file_name = Path(sys.argv[1])
 
     plotfile = os.path.splitext(file_name)[0] + '_plots.html'
     output_file(plotfile)
 
-    data = load_data(file_name)
+    data = load_log(file_name)
 
     host_data = data['HOST']
     grid = []
@@ -129,10 +110,10 @@ def main():
             y_axis_label='Window size (#pkts)'
         )
         flow_window_data = flow_data[flow]['WINDOW']
-        x, y = zip(*flow_window_data)
+        x, y = flow_window_data.T
         f.step(x, y, color='blue', mode='after', legend='Window')
         if 'SSTHRESH' in flow_data[flow]:
-            x, y = zip(*flow_data[flow]['SSTHRESH'])
+            x, y = flow_data[flow]['SSTHRESH'].T
             f.step(x, y, color='red', mode='after', legend='ssthresh')
         flow_ack_timeout_data = flow_data[flow].get('ACKTIMEOUT', [])
         for t, _ in flow_ack_timeout_data:
@@ -158,7 +139,7 @@ def main():
             x_axis_label='Time (s)',
             y_axis_label='RTT (s)'
         )
-        x, y = zip(*flow_rtt_data)  # transpose
+        x, y = flow_rtt_data.T
         f.step(x, y, mode='after')
         flow_figs.append(f)
 
@@ -1,41 +1,63 @@
-def calc_rate(amounts, nsamples=100):
+import numpy as np
+
+
+def calc_rate(amounts, nsamples=100, mode='bin', window=5, alpha=0.3):
     """
-    Calculate rates as amount/sec. amounts is a list of (time, amount) pairs.
+    Calculate rates as amount/sec. amounts is a list of (time, amount) pairs
+    or an (n, 2) array of them, sorted by time.
     Return x, y, avg.
     - y[i] is the rate at time x[i]
     - avg is the global average rate
+
+    [0, max_time] is split into nsamples bins, and x[i] is the start of bin i.
+    mode chooses how y is computed:
+    - 'bin': total amount in bin i divided by the bin width. Bins without
+      any amount have rate 0.
+    - 'sliding': rate over the window bins ending with bin i.
+    - 'ewma': exponentially weighted moving average of the 'bin' rates,
+      y[i] = alpha * rate[i] + (1 - alpha) * y[i - 1].
     """
-    if not amounts:
-        return [], [], 0
+    amounts = np.asarray(amounts, dtype=float).reshape(-1, 2)
+    if len(amounts) == 0:
+        return np.array([]), np.array([]), 0
+    times, sizes = amounts[:, 0], amounts[:, 1]
 
-    max_time = amounts[-1][0]
+    max_time = times[-1]
+    if max_time <= 0:
+        return np.array([]), np.array([]), 0
     delta = max_time / nsamples
 
-    i = 0  # Current sample index
-    total = 0
-    x = []
-    y = []
-    for time, amount in amounts:
-        if time > i * delta:
-            # Compute rate and shift to new sample
-            x.append(i*delta)
-            y.append(total/delta)
-            total = 0
-            i += 1
-        total += amount
-
-    return x, y, sum(y) / nsamples
+    # Samples at exactly max_time belong to the last bin.
+    bins = np.minimum((times / delta).astype(np.int64), nsamples - 1)
+    totals = np.bincount(bins, weights=sizes, minlength=nsamples)
+    x = np.arange(nsamples) * delta
+    rates = totals / delta
+
+    if mode == 'bin':
+        y = rates
+    elif mode == 'sliding':
+        cumulative = np.concatenate(([0], np.cumsum(totals)))
+        starts = np.maximum(np.arange(nsamples) - window + 1, 0)
+        # Near the start the window is cut off at 0.
+        y = (cumulative[1:] - cumulative[starts]) \
+            / ((np.arange(nsamples) - starts + 1) * delta)
+    elif mode == 'ewma':
+        y = np.empty(nsamples)
+        average = rates[0]
+        for i, rate in enumerate(rates):
+            average = alpha * rate + (1 - alpha) * average
+            y[i] = average
+    else:
+        raise ValueError('Unknown rate mode ' + mode)
+
+    return x, y, totals.sum() / max_time
+
 
 def calc_totals(amounts):
     """
     Calculate cumulative sum.
-    Amounts is a list of (t, amount).
+    Amounts is a list of (t, amount) or an (n, 2) array of them.
     Return x, y, where y[i] is the total at x[i].
     """
-    x, y = [], []
-    total = 0
-    for time, size in amounts:
-        x.append(time)
-        total += float(size)
-        y.append(float(total))
-    return x, y
+    amounts = np.asarray(amounts, dtype=float).reshape(-1, 2)
+    return amounts[:, 0], np.cumsum(amounts[:, 1])
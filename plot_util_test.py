@@ -0,0 +1,26 @@
+import numpy as np
+from plot_util import calc_rate, calc_totals
+
+# 10 bins of 1s. Nothing happens in bins 2-6.
+amounts = [(0.5, 1), (1.0, 2), (1.5, 3), (7.25, 4), (9.0, 5), (10.0, 6)]
+
+x, y, avg = calc_rate(amounts, nsamples=10)
+assert np.allclose(x, range(10))
+assert np.allclose(y, [1, 5, 0, 0, 0, 0, 0, 4, 0, 11])
+assert np.isclose(avg, 21 / 10)
+
+# Arrays work the same as lists of tuples
+x2, y2, avg2 = calc_rate(np.array(amounts), nsamples=10)
+assert np.allclose(x, x2) and np.allclose(y, y2) and avg == avg2
+
+x, y, _ = calc_rate(amounts, nsamples=10, mode='sliding', window=2)
+assert np.allclose(y, [1, 3, 2.5, 0, 0, 0, 0, 2, 2, 5.5])
+
+x, y, _ = calc_rate(amounts, nsamples=10, mode='ewma', alpha=0.5)
+assert np.allclose(y[:3], [1, 3, 1.5])
+
+assert [len(a) for a in calc_rate([])[:2]] == [0, 0]
+
+x, y = calc_totals(amounts)
+assert np.allclose(x, [0.5, 1.0, 1.5, 7.25, 9.0, 10.0])
+assert np.allclose(y, [1, 3, 6, 10, 15, 21])
@@ -1,17 +1,63 @@
-from queue import PriorityQueue
+import heapq
+import itertools
+import zlib
 from host import Host
 from packet import Packet, LinkStatePacket
+from tracing import INFO
+
+INF = float('inf')
+
+# Relative slack within which path costs count as equal for ECMP, for
+# floating point errors in sums of link costs
+ECMP_TOLERANCE = 1e-9
+
+# Link states older than this many seconds are dropped (e.g. after waiting
+# in full buffers), as newer ones from the same sender must be on their way.
+LSP_MAX_AGE = 60
+
+# Per-router link state counters, logged and reset every routing interval
+LSP_COUNTERS = ('LSP_SENT', 'LSP_RECEIVED', 'LSP_DROPPED', 'ROUTE_UPDATES')
 
 
 class Router(object):
-    def __init__(self, event_manager, i, table=None, debug=True):
+    def __init__(self, event_manager, i, table=None, debug=False):
         self.em = event_manager
         self.i = i  # string ID; unique for all components
+        self.index = self.em.new_index('ROUTER')  # Dense int ID
         self.table = table if table != None else {}  # dict of destHost -> nextRouter
         self.links = []  # links that this router can access
-        self.debug = debug
+        self.trace = self.em.tracer.bind('ROUTER', i, force=debug)
+        self.trace_info = self.em.tracer.bind('ROUTER', i, INFO, force=debug)
+        self.pool = self.em.packet_pool
         # network defined as dict (key, value) = (router, [(router, cost, link)])
         self.network = {self: []}
+        # Shortest path tree over network, updated incrementally
+        self.dist = {self: 0}  # Map of node -> distance; not in dist = inf
+        self.parent = {}  # Map of node -> last link on its shortest path
+        self.children = {}  # Map of node -> set of nodes it is parent of
+        self.cost = {}  # Map of link -> cost, for the links in network
+        self.incoming = {}  # Map of node -> set of links into it
+        self.seq = itertools.count()  # Tie breaker for heap entries
+        self.lsp_seq = {}  # Map of router -> seq of its latest link state
+        self.lsp_counts = dict.fromkeys(LSP_COUNTERS, 0)  # This interval
+        self.lsp_totals = dict.fromkeys(LSP_COUNTERS, 0)
+        self.log_name = 'ROUTER|{}'.format(i)  # Component name in the log
+        # Equal-cost multipath: if ecmp, multipath maps each host with
+        # several shortest paths to the first links of those paths, sorted
+        # by id. A flow's packets all take the same one, picked by hashing
+        # the flow (salted per router).
+        self.ecmp = False
+        self.multipath = {}
+        self.first_links = None  # Map of node -> set of first links to it,
+        # kept with multipath (None until it is first computed)
+        self.hash_salt = str(i).encode()
+        # Forwarding tables indexed by Host.index, kept in sync with table
+        # and multipath: fib has the next link to each host (None if there
+        # is no route), multipath_fib the links of multipath (None for
+        # hosts with one shortest path; None altogether if there are none).
+        self.fib = []
+        self.multipath_fib = None
+        self.rebuild_fib()
 
     def __hash__(self):
         return hash(self.i)
@@ -19,131 +65,347 @@ class Router(object):
     def __eq__(self, other):
         return self.i == other.i if isinstance(other, Router) else False
 
-    def __lt__(self, other):
-        return True
-    
-    def __gt__(self, other):
-        return False
-    
     def add_link(self, link):
         self.links.append(link)
-        link_price = link.delay + link.buffer_usage / link.rate
-        self.network[self].append((link.dest, link_price, link))
-        # update table
-        # if contains host then set to host, otherwise copy over new settings
-        if type(link.dest) is Host:
-            self.table[link.dest] = link
-        else:
+        link_price = link.delay \
+            + link.buffer_usage_at(self.em.current_time) / link.rate
+        self.update_network(self, self.network[self]
+                            + [(link.dest, link_price, link)])
+        # Until link states arrive, also route to whatever the neighbor
+        # routes to.
+        if type(link.dest) is not Host:
             for dest in link.dest.table:
-                self.table[dest] = link
-            
+                if dest not in self.dist:
+                    self.table[dest] = link
+            self.rebuild_fib()
+
     def on_reception(self, t, p):
-        if self.debug and type(p) is not LinkStatePacket:
-            print("t={}: {}: {} packet received: {}".
-                  format(round(t, 6), self.i, type(p), p))
         if type(p) is LinkStatePacket:
-            if p.sender in self.network and \
-                            set(p.data) == set(self.network[p.sender]):
-                return 
-            self.network[p.sender] = p.data
-            if self.debug:
-                print("{} changed".format(self.i))
-
-            old = None
-            for i in self.table:
-                if i.i == 'H2':
-                    old = self.table[i]
-            self.update_table()
-            new = None
-            for i in self.table:
-                if i.i == 'H2':
-                    new = self.table[i]
-            if self.debug:
-                print("flip from {}".format(old.i)\
-                    if old is not None and new is not None and old != new else "no flip")
-            
-            try:
-                for nextLink in self.links:
-                    nextLink.on_packet_entry(t, p)
-            except:
-                #silently fail
-                return False
+            self.on_link_state(t, p)
+            return
+        if self.trace:
+            self.trace(t, '{} packet received: {}', type(p), p)
+        nextLink = self.next_hop(p)
+        if nextLink is None:
+            if self.trace_info:
+                self.trace_info(t, 'routing failed, {} not in table',
+                                p.receiver)
+            if self.pool is not None:
+                self.pool.release(p)  # Dropped
+            return
+        # Before forwarding: the link may release p to the packet pool.
+        if self.trace:
+            self.trace(t, 'routed {} to {}', p.i, nextLink.i)
+        nextLink.on_packet_entry(t, p)
+
+    def next_hop(self, p):
+        """The link to forward packet p on, or None if there is no route."""
+        index = p.receiver.index
+        if index >= len(self.fib):
+            return None
+        if self.multipath_fib is not None:
+            paths = self.multipath_fib[index]
+            if paths is not None:
+                return paths[zlib.crc32(self.hash_salt, p.flow.hash)
+                             % len(paths)]
+        return self.fib[index]
+
+    def set_route(self, node, link):
+        """Route to node through link."""
+        self.table[node] = link
+        if type(node) is Host:
+            fib = self.fib
+            if node.index >= len(fib):
+                fib.extend([None] * (node.index + 1 - len(fib)))
+            fib[node.index] = link
+
+    def rebuild_fib(self):
+        """Recompute fib and multipath_fib from table and multipath."""
+        fib = [None] * self.em.n_components.get('HOST', 0)
+        for node, link in self.table.items():
+            if type(node) is Host:
+                fib[node.index] = link
+        self.fib = fib
+        if self.multipath:
+            self.multipath_fib = [None] * len(fib)
+            for host, links in self.multipath.items():
+                self.multipath_fib[host.index] = links
         else:
-            if self.debug:
-                print("route reg packet")
-            try:
-                nextLink = self.table[p.receiver]
-                nextLink.on_packet_entry(t, p)
-            except:
-                if self.debug:
-                    print("routing failed, probably b/c not in table")
-
-            if self.debug:
-                print("routed successfully")
-        
-    def update_table(self):
-        # network defined as dict (k, v) = (router, [(router, cost, link)])
-        
-        if self.debug:
-            print("-------NETWORK-------")
-        comp1 = 0.0
-        comp2 = 0.0
-        for i in self.network:
-            if self.debug:
-                print("node {}".format(i.i))
-            for x in self.network[i]:
-                if x[2].i == 'L1_a' or x[2].i == 'L3_a':
-                    comp1 += x[1]
-                if x[2].i == 'L2_a' or x[2].i == 'L4_a':
-                    comp2 += x[1]
-            if self.debug:
-                print([(x[0].i, x[1]) for x in self.network[i]])
-        if self.debug:
-            print(comp1)
-            print(comp2)
-            print("---------------------")
-        
-        dist = {self: 0}  # not in dist = inf
-        child = {self: []}  # children of certain router
-        vis = {self}
-        pq = PriorityQueue()  # holds (dist, (start, end, link))
-        assert(pq.empty())
-
-        for router in self.network[self]:
-            pq.put((router[1], (self, router[0], router[2])))
-            vis.add(router[0])
-
-        while not pq.empty():
-            top = pq.get()
-            dist[top[1][1]] = top[0]
-            if(top[1][0] in child):
-                child[top[1][0]].append((top[1][1], top[1][2]))
-            else:
-                child[top[1][0]] = [(top[1][1], top[1][2])]
-            if top[1][1] in self.network:
-                for router in self.network[top[1][1]]:
-                    if(type(top[1][1]) is Router and router[0] not in vis):
-                        pq.put((top[0] + router[1],
-                                (top[1][1], router[0], router[2])))
-                        vis.add(router[0])
-
-        #shortest distance information acquired
+            self.multipath_fib = None
+
+    def send_link_state(self, t, costs):
+        """Log and reset the counters of the last interval, then advertise
+        the cost of this router's links, from the map of link -> cost."""
+        for name, count in self.lsp_counts.items():
+            self.em.log_it(self.log_name, name, t, count)
+            self.lsp_totals[name] += count
+            self.lsp_counts[name] = 0
+        data = [(link.dest, costs[link], link) for link in self.links]
+        seq = self.lsp_seq[self] = self.lsp_seq.get(self, -1) + 1
+        if self.update_network(self, data):
+            self.lsp_counts['ROUTE_UPDATES'] += 1
+        self.flood(t, LinkStatePacket('LSP', self, data, seq, t, self))
+
+    def on_link_state(self, t, p):
+        counts = self.lsp_counts
+        counts['LSP_RECEIVED'] += 1
+        # A copy already seen by another path, or an outdated one
+        if p.seq <= self.lsp_seq.get(p.sender, -1) \
+                or p.age(t) > LSP_MAX_AGE:
+            counts['LSP_DROPPED'] += 1
+            return
+        self.lsp_seq[p.sender] = p.seq
+        if self.trace_info:
+            old = {host: link.i for host, link in self.table.items()}
+        if self.update_network(p.sender, p.data):
+            counts['ROUTE_UPDATES'] += 1
+            if self.trace_info:
+                self.trace_info(t, 'link state of {} changed', p.sender.i)
+                for host, link in self.table.items():
+                    if old.get(host) != link.i:
+                        self.trace_info(t, 'route to {} flipped from {} to {}',
+                                        host.i, old.get(host), link.i)
+        self.flood(t, p.forward_copy(self), p.prev_hop)
+
+    def flood(self, t, p, came_from=None):
+        """Send link state p on every link but those back to came_from."""
+        for link in self.links:
+            if link.dest is not came_from:
+                link.on_packet_entry(t, p)
+                self.lsp_counts['LSP_SENT'] += 1
+
+    def update_network(self, sender, data):
         """
-        print("router start {}".format(self.i))
-        for rr in child:
-            print(rr.i, [x[0].i for x in child[rr]])
+        Record sender's link state, a list of (dest, cost, link) for its
+        links, and update the routes. Return whether it changed.
         """
-        seen = set([])
-        
-        def dfs_update(n, base):
-            if n not in child:
-                return
-            for i in child[n]:
-                if i[0] not in seen:
-                    seen.add(i[0])
-                    self.table[i[0]] = base
-                    dfs_update(i[0], base)
-
-        for next_route in child[self]:
-            self.table[next_route[0]] = next_route[1]
-            dfs_update(next_route[0], next_route[1])
+        old = self.network.get(sender)
+        if old is not None and data == old:
+            return False
+        self.network[sender] = data
+        changed = self.update_routes(sender, old or [], data)
+        if self.ecmp:
+            self.update_multipath(changed)
+        return True
+
+    def update_routes(self, sender, old_edges, new_edges):
+        """
+        Update the shortest path tree (dist, parent, children) and table
+        after sender's edges changed from old_edges to new_edges. Return
+        the nodes whose shortest paths may have changed: those whose
+        distance changed, and the ends of the changed edges.
+
+        Only the affected part of the tree is recomputed: the subtrees below
+        edges that got more expensive or went away are invalidated and
+        reattached through their cheapest remaining incoming edges, and
+        edges that got cheaper or appeared are relaxed. Both kinds of
+        candidates go through one Dijkstra pass from the heap.
+        """
+        dist = self.dist
+        new_costs = {link: cost for _, cost, link in new_edges}
+        invalid = set()
+        changed = set()
+        for dest, cost, link in old_edges:
+            new_cost = new_costs.get(link)
+            if new_cost is None:
+                changed.add(dest)
+                del self.cost[link]
+                self.incoming[dest].discard(link)
+            if (new_cost is None or new_cost > cost) \
+                    and self.parent.get(dest) is link:
+                self.invalidate(dest, invalid)
+
+        heap = []
+        for dest, cost, link in new_edges:
+            if self.cost.get(link) != cost:
+                changed.add(dest)
+            self.cost[link] = cost
+            self.incoming.setdefault(dest, set()).add(link)
+            if sender in dist and self.relays(sender) \
+                    and dist[sender] + cost < dist.get(dest, INF):
+                heapq.heappush(heap, (dist[sender] + cost, next(self.seq),
+                                      dest, link))
+        for node in invalid:
+            for link in self.incoming.get(node, ()):
+                u = link.source
+                if u in dist and self.relays(u):
+                    heapq.heappush(heap, (dist[u] + self.cost[link],
+                                          next(self.seq), node, link))
+        changed |= invalid
+        changed |= self.dijkstra(heap)
+        return changed
+
+    def update_multipath(self, nodes=None):
+        """
+        Update multipath after the shortest paths to nodes changed, or
+        recompute it if nodes is None. The first links to a node are those
+        to the nodes it has a shortest path through: in order of distance, a
+        node gets the first links of every u with a link u -> node on a
+        shortest path (or that link, if u is this router). The nodes of
+        nodes and their neighbors are updated, then the neighbors of every
+        node whose first links changed, in turn.
+        """
+        dist = self.dist
+        if nodes is None or self.first_links is None:
+            self.first_links = {}
+            self.multipath = {}
+            self.multipath_fib = None
+            nodes = dist
+        first_links = self.first_links
+        multipath = self.multipath
+        hosts = []  # Hosts whose multipath may have changed
+        heap = []
+        for node in nodes:
+            if node in dist:
+                heap.append((dist[node], next(self.seq), node))
+            elif node in first_links:  # No longer reachable
+                del first_links[node]
+                hosts.append(node)
+            # Its neighbors may have had, or now have, shortest paths
+            # through it, and be closer than it.
+            if self.relays(node):
+                heap.extend((dist[dest], next(self.seq), dest)
+                            for dest, _, _ in self.network[node]
+                            if dest in dist)
+        heapq.heapify(heap)
+        done = set()
+        while heap:
+            d, _, node = heapq.heappop(heap)
+            if node in done or node is self:
+                continue
+            done.add(node)
+            limit = d * (1 + ECMP_TOLERANCE)
+            links = set()
+            for link in self.incoming.get(node, ()):
+                u = link.source
+                if u in dist and self.relays(u) \
+                        and dist[u] + self.cost[link] <= limit:
+                    if u is self:
+                        links.add(link)
+                    else:
+                        links |= first_links[u]
+            if links == first_links.get(node):
+                continue
+            first_links[node] = links
+            if type(node) is Host:
+                hosts.append(node)
+            elif self.relays(node):
+                for dest, cost, _ in self.network[node]:
+                    if dest in dist \
+                            and d + cost <= dist[dest] * (1 + ECMP_TOLERANCE):
+                        heapq.heappush(heap, (dist[dest], next(self.seq),
+                                              dest))
+
+        for host in hosts:
+            links = first_links.get(host, ())
+            if len(links) > 1:
+                multipath[host] = tuple(sorted(links, key=lambda l: l.i))
+            else:
+                multipath.pop(host, None)
+            self.set_multipath_fib(host)
+
+    def set_multipath_fib(self, host):
+        """Update the multipath_fib entry of host from multipath."""
+        if not self.multipath:
+            self.multipath_fib = None
+            return
+        if self.multipath_fib is None:
+            self.multipath_fib = [None] * len(self.fib)
+        fib = self.multipath_fib
+        if host.index >= len(fib):
+            fib.extend([None] * (host.index + 1 - len(fib)))
+        fib[host.index] = self.multipath.get(host)
+
+    def relays(self, node):
+        # Hosts are leaves; only routers forward packets.
+        return type(node) is Router and node in self.network
+
+    def invalidate(self, node, invalid):
+        """Detach the subtree rooted at node from the shortest path tree."""
+        parent_link = self.parent.pop(node)
+        self.children[parent_link.source].discard(node)
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            invalid.add(n)
+            del self.dist[n]
+            for child in self.children.pop(n, ()):
+                del self.parent[child]
+                stack.append(child)
+
+    def dijkstra(self, heap):
+        """Settle the (dist, seq, node, link) candidates in heap, and
+        everything that gets closer through them. Return the settled nodes."""
+        dist = self.dist
+        settled = set()
+        while heap:
+            d, _, node, link = heapq.heappop(heap)
+            if d >= dist.get(node, INF):
+                continue
+            dist[node] = d
+            settled.add(node)
+            u = link.source
+            old_link = self.parent.get(node)
+            if old_link is not None:
+                self.children[old_link.source].discard(node)
+            self.parent[node] = link
+            self.children.setdefault(u, set()).add(node)
+            # Next hop: the first link on the path
+            self.set_route(node, link if u is self else self.table[u])
+            if self.relays(node):
+                for dest, cost, out in self.network[node]:
+                    if d + cost < dist.get(dest, INF):
+                        heapq.heappush(heap, (d + cost, next(self.seq),
+                                              dest, out))
+        return settled
+
+    def rebuild_routes(self):
+        """Recompute the shortest path tree and table from scratch."""
+        self.dist = {self: 0}
+        self.parent = {}
+        self.children = {}
+        heap = [(cost, next(self.seq), dest, link)
+                for dest, cost, link in self.network[self]]
+        heapq.heapify(heap)
+        self.dijkstra(heap)
+        if self.ecmp:
+            self.update_multipath()
+        self.rebuild_fib()
+
+    def shortest_distances(self):
+        """Distances to all reachable nodes, computed from scratch (to check
+        the incremental updates)."""
+        dist = {self: 0}
+        heap = [(0, 0, self)]
+        seq = itertools.count(1)
+        while heap:
+            d, _, node = heapq.heappop(heap)
+            if d > dist[node] or not self.relays(node):
+                continue
+            for dest, cost, link in self.network[node]:
+                if d + cost < dist.get(dest, INF):
+                    dist[dest] = d + cost
+                    heapq.heappush(heap, (d + cost, next(seq), dest))
+        return dist
+
+    def check_routes(self):
+        """Assert that the incremental state is a shortest path tree and that
+        the table (and fib) follows it."""
+        assert self.dist == self.shortest_distances()
+        for node, link in self.table.items():
+            if type(node) is Host:
+                assert self.fib[node.index] is link
+        for node, link in self.parent.items():
+            u = link.source
+            assert self.dist[node] == self.dist[u] + self.cost[link]
+            assert node in self.children[u]
+            assert self.table[node] is (link if u is self else self.table[u])
+        if self.ecmp:
+            multipath, first_links = self.multipath, self.first_links
+            for host in self.table:
+                if type(host) is Host and host.index < len(self.fib):
+                    assert (self.multipath_fib or {host.index: None}) \
+                        [host.index] == multipath.get(host)
+            self.update_multipath()
+            assert self.multipath == multipath
+            assert self.first_links == first_links
@@ -0,0 +1,177 @@
+from io import StringIO
+import random
+import zlib
+from events import EventManager
+from host import Host
+from link import Link
+from packet import Packet, PacketPool
+from router import Router
+from tracing import Tracer, DEBUG
+
+# Random topology: routers with random links between them, and a host on
+# each router. Link state changes are applied to every router, and the
+# incrementally updated routes are checked against a full recomputation.
+rng = random.Random(143)
+em = EventManager(logging=False)
+routers = [Router(em, 'R{}'.format(k)) for k in range(30)]
+links = []
+
+
+def connect(a, b):
+    link = Link(em, 'L{}'.format(len(links)), a, b, 1e7, 1e-3, 1e5)
+    a.add_link(link)
+    links.append(link)
+    return link
+
+
+hosts = []
+for k, router in enumerate(routers):
+    host = Host(em, 'H{}'.format(k))
+    hosts.append(host)
+    connect(host, router)
+    connect(router, host)
+    connect(router, routers[(k + 1) % len(routers)])  # A ring...
+    connect(routers[(k + 1) % len(routers)], router)
+for _ in range(40):  # ...and random chords
+    a, b = rng.sample(routers, 2)
+    connect(a, b)
+
+# Routers also keep their multipaths, from when the first link state arrives
+for router in routers:
+    router.ecmp = True
+
+# Current link state of each router: map of link -> cost
+state = {r: {link: rng.uniform(1, 10) for link in r.links} for r in routers}
+
+
+def advertise(sender):
+    data = [(link.dest, cost, link) for link, cost in state[sender].items()]
+    for router in routers:
+        router.update_network(sender, data)
+
+
+for router in routers:
+    advertise(router)
+for router in routers:
+    router.check_routes()
+    assert len(router.dist) == 2 * len(routers)  # Everything is reachable
+
+n_multipaths = 0
+for step in range(300):
+    sender = rng.choice(routers)
+    link = rng.choice(sender.links)
+    change = rng.random()
+    if change < 0.2 and link in state[sender]:
+        del state[sender][link]  # Link goes down
+    elif change < 0.6:
+        state[sender][link] = rng.uniform(1, 10)
+    else:
+        # Ties: equal costs are common with link delays
+        state[sender][link] = rng.choice([1, 2, 3])
+    advertise(sender)
+    for router in routers:
+        router.check_routes()
+        n_multipaths += len(router.multipath)
+assert n_multipaths > 0
+
+# Following the tables from any router reaches the destination host
+for router in routers:
+    for host in hosts:
+        if host not in router.dist:
+            continue  # Unreachable since links went down
+        node, hops = router, 0
+        while node is not host:
+            node = node.table[host].dest
+            hops += 1
+            assert hops <= len(routers)
+
+# Flooding in a triangle: each link state goes out on both links of its
+# sender, each neighbor forwards it once to the other (not back), and the
+# second copies are dropped by sequence number.
+em = EventManager(logging=False)
+a, b, c = [Router(em, name) for name in 'ABC']
+for u, v in [(a, b), (b, c), (c, a)]:
+    u.add_link(Link(em, 'L' + u.i + v.i, u, v, 1e7, 1e-3, 1e5))
+    v.add_link(Link(em, 'L' + v.i + u.i, v, u, 1e7, 1e-3, 1e5))
+for interval in range(2):
+    for router in [a, b, c]:
+        router.send_link_state(float(interval),
+                               {link: 1 for link in router.links})
+    em.run(stop_when_flows_done=False)
+for router in [a, b, c]:
+    assert set(router.network) == {a, b, c}
+    assert router.lsp_seq == {a: 1, b: 1, c: 1}
+    counts = {name: router.lsp_totals[name] + router.lsp_counts[name]
+              for name in router.lsp_counts}
+    assert counts['LSP_SENT'] == 2 * 4  # 2 own + 2 forwarded, per interval
+    assert counts['LSP_RECEIVED'] == 2 * 4
+    assert counts['LSP_DROPPED'] == 2 * 2
+
+# ECMP in a diamond: S -> {A, B} -> D -> host, all links of cost 1. S has two
+# shortest paths to the host, and spreads flows over both.
+em = EventManager(logging=False)
+s, a, b, d = [Router(em, name) for name in 'SABD']
+host = Host(em, 'H')
+diamond = [(s, a), (s, b), (a, d), (b, d), (d, host)]
+for u, v in diamond:
+    u.add_link(Link(em, 'L' + u.i + v.i, u, v, 1e7, 1e-3, 1e7))
+for router in [s, a, b, d]:
+    router.ecmp = True
+for router in [s, a, b, d]:
+    data = [(link.dest, 1, link) for link in router.links]
+    for other in [s, a, b, d]:
+        other.update_network(router, data)
+assert [link.i for link in s.multipath[host]] == ['LSA', 'LSB']
+assert a.multipath == {} and d.multipath == {}
+
+
+class Receiver(object):
+    def __init__(self):
+        self.flows = set()
+
+    def on_reception(self, t, p):
+        self.flows.add(p.flow)
+
+
+for link in s.links:
+    link.dest = Receiver()  # Records which flows took the link
+
+class FakeFlow(object):
+    def __init__(self, i):
+        self.i = i
+        self.hash = zlib.crc32(i.encode())  # As Flow.hash
+
+
+flows = [FakeFlow('F{}'.format(k)) for k in range(100)]
+for k, flow in enumerate(flows * 2):
+    s.on_reception(0, Packet(k, flow, host, host, False, False, False, k, 0,
+                             8192))
+em.run(stop_when_flows_done=False)
+assert s.links[0].bits_out + s.links[1].bits_out == 200 * 8192
+assert 0.3 < s.links[0].utilization(em.current_time) \
+    / s.links[1].utilization(em.current_time) < 3
+# Each flow stays on one path
+first, second = s.links[0].dest.flows, s.links[1].dest.flows
+assert not first & second and len(first | second) == len(flows)
+
+# No route to a host created after the tables
+stranger = Host(em, 'H_new')
+assert s.next_hop(Packet(0, flows[0], host, stranger, False, False, False, 0,
+                         0, 8192)) is None
+
+# The trace of a forwarded packet is written before the link may release it
+# to the pool, here because the link is down.
+out = StringIO()
+em = EventManager(logging=False, tracer=Tracer(DEBUG, out=out),
+                  packet_pool=PacketPool(debug=True))
+r = Router(em, 'R')
+host = Host(em, 'H')
+link = Link(em, 'LRH', r, host, 1e7, 1e-3, 1e5)
+r.add_link(link)
+r.set_route(host, link)
+link.set_usable(False)
+p = em.packet_pool.get(7, flows[0], host, host, False, False, False, 0, 0,
+                       8192)
+r.on_reception(0, p)
+assert p.i is None  # Released
+assert 'routed 7 to LRH' in out.getvalue()
@@ -0,0 +1,207 @@
+import heapq
+import numpy as np
+from events import Event
+from host import Host
+from router import ECMP_TOLERANCE
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+except ImportError:  # Fall back to a Dijkstra per host in Python
+    dijkstra = None
+
+# Routing modes of RoutingProtocol:
+# - 'link_state': routers flood LinkStatePackets every interval and compute
+#   their own tables from what they receive.
+# - 'oracle': the tables of all routers are computed centrally every
+#   interval from the same link costs, without any packets.
+ROUTING_MODES = ('link_state', 'oracle')
+
+
+# Link cost metrics, functions of a link and the routing interval
+def congestion_cost(link, interval):
+    """The link's delay plus the average time to drain what went through it
+    over the last interval."""
+    return link.delay + (link.interval_usage / interval) / link.rate
+
+
+def queue_cost(link, interval):
+    """The link's delay plus the time to drain its buffer right now."""
+    return link.delay + link.buffer_usage_at(link.em.current_time) / link.rate
+
+
+COST_METRICS = {
+    'congestion': congestion_cost,
+    'queue': queue_cost,
+    'delay': lambda link, interval: link.delay,
+    'hops': lambda link, interval: 1,
+}
+
+
+class RoutingProtocol(object):
+    """
+    Keeps the routers' tables up to date: every interval, measures the cost
+    of every router link and either has the routers flood them as link
+    states or installs routes computed centrally (see ROUTING_MODES).
+
+    To keep routes from flapping between paths of similar costs, measured
+    costs can be smoothed (cost = damping * previous cost + (1 - damping) *
+    measured cost) and only advertised when they differ from the advertised
+    cost by more than the fraction hysteresis of it.
+
+    With ecmp, routers spread flows over all the shortest paths to a host
+    (see Router.multipath).
+    """
+
+    def __init__(self, mode='link_state', interval=5, cost='congestion',
+                 damping=0, hysteresis=0, ecmp=False):
+        if mode not in ROUTING_MODES:
+            raise ValueError('Unknown routing mode ' + mode)
+        if cost not in COST_METRICS:
+            raise ValueError('Unknown link cost metric ' + cost)
+        if not 0 <= damping < 1:
+            raise ValueError('damping must be in [0, 1)')
+        self.em = None
+        self.mode = mode
+        self.interval = interval  # seconds
+        self.cost = cost  # Name of the metric in COST_METRICS
+        self.metric = COST_METRICS[cost]
+        self.damping = damping
+        self.hysteresis = hysteresis
+        self.ecmp = ecmp
+        self.smoothed = {}  # Map of link -> smoothed cost
+        self.advertised = {}  # Map of link -> advertised cost
+
+    def start(self, em):
+        """Schedule the first update (at 0) in em."""
+        self.em = em
+        for router in em.router_list.values():
+            router.ecmp = self.ecmp
+        em.enqueue(RoutingUpdate(0.0, self))
+
+    def link_costs(self, links):
+        """Map of link -> cost to advertise for links. Resets their usage
+        counts for the next interval."""
+        costs = {}
+        for link in links:
+            cost = self.metric(link, self.interval)
+            link.interval_usage = 0
+            if link in self.smoothed:
+                cost = self.damping * self.smoothed[link] \
+                    + (1 - self.damping) * cost
+            self.smoothed[link] = cost
+            advertised = self.advertised.get(link)
+            if advertised is None \
+                    or abs(cost - advertised) > self.hysteresis * advertised:
+                self.advertised[link] = cost
+            costs[link] = self.advertised[link]
+        return costs
+
+    def on_update(self, t):
+        self.em.enqueue(RoutingUpdate(t + self.interval, self))
+        routers = self.em.router_list.values()
+        costs = self.link_costs([link for router in routers
+                                 for link in router.links])
+        if self.mode == 'oracle':
+            install_oracle_routes(routers, costs, ecmp=self.ecmp)
+        else:
+            for router in routers:
+                router.send_link_state(t, costs)
+
+
+class RoutingUpdate(Event):
+    # Every interval of a RoutingProtocol
+    def __init__(self, t, protocol):
+        super().__init__(t)
+        self.protocol = protocol
+
+    def run(self):
+        self.protocol.on_update(self.t)
+
+
+def distances_to_hosts(links, costs, use_scipy=True):
+    """
+    Shortest distances to every host over links (with the given costs),
+    where paths only go through the links' sources, i.e. routers.
+    Return (nodes, hosts, dist) where dist[j, k] is the distance from
+    nodes[k] to hosts[j] (inf if there is no path).
+    """
+    index = {}  # Map of node -> index in nodes
+    for link in links:
+        index.setdefault(link.source, len(index))
+        index.setdefault(link.dest, len(index))
+    nodes = list(index)
+    hosts = [node for node in nodes if type(node) is Host]
+    src = np.array([index[link.source] for link in links], dtype=np.int64)
+    dst = np.array([index[link.dest] for link in links], dtype=np.int64)
+    costs = np.asarray(costs, dtype=float)
+    host_indices = [index[host] for host in hosts]
+
+    if use_scipy and dijkstra is not None:
+        # Keep the cheapest of parallel links: csr_matrix would add them up.
+        keys = src * len(nodes) + dst
+        order = np.lexsort((costs, keys))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = keys[order][1:] != keys[order][:-1]
+        order = order[first]
+        graph = csr_matrix((costs[order], (src[order], dst[order])),
+                           shape=(len(nodes), len(nodes)))
+        # Distances from the hosts in the reversed graph
+        dist = dijkstra(graph.T, directed=True, indices=host_indices)
+        return nodes, hosts, np.atleast_2d(dist)
+
+    incoming = [[] for _ in nodes]  # Per node, (source, cost) of its links
+    for s, d, cost in zip(src.tolist(), dst.tolist(), costs.tolist()):
+        incoming[d].append((s, cost))
+    dist = np.full((len(hosts), len(nodes)), np.inf)
+    for j, h in enumerate(host_indices):
+        to_host = dist[j]
+        to_host[h] = 0
+        heap = [(0, h)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > to_host[node]:
+                continue
+            for s, cost in incoming[node]:
+                if d + cost < to_host[s]:
+                    to_host[s] = d + cost
+                    heapq.heappush(heap, (d + cost, s))
+    return nodes, hosts, dist
+
+
+def install_oracle_routes(routers, costs, use_scipy=True, ecmp=False):
+    """
+    Set every router's next hop to every reachable host to the first link of
+    a shortest path, where costs maps each of the routers' links to its cost.
+    With ecmp, also set the routers' multipath to the first links of all the
+    shortest paths. Return (nodes, hosts, dist) as distances_to_hosts.
+    """
+    routers = list(routers)
+    links = [link for router in routers for link in router.links]
+    costs = [costs[link] for link in links]
+    if not links:
+        return [], [], np.zeros((0, 0))
+    nodes, hosts, dist = distances_to_hosts(links, costs, use_scipy)
+    index = {node: k for k, node in enumerate(nodes)}
+
+    # total[l, j]: distance to hosts[j] when taking links[l] first
+    dst = np.array([index[link.dest] for link in links], dtype=np.int64)
+    total = np.asarray(costs)[:, None] + dist[:, dst].T
+    start = 0
+    for router in routers:
+        end = start + len(router.links)
+        if end > start:
+            best = np.argmin(total[start:end], axis=0)
+            shortest = total[start:end].min(axis=0)
+            for j in np.flatnonzero(np.isfinite(shortest)).tolist():
+                router.table[hosts[j]] = router.links[best[j]]
+            if ecmp:
+                tight = total[start:end] <= shortest * (1 + ECMP_TOLERANCE)
+                router.multipath = {
+                    hosts[j]: tuple(sorted(
+                        (router.links[l] for l in np.flatnonzero(tight[:, j])),
+                        key=lambda link: link.i))
+                    for j in np.flatnonzero(tight.sum(axis=0) > 1).tolist()}
+            router.rebuild_fib()
+        start = end
+    return nodes, hosts, dist
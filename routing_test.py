@@ -0,0 +1,130 @@
+import random
+import numpy as np
+from events import EventManager
+from host import Host
+from link import Link
+from router import Router
+from routing import distances_to_hosts, install_oracle_routes, RoutingProtocol
+
+# Random topology with random link delays, parallel links included. The
+# oracle's routes must give the same distances as the routers' own link state
+# routing, with or without SciPy.
+rng = random.Random(16)
+em = EventManager(logging=False)
+routers = [Router(em, 'R{}'.format(k)) for k in range(20)]
+links = []
+
+
+def connect(a, b):
+    link = Link(em, 'L{}'.format(len(links)), a, b, 1e7,
+                rng.choice([1e-3, 2e-3, rng.uniform(1e-3, 1e-2)]), 1e5)
+    a.add_link(link)
+    links.append(link)
+    return link
+
+
+hosts = []
+for k, router in enumerate(routers):
+    host = Host(em, 'H{}'.format(k))
+    hosts.append(host)
+    connect(host, router)
+    connect(router, host)
+    connect(router, routers[(k + 1) % len(routers)])
+    connect(routers[(k + 1) % len(routers)], router)
+for _ in range(30):
+    a, b = rng.sample(routers, 2)
+    connect(a, b)
+connect(routers[0], routers[1])  # Parallel to the ring link
+
+# Some traffic over the last interval
+for link in links:
+    link.interval_usage = rng.choice([0, rng.uniform(0, 1e7)])
+
+router_links = [link for router in routers for link in router.links]
+cost = RoutingProtocol(interval=5).link_costs(router_links)
+assert all(link.interval_usage == 0 for link in router_links)
+costs = [cost[link] for link in router_links]
+nodes, hosts_found, dist = distances_to_hosts(router_links, costs)
+_, _, dist_python = distances_to_hosts(router_links, costs, use_scipy=False)
+assert set(hosts_found) == set(hosts)
+assert np.allclose(dist, dist_python)
+
+for router in routers:
+    data = [(link.dest, cost, link)
+            for link, cost in zip(router_links, costs) if link.source is router]
+    for other in routers:
+        other.update_network(router, data)
+
+nodes, hosts_found, dist = install_oracle_routes(routers, cost)
+index = {node: k for k, node in enumerate(nodes)}
+for router in routers:
+    for j, host in enumerate(hosts_found):
+        d = dist[j, index[router]]
+        assert np.isclose(d, router.dist[host])
+        # The next hop starts a shortest path
+        link = router.table[host]
+        rest = 0 if link.dest is host else dist[j, index[link.dest]]
+        assert np.isclose(cost[link] + rest, d)
+
+# Following the tables from any router reaches the destination host
+for router in routers:
+    for host in hosts:
+        node, hops = router, 0
+        while node is not host:
+            node = node.table[host].dest
+            hops += 1
+            assert hops <= len(routers)
+
+# With hop counts as costs there are many equal-cost paths; the oracle finds
+# the same ones as the routers.
+hops = {link: 1 for link in router_links}
+for router in routers:
+    router.ecmp = True
+for router in routers:
+    data = [(link.dest, 1, link) for link in router.links]
+    for other in routers:
+        other.update_network(router, data)
+multipath = {router: router.multipath for router in routers}
+assert any(multipath.values())
+install_oracle_routes(routers, hops, ecmp=True)
+for router in routers:
+    assert router.multipath == multipath[router]
+
+# Routers get no route to hosts they cannot reach
+em = EventManager(logging=False)
+r1, r2 = Router(em, 'R1'), Router(em, 'R2')
+h1, h2 = Host(em, 'H1'), Host(em, 'H2')
+r1.add_link(Link(em, 'L1', r1, h1, 1e7, 1e-3, 1e5))
+r2.add_link(Link(em, 'L2', r2, h2, 1e7, 1e-3, 1e5))
+r2.add_link(Link(em, 'L3', r2, r1, 1e7, 1e-3, 1e5))
+for use_scipy in [True, False]:
+    r1.table.clear()
+    r2.table.clear()
+    install_oracle_routes([r1, r2], {link: 1 for link in r1.links + r2.links},
+                          use_scipy)
+    assert set(r1.table) == {h1}
+    assert set(r2.table) == {h1, h2} and r2.table[h1].i == 'L3'
+
+# Damping smooths the measured costs, and hysteresis keeps the advertised
+# cost until the smoothed cost moves away from it by more than 10%.
+link = Link(em, 'L', r1, r2, 1e6, 0, 1e5)
+protocol = RoutingProtocol(interval=1, damping=0.5, hysteresis=0.1)
+advertised = []
+for usage in [1e6, 1e6, 0, 0, 0, 1e6]:
+    link.interval_usage = usage
+    advertised.append(protocol.link_costs([link])[link])
+# Smoothed: 1, 1, 0.5, 0.25, 0.125, 0.5625
+assert advertised == [1, 1, 0.5, 0.25, 0.125, 0.5625]
+protocol = RoutingProtocol(interval=1, hysteresis=0.1)
+advertised = []
+for usage in [1e6, 1.05e6, 0.95e6, 1.2e6, 1.15e6]:
+    link.interval_usage = usage
+    advertised.append(protocol.link_costs([link])[link])
+assert advertised == [1, 1, 1, 1.2, 1.2]
+
+for bad in [{'mode': 'distance_vector'}, {'cost': 'price'}, {'damping': 1}]:
+    try:
+        RoutingProtocol(**bad)
+        assert False
+    except ValueError:
+        pass
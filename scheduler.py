@@ -0,0 +1,245 @@
+from abc import ABC, abstractmethod
+from bisect import insort
+import heapq
+
+
+class Scheduler(ABC):
+    """A scheduler is the future event list of an EventManager. Events are
+    popped in order of time; events with equal times are popped in the order
+    they were pushed (FIFO), so runs are deterministic.
+
+    Entries are [t, seq, event] lists. push returns the entry as a handle,
+    and cancel(handle) blanks out its event. Cancelled ("dead") entries are
+    skipped by pop, and when they make up more than compact_fraction of the
+    queue they are dropped all at once. compact_fraction=None never compacts.
+    """
+
+    # Don't bother compacting fewer dead entries than this
+    COMPACT_MIN = 1024
+
+    def __init__(self, compact_fraction=0.5):
+        self.seq = 0
+        self.compact_fraction = compact_fraction
+
+        # Counters
+        self.n_dead = 0          # Dead entries still queued
+        self.n_cancelled = 0     # Total cancels
+        self.n_dead_popped = 0   # Dead entries discarded by pop
+        self.n_compactions = 0
+        self.n_compacted = 0     # Dead entries discarded by compaction
+        self.peak_size = 0       # Most entries (live or dead) queued at once
+
+    @abstractmethod
+    def push(self, event):
+        """Schedule event at event.t. Return a handle for cancel."""
+        pass
+
+    @abstractmethod
+    def pop(self):
+        """Remove and return the earliest live event"""
+        pass
+
+    @abstractmethod
+    def n_entries(self):
+        """Number of queued entries, live or dead"""
+        pass
+
+    @abstractmethod
+    def compact(self):
+        """Drop all dead entries"""
+        pass
+
+    def cancel(self, handle):
+        """Cancel the event scheduled by the push that returned handle. The
+        event is also invalidated. Cancelling twice, or cancelling an event
+        that has already been popped, is harmless."""
+        event = handle[2]
+        if event is None:
+            return
+        event.invalidate()
+        handle[2] = None
+        self.n_dead += 1
+        self.n_cancelled += 1
+        if self.compact_fraction is not None \
+                and self.n_dead >= self.COMPACT_MIN \
+                and self.n_dead > self.compact_fraction * self.n_entries():
+            self.n_compactions += 1
+            self.n_compacted += self.n_dead
+            self.compact()
+            self.n_dead = 0
+
+    def stats(self):
+        return {
+            'live': len(self),
+            'dead': self.n_dead,
+            'peak_size': self.peak_size,
+            'cancelled': self.n_cancelled,
+            'dead_popped': self.n_dead_popped,
+            'compactions': self.n_compactions,
+            'compacted': self.n_compacted,
+        }
+
+    def __len__(self):
+        """Number of live events"""
+        return self.n_entries() - self.n_dead
+
+
+class HeapScheduler(Scheduler):
+    """Binary heap of [t, seq, event] entries. seq is a monotonically
+    increasing counter, so ties on t are broken by insertion order and events
+    themselves are never compared. Unlike queue.PriorityQueue there is no
+    locking; the simulator is single-threaded."""
+
+    def __init__(self, compact_fraction=0.5):
+        super().__init__(compact_fraction)
+        self.heap = []
+
+    def push(self, event):
+        entry = [event.t, self.seq, event]
+        heapq.heappush(self.heap, entry)
+        self.seq += 1
+        if len(self.heap) > self.peak_size:
+            self.peak_size = len(self.heap)
+        return entry
+
+    def pop(self):
+        while True:
+            entry = heapq.heappop(self.heap)
+            event = entry[2]
+            if event is not None:
+                entry[2] = None  # Cancelling from now on is a no-op
+                return event
+            self.n_dead -= 1
+            self.n_dead_popped += 1
+
+    def n_entries(self):
+        return len(self.heap)
+
+    def compact(self):
+        self.heap = [entry for entry in self.heap if entry[2] is not None]
+        heapq.heapify(self.heap)
+
+
+class CalendarScheduler(Scheduler):
+    """Calendar queue (R. Brown, "Calendar Queues", CACM 1988).
+
+    Events are hashed by time into n_buckets buckets ("days") of the given
+    width; a bucket holds every event whose time falls on that day of any
+    "year" (n_buckets * width seconds), sorted by (t, seq). Dequeue scans from
+    the current day, so when the width matches the typical spacing of events
+    both operations take amortized O(1) time. The calendar doubles or halves
+    its number of buckets as the queue grows or shrinks, re-estimating the
+    width from the events nearest the front of the queue."""
+
+    # Number of events sampled when re-estimating the bucket width
+    WIDTH_SAMPLE = 25
+
+    def __init__(self, n_buckets=2, width=1.0, compact_fraction=0.5):
+        super().__init__(compact_fraction)
+        self.size = 0  # Number of entries, live or dead
+        self._setup(n_buckets, width, 0.0)
+
+    def _setup(self, n_buckets, width, last_t):
+        self.buckets = [[] for _ in range(n_buckets)]
+        self.n_buckets = n_buckets
+        self.width = width
+        self.last_t = last_t  # Time of the last popped event
+        self.day = int(last_t / width)  # Virtual bucket number of last_t
+        self.grow_at = 2 * n_buckets
+        self.shrink_at = n_buckets // 2 - 2
+
+    def push(self, event):
+        t = event.t
+        if t < self.last_t:
+            # Scheduled in the past: restart the scan from there.
+            self.last_t = t
+            self.day = int(t / self.width)
+        entry = [t, self.seq, event]
+        insort(self.buckets[int(t / self.width) % self.n_buckets], entry)
+        self.seq += 1
+        self.size += 1
+        if self.size > self.peak_size:
+            self.peak_size = self.size
+        if self.size > self.grow_at:
+            self._resize(2 * self.n_buckets)
+        return entry
+
+    def pop(self):
+        while True:
+            if not self.size:
+                raise IndexError('pop from empty scheduler')
+            entry = self._pop_entry()
+            event = entry[2]
+            self.size -= 1
+            if self.size < self.shrink_at:
+                self._resize(self.n_buckets // 2)
+            if event is not None:
+                entry[2] = None  # Cancelling from now on is a no-op
+                return event
+            self.n_dead -= 1
+            self.n_dead_popped += 1
+
+    def _pop_entry(self):
+        width = self.width
+        day = self.day
+        buckets = self.buckets
+        n_buckets = self.n_buckets
+        i = day % n_buckets
+        for _ in range(n_buckets):
+            bucket = buckets[i]
+            if bucket and int(bucket[0][0] / width) <= day:
+                self.day = day
+                entry = bucket.pop(0)
+                self.last_t = entry[0]
+                return entry
+            day += 1
+            i += 1
+            if i == n_buckets:
+                i = 0
+
+        # A whole year without an event: jump straight to the earliest one.
+        bucket = min((b for b in buckets if b), key=lambda b: b[0])
+        entry = bucket.pop(0)
+        self.last_t = entry[0]
+        self.day = int(entry[0] / width)
+        return entry
+
+    def _resize(self, n_buckets):
+        entries = [entry for bucket in self.buckets for entry in bucket]
+        self._setup(max(n_buckets, 2), self._estimate_width(entries),
+                    self.last_t)
+        for entry in sorted(entries):
+            # Sorted input, so appending keeps every bucket sorted.
+            self.buckets[int(entry[0] / self.width) % self.n_buckets] \
+                .append(entry)
+
+    def _estimate_width(self, entries):
+        """Three times the average separation of the earliest events,
+        ignoring separations more than twice the average."""
+        times = sorted(entry[0] for entry in
+                       heapq.nsmallest(self.WIDTH_SAMPLE, entries))
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        if not gaps:
+            return self.width
+        average = sum(gaps) / len(gaps)
+        gaps = [g for g in gaps if g <= 2 * average]
+        average = sum(gaps) / len(gaps)
+        if average <= 0:
+            return self.width
+        return 3 * average
+
+    def n_entries(self):
+        return self.size
+
+    def compact(self):
+        for i, bucket in enumerate(self.buckets):
+            self.buckets[i] = [entry for entry in bucket
+                               if entry[2] is not None]
+        self.size -= self.n_dead
+
+
+# Schedulers selectable by name, e.g. EventManager(scheduler='calendar')
+SCHEDULERS = {
+    'heap': HeapScheduler,
+    'calendar': CalendarScheduler,
+}
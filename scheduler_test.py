@@ -0,0 +1,81 @@
+from events import Event, EventManager
+import random
+from scheduler import HeapScheduler, CalendarScheduler
+
+
+class RecordingEvent(Event):
+    def __init__(self, t, name, record):
+        super().__init__(t)
+        self.name = name
+        self.record = record
+
+    def run(self):
+        self.record.append((self.t, self.name))
+
+
+def fifo_test(scheduler):
+    # Events with equal times run in the order they were enqueued.
+    record = []
+    em = EventManager(logging=False, scheduler=scheduler)
+    for name, t in [('a', 2), ('b', 1), ('c', 2), ('d', 1), ('e', 0),
+                    ('f', 2)]:
+        em.enqueue(RecordingEvent(t, name, record))
+    em.run(stop_when_flows_done=False)
+    assert record == [(0, 'e'), (1, 'b'), (1, 'd'), (2, 'a'), (2, 'c'),
+                      (2, 'f')], record
+    assert em.n_events == 6
+
+
+def random_order_test(scheduler):
+    # Pops come out sorted by (time, insertion order) while the queue grows,
+    # shrinks and is refilled with earlier and later times.
+    rng = random.Random(143)
+    expect = []
+    popped = []
+    seq = 0
+    now = 0
+    for _ in range(20):
+        for _ in range(rng.randrange(1, 500)):
+            # Coarse times so that there are many ties
+            t = now + round(rng.expovariate(10), 2)
+            scheduler.push(RecordingEvent(t, seq, None))
+            expect.append((t, seq))
+            seq += 1
+        for _ in range(rng.randrange(len(scheduler) + 1)):
+            ev = scheduler.pop()
+            popped.append((ev.t, ev.name))
+            now = ev.t
+    while scheduler:
+        ev = scheduler.pop()
+        popped.append((ev.t, ev.name))
+    assert popped == sorted(expect)
+
+
+def cancel_test(scheduler):
+    # Cancelled events are never popped, and are compacted away once they
+    # are the majority of the queue.
+    events = [RecordingEvent(t / 10, t, None) for t in range(3000)]
+    handles = [scheduler.push(ev) for ev in events]
+    for t, handle in enumerate(handles):
+        if t % 3:
+            scheduler.cancel(handle)
+    scheduler.cancel(handles[1])  # Cancelling twice is harmless
+    assert len(scheduler) == 1000
+    assert not events[1].is_valid()
+    assert scheduler.n_cancelled == 2000
+    assert scheduler.n_compactions == 1
+    popped = []
+    while scheduler:
+        popped.append(scheduler.pop().name)
+    assert popped == list(range(0, 3000, 3))
+    assert scheduler.n_compacted + scheduler.n_dead_popped \
+        + scheduler.n_dead == 2000
+
+
+for scheduler in [HeapScheduler, CalendarScheduler]:
+    print('FIFO test for {}'.format(scheduler.__name__))
+    fifo_test(scheduler())
+    print('Random order test for {}'.format(scheduler.__name__))
+    random_order_test(scheduler())
+    print('Cancel test for {}'.format(scheduler.__name__))
+    cancel_test(scheduler())
@@ -1,19 +1,71 @@
 import argparse
 from events import EventManager
 from file_input import read_network
+from link import LINK_ENGINES
+from logger import LOGGERS
+from packet import PacketPool
+from router import LSP_COUNTERS
+from routing import ROUTING_MODES
+from scheduler import SCHEDULERS
+from tracing import LEVELS, Tracer
 from io import StringIO
 from contextlib import redirect_stdout
 
 parser = argparse.ArgumentParser(description='Run network simulation.')
 parser.add_argument('input_file', type=str, help='JSON input file for network')
-parser.add_argument('--debug', action='store_true', help='Enable debug output')
+parser.add_argument('--debug', action='store_true',
+                    help='Trace everything, same as --trace debug')
+parser.add_argument('--trace', choices=list(LEVELS), default='off',
+                    help='Trace level: info for losses, timeouts and routing '
+                         'changes, debug for every packet')
+parser.add_argument('--trace-category', nargs='+', metavar='CATEGORY',
+                    help='Only trace these kinds of components, e.g. LINK FLOW')
+parser.add_argument('--trace-component', nargs='+', metavar='ID',
+                    help='Only trace these components, e.g. L1_a F1SRC')
+parser.add_argument('--scheduler', choices=list(SCHEDULERS), default='heap',
+                    help='Event scheduler backend')
+parser.add_argument('--log-format', choices=list(LOGGERS), default='text',
+                    help='Log file format; convert binary logs to text '
+                         'with logger.py')
+parser.add_argument('--aggregate', type=float, metavar='SECONDS',
+                    help='Log per-metric aggregates over bins of this width '
+                         'instead of every record')
+parser.add_argument('--packet-pool', choices=['off', 'on', 'debug'],
+                    default='off',
+                    help='Recycle packets; debug also checks that released '
+                         'packets are not used')
+parser.add_argument('--link-engine', choices=list(LINK_ENGINES),
+                    default='events',
+                    help='Link implementation, unless a link sets "engine"')
+parser.add_argument('--routing', choices=ROUTING_MODES, default='link_state',
+                    help='link_state floods link states between routers, '
+                         'oracle computes all routing tables centrally; the '
+                         'input file\'s "routing" mode overrides it')
+parser.add_argument('--link-utilization', action='store_true',
+                    help='Print the fraction of capacity each link used')
 args = parser.parse_args()
 
 if __name__ == '__main__':
-    em = EventManager()
-    read_network(args.input_file, em, args.debug)
+    tracer = Tracer(LEVELS['debug' if args.debug else args.trace],
+                    args.trace_category, args.trace_component)
+    pool = None if args.packet_pool == 'off' \
+        else PacketPool(debug=args.packet_pool == 'debug')
+    em = EventManager(scheduler=args.scheduler, log_format=args.log_format,
+                      aggregate=args.aggregate, tracer=tracer,
+                      packet_pool=pool)
+    _, _, links, _ = read_network(args.input_file, em,
+                                  link_engine=args.link_engine,
+                                  routing=args.routing)
 
     em.run()
 
     print(em.current_time)
-
+    if em.router_list and em.routing.mode == 'link_state':
+        totals = {name: sum(r.lsp_totals[name] + r.lsp_counts[name]
+                            for r in em.router_list.values())
+                  for name in LSP_COUNTERS}
+        print(', '.join('{} {}'.format(name, count)
+                        for name, count in totals.items()))
+    if args.link_utilization:
+        for i, link in sorted(links.items()):
+            print('{:>12} {:.3f}'.format(i, link.utilization(em.current_time)))
@@ -0,0 +1,51 @@
+import sys
+
+# Trace levels. INFO is for rare events (losses, timeouts, routing changes),
+# DEBUG for everything that happens per packet.
+OFF, INFO, DEBUG = 0, 1, 2
+LEVELS = {'off': OFF, 'info': INFO, 'debug': DEBUG}
+
+
+class Tracer(object):
+    """
+    Decides which components print debug traces. Components ask for their
+    trace functions once, when they are constructed, e.g.
+        self.trace = em.tracer.bind('LINK', 'L1_a')
+    and guard each trace with
+        if self.trace:
+            self.trace(t, 'lost packet {}', p)
+    so that a disabled trace costs a single attribute test. The message is
+    only formatted if the trace is enabled.
+
+    categories and components are collections of names to trace (e.g.
+    {'FLOW'} and {'F1SRC', 'L1_a'}); None means all of them.
+    """
+
+    def __init__(self, level=OFF, categories=None, components=None,
+                 out=None):
+        self.level = level
+        self.categories = None if categories is None else set(categories)
+        self.components = None if components is None else set(components)
+        self.out = out  # File to print to; None means sys.stdout
+
+    def enabled(self, category, component, level=DEBUG):
+        return level <= self.level \
+            and (self.categories is None or category in self.categories) \
+            and (self.components is None or component in self.components)
+
+    def bind(self, category, component, level=DEBUG, force=False):
+        """
+        Return the trace function of a component for one level, or None if
+        that is filtered out. force enables it regardless of the filters,
+        for components constructed with debug=True.
+        """
+        if not (force or self.enabled(category, component, level)):
+            return None
+        prefix = '{} {}:'.format(category, component)
+
+        def trace(t, message, *args):
+            if args:
+                message = message.format(*args)
+            print('t={}:'.format(round(t, 6)), prefix, message,
+                  file=self.out or sys.stdout)
+        return trace
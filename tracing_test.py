@@ -0,0 +1,27 @@
+import io
+from tracing import Tracer, OFF, INFO, DEBUG
+
+# Nothing is traced by default
+tracer = Tracer()
+assert tracer.bind('LINK', 'L1_a') is None
+assert tracer.bind('LINK', 'L1_a', INFO) is None
+assert tracer.bind('LINK', 'L1_a', force=True) is not None
+
+out = io.StringIO()
+tracer = Tracer(INFO, categories=['LINK'], components=['L1_a'], out=out)
+assert tracer.bind('LINK', 'L1_a', DEBUG) is None  # Level too high
+assert tracer.bind('LINK', 'L1_b', INFO) is None  # Other component
+assert tracer.bind('FLOW', 'L1_a', INFO) is None  # Other category
+
+trace = tracer.bind('LINK', 'L1_a', INFO)
+trace(1.23456789, 'lost packet {} of {}', 7, 'F1')
+trace(2, 'no {} formatting without args')
+assert out.getvalue().splitlines() == [
+    't=1.234568: LINK L1_a: lost packet 7 of F1',
+    't=2: LINK L1_a: no {} formatting without args',
+]
+
+# No filters means everything
+tracer = Tracer(DEBUG)
+assert tracer.enabled('ROUTER', 'R1') and tracer.enabled('FLOW', 'F1SRC', INFO)
+assert not Tracer(OFF).enabled('ROUTER', 'R1', INFO)